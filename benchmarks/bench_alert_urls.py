@@ -0,0 +1,73 @@
+"""Measure how long the setup wizard takes to get the URLs of the alert
+sources for different numbers of sources.
+
+Compares the old loop, a connection and a GetInputSettings request for every
+source, against ObsAlertSources.get_source_urls, which uses one connection
+with one batch.  Runs against the fake obs-websocket server on a free port,
+so OBS can be left running.
+
+    python benchmarks/bench_alert_urls.py [--latency SECONDS] [--runs N]
+"""
+import argparse
+import json
+import statistics
+import time
+from fake_obs import FakeObs, start_in_thread
+from obs_sd_controls.config_mgmt import ObsAlertSources
+from obs_sd_controls.obs_controls import get_source_settings
+
+PASSWORD = 'benchmark'
+
+
+def per_source(sources, port):
+    """The wizard's loop as it was, one connection per source"""
+    return dict([(source, get_source_settings(source, PASSWORD,
+                                              port=port)['url'])
+                 for source in sources])
+
+
+def batched(sources, port):
+    """The wizard's fetch now, one connection and one batch"""
+    return ObsAlertSources.get_source_urls(sources, PASSWORD, 'localhost',
+                                           port)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latency', type=float, default=0.002,
+                        help='Delay added to every message from the fake '
+                             'server, in seconds')
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+    fake = FakeObs(password=PASSWORD, latency=args.latency)
+    start_in_thread(fake, 0)
+    for count in (1, 5, 20):
+        source_urls = dict()
+        for idx in range(count):
+            name = f"alert_{count}_{idx}"
+            url = f"http://localhost/{name}"
+            fake.add_browser_source(name, url)
+            source_urls[name] = url
+        sources = tuple(source_urls)
+        for func in (per_source, batched):
+            connections = fake.connection_count
+            messages = fake.message_count
+            times = []
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                result = func(sources, fake.port)
+                times.append((time.perf_counter() - start) * 1000)
+                if result != source_urls:
+                    raise RuntimeError(f"{func.__name__} got the wrong URLs")
+            print(json.dumps({
+                'benchmark': 'alert_urls', 'method': func.__name__,
+                'sources': count, 'latency_s': args.latency,
+                'median_ms': round(statistics.median(times), 2),
+                'max_ms': round(max(times), 2),
+                'connections': (fake.connection_count - connections) //
+                args.runs,
+                'messages': (fake.message_count - messages) // args.runs}))
+
+
+if __name__ == '__main__':
+    main()
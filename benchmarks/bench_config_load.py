@@ -0,0 +1,123 @@
+"""Compare loading the settings from the config file (cold) with loading them
+from the settings cache next to it (warm).
+
+Each is timed in process, and in a fresh interpreter the way the Stream Deck
+runs obs-streamdeck-ctl, so the cost of importing configparser is included.
+A throwaway config is used, your own config is not touched.
+
+    python benchmarks/bench_config_load.py [--runs N]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+CONFIG = """[obs]
+ws_password = secret
+mic_source = Mic/Aux
+desktop_source = Desktop Audio
+alert_sources = alerts:chat
+
+[obs_browser_sources]
+alerts = http://localhost/alerts
+chat = http://localhost/chat
+
+[twitch]
+channel = tester
+oauth_token = abc
+
+[start_stop_safety]
+enabled = True
+method = FOLLOWER
+follow_time = 10m
+emote_mode = False
+
+[live_safety]
+enabled = True
+method = SUBSCRIBER
+emote_mode = True
+
+[additional]
+advert = False
+clear_chat = True
+"""
+# Run in a fresh interpreter, printing how long load_settings() took
+CHILD = """import time
+start = time.perf_counter()
+from obs_sd_controls.config_file import load_settings
+load_settings()
+print(time.perf_counter() - start)
+"""
+
+
+def in_process(cache_file, warm, runs):
+    """Time load_settings() in this interpreter
+
+    :return: The time taken for each run, in seconds
+    :rtype: list
+    """
+    from obs_sd_controls.config_file import load_settings
+    load_settings()
+    times = []
+    for _ in range(runs):
+        if not warm:
+            os.unlink(cache_file)
+        start = time.perf_counter()
+        load_settings()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def fresh_process(cache_file, warm, runs, env):
+    """Time importing config_file and calling load_settings() in a fresh
+    interpreter
+
+    :return: The time taken for each run, in seconds
+    :rtype: list
+    """
+    times = []
+    for _ in range(runs):
+        if not warm and os.path.exists(cache_file):
+            os.unlink(cache_file)
+        result = subprocess.run([sys.executable, '-c', CHILD], env=env,
+                                capture_output=True, text=True, check=True)
+        times.append(float(result.stdout))
+    return times
+
+
+def report(mode, times):
+    print(json.dumps({'mode': mode, 'runs': len(times),
+                      'median_us': round(statistics.median(times) * 1e6, 1),
+                      'min_us': round(min(times) * 1e6, 1),
+                      'max_us': round(max(times) * 1e6, 1)}), flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=200)
+    parser.add_argument('--process-runs', type=int, default=20)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        config_dir = os.path.join(tmp, 'obs-streamdeck-ctl')
+        os.makedirs(config_dir)
+        config_file = os.path.join(config_dir, 'obs-streamdeck.ini')
+        with open(config_file, 'w') as f:
+            f.write(CONFIG)
+        cache_file = f"{config_file}.cache"
+        # appdirs reads this on Linux, point it at the throwaway config
+        os.environ['XDG_CONFIG_HOME'] = tmp
+        env = dict(os.environ)
+        report('cold', in_process(cache_file, False, args.runs))
+        report('warm', in_process(cache_file, True, args.runs))
+        report('cold_process', fresh_process(cache_file, False,
+                                             args.process_runs, env))
+        report('warm_process', fresh_process(cache_file, True,
+                                             args.process_runs, env))
+
+
+if __name__ == '__main__':
+    main()
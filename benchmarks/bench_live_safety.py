@@ -0,0 +1,72 @@
+"""Measure the OBS half of live_safety for different numbers of alert sources.
+
+Compares the old approach, a GetInputSettings and a SetInputSettings
+connection for every source, against toggle_browser_sources, which uses one
+connection with one batch to read and one batch to write.  Runs against the
+fake obs-websocket server on a free port, so OBS can be left running.
+
+    python benchmarks/bench_live_safety.py [--latency SECONDS] [--runs N]
+"""
+import argparse
+import json
+import statistics
+import time
+from fake_obs import FakeObs, start_in_thread
+from obs_sd_controls.obs_controls import get_source_settings, \
+    set_source_settings, toggle_browser_sources, DISABLED_URL
+
+PASSWORD = 'benchmark'
+
+
+def per_source(source_urls, port):
+    """The live_safety toggle as it was, one connection per request"""
+    for source, url in source_urls.items():
+        settings = get_source_settings(source, PASSWORD, port=port)
+        if settings['url'] == DISABLED_URL:
+            settings['url'] = url
+        else:
+            settings['url'] = DISABLED_URL
+        set_source_settings(source, settings, PASSWORD, port=port)
+
+
+def batched(source_urls, port):
+    """The live_safety toggle with one connection and two batches"""
+    toggle_browser_sources(source_urls, PASSWORD, port=port)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latency', type=float, default=0.002,
+                        help='Delay added to every message from the fake '
+                             'server, in seconds')
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+    fake = FakeObs(password=PASSWORD, latency=args.latency)
+    start_in_thread(fake, 0)
+    for count in (1, 5, 20):
+        source_urls = dict()
+        for idx in range(count):
+            name = f"alert_{count}_{idx}"
+            url = f"http://localhost/{name}"
+            fake.add_browser_source(name, url)
+            source_urls[name] = url
+        for func in (per_source, batched):
+            connections = fake.connection_count
+            messages = fake.message_count
+            times = []
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                func(source_urls, fake.port)
+                times.append((time.perf_counter() - start) * 1000)
+            print(json.dumps({
+                'benchmark': 'live_safety_obs', 'method': func.__name__,
+                'sources': count, 'latency_s': args.latency,
+                'median_ms': round(statistics.median(times), 2),
+                'max_ms': round(max(times), 2),
+                'connections': (fake.connection_count - connections) //
+                args.runs,
+                'messages': (fake.message_count - messages) // args.runs}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+"""Measure time-to-lockdown and the messages sent for each chat safety
+configuration, against fake_twitch.py.
+
+For every configuration the chat is locked down and released in turn, both
+with a new bot connection per press, the way the command line does it without
+the daemon, and over the daemon's persistent chat session.  The time is
+measured from the button press to the fake server's chat modes reaching the
+requested state, and for live safety with clear_chat, chat being cleared.
+
+    python benchmarks/bench_safety_bots.py [--runs N] [--latency SECONDS]
+        [--jitter SECONDS] [--only NAME]
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import threading
+import time
+from fake_twitch import FakeTwitch, DEFAULT_ROOM_TAGS, follow_minutes, \
+    start_in_thread
+from obs_sd_controls.twitch_controls import TwitchSafetyBot, \
+    TwitchLiveSafetyBot, TwitchChatSession, safety_commands, live_commands
+
+CHANNEL = 'tester'
+TOKEN = 'abc'
+FOLLOW_TIME = '10m'
+# The safety settings for each configuration, the live ones run
+# TwitchLiveSafetyBot as live_safety does, the others TwitchSafetyBot as
+# start_stop does
+CONFIGS = [
+    ('subscribers', dict(emote_mode=False, method='SUBSCRIBER')),
+    ('subscribers_emote', dict(emote_mode=True, method='SUBSCRIBER')),
+    ('followers', dict(emote_mode=False, method='FOLLOWER')),
+    ('followers_emote', dict(emote_mode=True, method='FOLLOWER')),
+    ('live_followers_emote_clear', dict(emote_mode=True, method='FOLLOWER',
+                                        clear_chat=True)),
+    ('live_subscribers_advert_clear', dict(emote_mode=False,
+                                           method='SUBSCRIBER', advert=True,
+                                           clear_chat=True)),
+]
+
+
+def make_config(config):
+    """Fill in the safety settings left out of a configuration"""
+    settings = dict(enabled=True, emote_mode=False, method='',
+                    follow_time=FOLLOW_TIME, advert=False, clear_chat=False)
+    settings.update(config)
+    return settings
+
+
+def reached(fake, settings, engage, commands_before):
+    """Make the predicate for the fake server reaching the requested state
+
+    :param engage: True to wait for lockdown, False for release
+    :type engage: bool
+    :param commands_before: The number of commands the fake had received
+        before the press, so only a /clear from this press counts
+    :type commands_before: int
+    :rtype: function
+    """
+    channel = f"#{CHANNEL}"
+    followers = str(follow_minutes(settings['follow_time']))
+
+    def check():
+        tags = fake.room_tags.get(channel, DEFAULT_ROOM_TAGS)
+        if not engage:
+            return tags['emote-only'] == '0' and \
+                tags['followers-only'] == '-1' and tags['subs-only'] == '0'
+        if settings['emote_mode'] and tags['emote-only'] != '1':
+            return False
+        if settings['method'] == 'FOLLOWER' and \
+                tags['followers-only'] != followers:
+            return False
+        if settings['method'] == 'SUBSCRIBER' and tags['subs-only'] != '1':
+            return False
+        if settings['clear_chat']:
+            return '/clear' in [x[2] for x in
+                                fake.commands[commands_before:]]
+        return True
+
+    return check
+
+
+def wait_for(fake, loop, predicate, timeout=10):
+    asyncio.run_coroutine_threadsafe(
+        asyncio.wait_for(fake.wait_for(predicate), timeout), loop).result()
+
+
+def run_bot(bot):
+    try:
+        bot.start()
+    except SystemExit:
+        # The bot exits once it's sent its commands
+        pass
+
+
+def one_shot(fake, loop, name, settings, engage):
+    """Lock down or release chat with a new bot
+
+    :return: The time taken, in seconds
+    :rtype: float
+    """
+    predicate = reached(fake, settings, engage, len(fake.commands))
+    start = time.perf_counter()
+    common = (CHANNEL, TOKEN, settings['enabled'], settings['emote_mode'],
+              settings['method'], settings['follow_time'])
+    if name.startswith('live_'):
+        bot = TwitchLiveSafetyBot(*common, settings['advert'],
+                                  settings['clear_chat'], engage,
+                                  'localhost', fake.port)
+    else:
+        bot = TwitchSafetyBot(*common, engage, 'localhost', fake.port)
+    thread = threading.Thread(target=run_bot, args=(bot, ), daemon=True)
+    thread.start()
+    wait_for(fake, loop, predicate)
+    elapsed = time.perf_counter() - start
+    thread.join(10)
+    return elapsed
+
+
+def persistent(fake, loop, session, name, settings, engage):
+    """Lock down or release chat over the persistent chat session
+
+    :return: The time taken, in seconds
+    :rtype: float
+    """
+    predicate = reached(fake, settings, engage, len(fake.commands))
+
+    def chat_commands(room_state):
+        commands = safety_commands(room_state, settings['enabled'],
+                                   settings['emote_mode'], settings['method'],
+                                   settings['follow_time'], engage)
+        if name.startswith('live_'):
+            commands = live_commands(room_state, settings['enabled'],
+                                     settings['advert'],
+                                     settings['clear_chat'], engage) + \
+                commands
+        return commands
+
+    start = time.perf_counter()
+    session.update_chat(chat_commands)
+    wait_for(fake, loop, predicate)
+    return time.perf_counter() - start
+
+
+def settle(fake, timeout=1):
+    """Wait for the fake server to catch up with anything still on its way,
+    like a bot's QUIT
+    """
+    deadline = time.monotonic() + timeout
+    count = fake.message_count
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        if fake.message_count == count:
+            return
+        count = fake.message_count
+
+
+def report(name, mode, action, times, counts, **extra):
+    result = {'config': name, 'mode': mode, 'action': action,
+              'runs': len(times),
+              'median_ms': round(statistics.median(times) * 1000, 2),
+              'min_ms': round(min(times) * 1000, 2),
+              'max_ms': round(max(times) * 1000, 2)}
+    # Everything the fake server received for each press, including the
+    # logging in and out of the one shot bots
+    for key, values in zip(('connections', 'messages', 'commands'),
+                           zip(*counts)):
+        result[f"{key}_per_press"] = round(statistics.mean(values), 2)
+    result.update(extra)
+    print(json.dumps(result), flush=True)
+
+
+def counters(fake):
+    return fake.connection_count, fake.message_count, len(fake.commands)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5,
+                        help='Times to lock down and release chat for each '
+                             'configuration')
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='Delay added by the fake server to every '
+                             'message it sends, in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--only', action='append', default=[],
+                        metavar='NAME',
+                        help='Only run the configurations with this name')
+    args = parser.parse_args()
+
+    fake = FakeTwitch(token=TOKEN, latency=args.latency, jitter=args.jitter)
+    loop = start_in_thread(fake, 0)
+    extra = dict(latency=args.latency, jitter=args.jitter)
+    for name, config in CONFIGS:
+        if args.only and name not in args.only:
+            continue
+        settings = make_config(config)
+        for mode in ('one_shot', 'persistent'):
+            # Start every configuration with chat open
+            fake.room_tags.pop(f"#{CHANNEL}", None)
+            session = None
+            if mode == 'persistent':
+                session = TwitchChatSession(CHANNEL, TOKEN, 'localhost',
+                                            fake.port)
+                session.start_background()
+                if not session.joined.wait(10):
+                    raise TimeoutError('Could not join the fake Twitch chat')
+            settle(fake)
+            times = dict([(True, []), (False, [])])
+            counts = dict([(True, []), (False, [])])
+            for _ in range(args.runs):
+                # Lock down from open chat, then release it again
+                for engage in (True, False):
+                    before = counters(fake)
+                    if mode == 'one_shot':
+                        elapsed = one_shot(fake, loop, name, settings, engage)
+                    else:
+                        elapsed = persistent(fake, loop, session, name,
+                                             settings, engage)
+                    times[engage].append(elapsed)
+                    settle(fake)
+                    counts[engage].append([y - x for x, y
+                                           in zip(before, counters(fake))])
+            if session:
+                session.stop()
+            for engage in (True, False):
+                report(name, mode, 'lockdown' if engage else 'release',
+                       times[engage], counts[engage], **extra)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Measure the setup wizard working out which sources to list, for OBS
+profiles with hundreds of inputs.
+
+Compares the old way, where the audio page listed every input and the alert
+page checked each of them against a tuple of the alert sources already
+chosen, against building a SourceInventory once and filling both pages from
+its audio and browser source views.  Only the filtering is timed, not
+filling the Listboxes or asking OBS which inputs have audio, so it runs
+without a display or OBS.
+
+    python benchmarks/bench_source_inventory.py [--runs N]
+"""
+import argparse
+import json
+import statistics
+import time
+from obs_sd_controls.obs_controls import SourceInventory
+
+# A mix of input kinds like a busy OBS profile, mostly video and browser
+# sources with a few for audio
+KINDS = ('pulse_input_capture', 'pulse_output_capture', 'browser_source',
+         'browser_source', 'browser_source', 'v4l2_input', 'image_source',
+         'ffmpeg_source', 'text_ft2_source_v2', 'color_source_v3')
+# The kinds above that OBS would say have audio
+AUDIO_KINDS = {'pulse_input_capture', 'pulse_output_capture',
+               'browser_source', 'ffmpeg_source'}
+
+
+def make_inputs(count):
+    """A GetInputList response with count inputs"""
+    inputs = []
+    for idx in range(count):
+        kind = KINDS[idx % len(KINDS)]
+        inputs.append({'inputName': f"{kind} {idx}", 'inputKind': kind,
+                       'unversionedInputKind': kind.rsplit('_v', 1)[0]})
+    return inputs
+
+
+def old_filtering(inputs, alerts, audio_inputs):
+    """Both pages' lists, the way the wizard used to work them out, when
+    the audio page listed every input whether it had audio or not"""
+    sources = [x['inputName'] for x in inputs]
+    defaults = ('Mic/Aux', 'Desktop Audio')
+    audio = [x for x in sources if x not in defaults]
+    alert_list = tuple(alerts)
+    alert = [x for x in audio + list(defaults) if x not in alert_list]
+    return audio, alert
+
+
+def inventory_filtering(inputs, alerts, audio_inputs):
+    """Both pages' lists from a SourceInventory"""
+    inventory = SourceInventory(inputs, audio_inputs)
+    defaults = {'Mic/Aux', 'Desktop Audio'}
+    audio = [x for x in inventory.audio_sources if x not in defaults]
+    alert_set = set(alerts)
+    alert = [x for x in inventory.browser_sources if x not in alert_set]
+    return audio, alert
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=50)
+    args = parser.parse_args()
+    for count in (100, 500, 2000):
+        inputs = make_inputs(count)
+        # A quarter of the inputs already chosen as alert sources
+        alerts = [x['inputName'] for x in inputs
+                  if x['inputKind'] == 'browser_source'][:count // 4]
+        audio_inputs = [x['inputName'] for x in inputs
+                        if x['inputKind'] in AUDIO_KINDS]
+        for func in (old_filtering, inventory_filtering):
+            times = []
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                audio, alert = func(inputs, alerts, audio_inputs)
+                times.append((time.perf_counter() - start) * 1000)
+            print(json.dumps({
+                'benchmark': 'source_inventory', 'method': func.__name__,
+                'inputs': count, 'alert_sources': len(alerts),
+                'median_ms': round(statistics.median(times), 3),
+                'max_ms': round(max(times), 3),
+                'audio_listed': len(audio), 'alert_listed': len(alert)}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""Measure the startup cost of obs-streamdeck-ctl for each action, and fail
+if any of them goes over its budget.
+
+Every action is run in a fresh interpreter, the way the Stream Deck launches
+it, against fake_obs.py and fake_twitch.py on free ports and a throwaway
+config, so neither OBS nor the daemon is used.  The wall clock time of each
+run is measured from starting the process to it exiting, and the import time
+from a separate run with ``python -X importtime``.
+
+The actions can be launched as a module, through the installed console
+script, and from a zipapp built with tools/build_zipapp.py.  The budgets, in
+milliseconds, are read from startup_budget.json next to this script.
+
+    python benchmarks/bench_startup.py [--runs N] [--mode MODE]
+        [--zipapp PATH] [--budget FILE] [--only ACTION]
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from fake_obs import FakeObs, start_in_thread as start_obs
+from fake_twitch import FakeTwitch, start_in_thread as start_twitch
+from import_time import parse_importtime
+
+PASSWORD = 'benchmark'
+TOKEN = 'abc'
+ACTIONS = ('mute_mic', 'scene 1', 'live_safety', 'setup --help')
+BUDGET_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           'startup_budget.json')
+CONFIG = """[obs]
+ws_password = {password}
+host = 127.0.0.1
+port = {obs_port}
+mic_source = Mic/Aux
+desktop_source = Desktop Audio
+alert_sources = alerts
+
+[obs_browser_sources]
+alerts = http://localhost/alerts
+
+[twitch]
+channel = tester
+oauth_token = {token}
+irc_host = 127.0.0.1
+irc_port = {irc_port}
+
+[live_safety]
+enabled = True
+method = FOLLOWER
+follow_time = 10m
+emote_mode = True
+
+[start_stop_safety]
+enabled = False
+
+[additional]
+advert = False
+clear_chat = False
+"""
+
+
+def commands(modes, zipapp_path):
+    """The command to launch obs-streamdeck-ctl for each mode
+
+    :return: The command, as a list, keyed by mode
+    :rtype: dict
+    """
+    found = dict()
+    for mode in modes:
+        if mode == 'module':
+            found[mode] = [sys.executable, '-m', 'obs_sd_controls.cli_entry']
+        elif mode == 'script':
+            # Prefer the script next to this interpreter, as a shim on the
+            # PATH would add its own startup time
+            script = os.path.join(os.path.dirname(sys.executable),
+                                  'obs-streamdeck-ctl')
+            if not os.path.exists(script):
+                script = shutil.which('obs-streamdeck-ctl')
+            if script:
+                found[mode] = [script]
+        elif mode == 'zipapp' and zipapp_path:
+            found[mode] = [sys.executable, '-I', '-S', zipapp_path]
+    return found
+
+
+def run(cmd, action, env, importtime=False):
+    """Run an action in a fresh interpreter
+
+    :return: The wall clock time in seconds, and the import time in
+        milliseconds if importtime was set
+    :rtype: tuple
+    """
+    if importtime and cmd[0] == sys.executable:
+        cmd = cmd[:1] + ['-X', 'importtime'] + cmd[1:]
+    elif importtime:
+        # The console script can't take interpreter options, so pass it
+        # through the environment
+        env = dict(env, PYTHONPROFILEIMPORTTIME='1')
+    start = time.perf_counter()
+    result = subprocess.run(cmd + action.split(), env=env,
+                            capture_output=True, text=True, timeout=60)
+    elapsed = time.perf_counter() - start
+    if result.returncode:
+        raise RuntimeError(f"{action} failed: {result.stderr.strip()}")
+    import_ms = None
+    if importtime:
+        import_ms = sum(parse_importtime(result.stderr).values()) / 1000
+    return elapsed, import_ms
+
+
+def check_budget(result, budget):
+    """The budgets the result went over
+
+    :rtype: list
+    """
+    over = []
+    for key, limit in budget.items():
+        if result.get(key) is not None and result[key] > limit:
+            over.append(f"{key} {result[key]} > {limit}")
+    return over
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--mode', action='append', default=[],
+                        choices=('module', 'script', 'zipapp'),
+                        help='How to launch the actions, every mode that '
+                             'is available by default')
+    parser.add_argument('--zipapp', metavar='PATH',
+                        help='A zipapp from tools/build_zipapp.py')
+    parser.add_argument('--budget', metavar='FILE', default=BUDGET_FILE)
+    parser.add_argument('--only', action='append', default=[],
+                        metavar='ACTION')
+    args = parser.parse_args()
+    with open(args.budget) as f:
+        budgets = json.load(f)
+    fake_obs = FakeObs(password=PASSWORD)
+    fake_obs.add_browser_source('alerts', 'http://localhost/alerts')
+    start_obs(fake_obs, 0)
+    fake_twitch = FakeTwitch(token=TOKEN)
+    start_twitch(fake_twitch, 0)
+    modes = commands(args.mode or ('module', 'script', 'zipapp'),
+                     args.zipapp)
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        config_dir = os.path.join(tmp, 'obs-streamdeck-ctl')
+        os.makedirs(config_dir)
+        with open(os.path.join(config_dir, 'obs-streamdeck.ini'), 'w') as f:
+            f.write(CONFIG.format(password=PASSWORD, token=TOKEN,
+                                  obs_port=fake_obs.port,
+                                  irc_port=fake_twitch.port))
+        # Keep the config, settings cache and daemon socket in the throwaway
+        # folder, so a running daemon isn't used
+        env = dict(os.environ, XDG_CONFIG_HOME=tmp, XDG_RUNTIME_DIR=tmp,
+                   XDG_CACHE_HOME=tmp)
+        env.pop('OBS_STREAMDECK_TIMINGS', None)
+        for action in args.only or ACTIONS:
+            for mode, cmd in modes.items():
+                # The first run fills the settings and bytecode caches
+                run(cmd, action, env)
+                times = [run(cmd, action, env)[0] * 1000
+                         for _ in range(args.runs)]
+                imports = [run(cmd, action, env, True)[1]
+                           for _ in range(max(args.runs // 2, 1))]
+                result = dict([
+                    ('action', action), ('mode', mode), ('runs', args.runs),
+                    ('wall_ms', round(statistics.median(times), 1)),
+                    ('wall_min_ms', round(min(times), 1)),
+                    ('import_ms', round(statistics.median(imports), 1))])
+                result['over_budget'] = check_budget(
+                    result, budgets.get(action, dict()))
+                failed = failed or bool(result['over_budget'])
+                print(json.dumps(result), flush=True)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,394 @@
+"""Measure the latency and throughput of every public obs_controls function and
+every obs-streamdeck-ctl action against fake_obs.py.
+
+The obs_controls functions are run in process, both the synchronous
+functions, which connect to OBS for every call, and their ws_ coroutines over
+one shared ObsSession.  The actions are run in a fresh interpreter the way the
+Stream Deck runs them, both on their own and handed to a running daemon.  A
+throwaway config is used, your own config is not touched.  The fake server
+listens on a free port, so OBS can be left running.
+
+Every result is printed as a line of JSON, after a first line describing the
+run.  Save the output of one run and pass it to --compare on the next to see
+the change in the median for each result, and fail if any got slower by more
+than --threshold:
+
+    python benchmarks/bench_suite.py > before.jsonl
+    python benchmarks/bench_suite.py --compare before.jsonl
+
+    python benchmarks/bench_suite.py [--runs N] [--process-runs N]
+        [--latency SECONDS] [--jitter SECONDS] [--password PASSWORD]
+        [--delay REQUEST=SECONDS] [--only NAME] [--no-cli]
+        [--compare FILE] [--threshold RATIO]
+"""
+import argparse
+import json
+import os
+import platform
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from fake_obs import FakeObs, start_in_thread
+from obs_sd_controls import obs_controls
+from obs_sd_controls.obs_controls import ObsSession
+
+MIC = 'Mic/Aux'
+DESKTOP = 'Desktop Audio'
+SOURCE_URLS = dict([('alerts', 'http://localhost/alerts'),
+                    ('chat', 'http://localhost/chat')])
+CONFIG = """[obs]
+port = {port}
+ws_password = {password}
+mic_source = Mic/Aux
+desktop_source = Desktop Audio
+alert_sources = alerts:chat
+
+[obs_browser_sources]
+alerts = http://localhost/alerts
+chat = http://localhost/chat
+
+[custom:version]
+request = GetVersion
+
+[macro:brb]
+steps =
+    scene 3
+    mute_mic --on
+    mute_desk --on & live_safety --engage
+"""
+# Each action with the arguments for each run, taking turns, so that the
+# actions that set a state switch it back and forth rather than doing nothing
+# after the first run
+ACTIONS = [
+    ('start_stop', ['start_stop']),
+    ('start_stop --start/--stop', ['start_stop --start',
+                                   'start_stop --stop']),
+    ('mute_mic', ['mute_mic']),
+    ('mute_mic --on/--off', ['mute_mic --on', 'mute_mic --off']),
+    ('mute_desk', ['mute_desk']),
+    ('mute_all', ['mute_all']),
+    ('scene', ['scene 2', 'scene 1']),
+    ('live_safety', ['live_safety']),
+    ('live_safety --engage/--release', ['live_safety --engage',
+                                        'live_safety --release']),
+    ('raw', ['raw GetVersion']),
+    ('custom', ['custom version']),
+    ('macro', ['macro brb']),
+]
+
+
+def functions(password, port):
+    """Each public obs_controls function, with the ws_ coroutine that does the
+    same over an open session.  Each takes the run number, so the ones that
+    set a state can switch it back and forth.
+
+    :param password: The password for the fake server
+    :type password: str
+    :param port: The port the fake server is listening on
+    :type port: int
+    :return: (name, function, coroutine function) tuples
+    :rtype: list
+    """
+    oc = obs_controls
+
+    def on(run):
+        return run % 2 == 0
+
+    def url_settings(run):
+        return dict([('url', SOURCE_URLS['alerts'] if on(run) else
+                      oc.DISABLED_URL)])
+
+    return [
+        ('mute_audio_source',
+         lambda run: oc.mute_audio_source(MIC, password, port=port),
+         lambda run, s: oc.ws_toggle_mute(MIC, s)),
+        ('mute_audio_source muted',
+         lambda run: oc.mute_audio_source(MIC, password, on(run), port=port),
+         lambda run, s: oc.ws_set_mutes((MIC, ), on(run), s)),
+        ('mute_audio_sources',
+         lambda run: oc.mute_audio_sources((MIC, DESKTOP), password,
+                                           port=port),
+         lambda run, s: oc.ws_toggle_mutes((MIC, DESKTOP), s)),
+        ('set_scene',
+         lambda run: oc.set_scene(run % 4 + 1, password, port=port),
+         lambda run, s: oc.ws_set_scene_number(run % 4 + 1, s)),
+        ('start_stop_stream',
+         lambda run: oc.start_stop_stream(password, port=port),
+         lambda run, s: oc.ws_start_stop_stream(s)),
+        ('start_stop_stream active',
+         lambda run: oc.start_stop_stream(password, on(run), port=port),
+         lambda run, s: oc.ws_set_stream(on(run), s)),
+        ('get_source_settings',
+         lambda run: oc.get_source_settings('alerts', password, port=port),
+         lambda run, s: oc.ws_get_source_settings('alerts', s)),
+        ('get_sources_settings',
+         lambda run: oc.get_sources_settings(SOURCE_URLS, password,
+                                             port=port),
+         lambda run, s: oc.ws_get_sources_settings(list(SOURCE_URLS), s)),
+        ('set_source_settings',
+         lambda run: oc.set_source_settings('alerts', url_settings(run),
+                                            password, port=port),
+         lambda run, s: oc.ws_set_source_settings('alerts',
+                                                  url_settings(run), s)),
+        ('toggle_browser_sources',
+         lambda run: oc.toggle_browser_sources(SOURCE_URLS, password,
+                                               port=port),
+         lambda run, s: oc.ws_toggle_browser_sources(SOURCE_URLS, s)),
+        ('set_browser_sources',
+         lambda run: oc.set_browser_sources(SOURCE_URLS, on(run), password,
+                                            port=port),
+         lambda run, s: oc.ws_set_browser_sources(SOURCE_URLS, on(run), s)),
+        ('get_all_sources',
+         lambda run: oc.get_all_sources(password, port=port),
+         lambda run, s: oc.ws_get_all_sources(s)),
+        ('obs_request',
+         lambda run: oc.obs_request('GetVersion', None, password, port=port),
+         lambda run, s: oc.ws_request('GetVersion', None, s)),
+    ]
+
+
+class Counters:
+    """The fake server's counters from the start of a benchmark, to report
+    how many connections, messages and requests each run took
+    """
+
+    def __init__(self, fake):
+        self.fake = fake
+        self.start = self.read()
+
+    def read(self):
+        return (self.fake.connection_count, self.fake.message_count,
+                self.fake.request_count)
+
+    def per_run(self, runs):
+        return dict([(name, round((end - start) / runs, 2))
+                     for name, start, end in zip(
+                         ('connections', 'messages', 'requests'),
+                         self.start, self.read())])
+
+
+def result(suite, name, mode, times, elapsed, counters):
+    """Put together the result for a benchmark
+
+    :param times: The time taken by each run, in seconds
+    :type times: list
+    :param elapsed: The time taken by all of the runs, in seconds
+    :type elapsed: float
+    :rtype: dict
+    """
+    ms = sorted([x * 1000 for x in times])
+    entry = dict([('suite', suite), ('name', name), ('mode', mode),
+                  ('runs', len(ms)),
+                  ('median_ms', round(statistics.median(ms), 3)),
+                  ('p95_ms', round(ms[max(int(len(ms) * 0.95 + 0.5) - 1,
+                                          0)], 3)),
+                  ('min_ms', round(ms[0], 3)),
+                  ('max_ms', round(ms[-1], 3)),
+                  ('per_second', round(len(ms) / elapsed, 2))])
+    entry.update(counters.per_run(len(ms)))
+    return entry
+
+
+def bench_function(fake, name, func, runs):
+    """Run a synchronous obs_controls function, which connects for every call
+    """
+    counters = Counters(fake)
+    times = []
+    started = time.perf_counter()
+    for run in range(runs):
+        start = time.perf_counter()
+        func(run)
+        times.append(time.perf_counter() - start)
+    return result('obs_controls', name, 'connect_per_call', times,
+                  time.perf_counter() - started, counters)
+
+
+def bench_session(fake, name, ws_func, runs, password):
+    """Run a ws_ coroutine over one session, made before the timing starts"""
+
+    async def run_all():
+        async with ObsSession(password, port=fake.port) as session:
+            counters = Counters(fake)
+            times = []
+            started = time.perf_counter()
+            for run in range(runs):
+                start = time.perf_counter()
+                await ws_func(run, session)
+                times.append(time.perf_counter() - start)
+            elapsed = time.perf_counter() - started
+            return result('obs_controls', name, 'shared_session', times,
+                          elapsed, counters)
+
+    return obs_controls.run_sync(run_all())
+
+
+def bench_action(fake, name, variants, runs, env, mode):
+    """Run an action in a fresh interpreter"""
+    counters = Counters(fake)
+    times = []
+    started = time.perf_counter()
+    for run in range(runs):
+        cmd = [sys.executable, '-m', 'obs_sd_controls.cli_entry'] + \
+            variants[run % len(variants)].split()
+        start = time.perf_counter()
+        subprocess.run(cmd, env=env, check=True, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return result('cli', name, mode, times, time.perf_counter() - started,
+                  counters)
+
+
+def start_daemon(env, run_dir):
+    """Start the daemon and wait for it to listen on its socket
+
+    :return: The daemon process
+    :rtype: subprocess.Popen
+    """
+    daemon = subprocess.Popen([sys.executable, '-m',
+                               'obs_sd_controls.cli_entry', 'daemon'],
+                              env=env)
+    path = os.path.join(run_dir, 'obs-streamdeck-ctl.sock')
+    deadline = time.monotonic() + 15
+    while not os.path.exists(path):
+        if daemon.poll() is not None or time.monotonic() > deadline:
+            daemon.kill()
+            raise RuntimeError('The daemon did not start')
+        time.sleep(0.05)
+    return daemon
+
+
+def stop_daemon(daemon):
+    daemon.send_signal(signal.SIGINT)
+    try:
+        daemon.wait(10)
+    except subprocess.TimeoutExpired:
+        daemon.kill()
+
+
+def git_revision():
+    """The git commit being benchmarked, if this is a git checkout"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))
+                              ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_baseline(path):
+    """Read the results from an earlier run, keyed by suite, name and mode"""
+    baseline = dict()
+    with open(path) as f:
+        for line in f:
+            entry = json.loads(line)
+            if 'suite' in entry:
+                baseline[(entry['suite'], entry['name'], entry['mode'])] = \
+                    entry
+    return baseline
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--process-runs', type=int, default=5,
+                        help='Runs for each action in a fresh interpreter, '
+                             'which are much slower')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Delay added to every message from the fake '
+                             'server, in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='Random extra delay added to every message, up '
+                             'to this many seconds')
+    parser.add_argument('--password', default='benchmark',
+                        help='The fake server password, blank to turn '
+                             'authentication off')
+    parser.add_argument('--delay', action='append', default=[],
+                        metavar='REQUEST=SECONDS',
+                        help='Extra delay for one request type, can be '
+                             'given more than once')
+    parser.add_argument('--only', action='append', default=[],
+                        metavar='NAME',
+                        help='Only run the benchmarks with this name')
+    parser.add_argument('--no-cli', action='store_true',
+                        help="Don't run the command line actions")
+    parser.add_argument('--compare', metavar='FILE',
+                        help='Results from an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='With --compare, fail if a median is more than '
+                             'this many times the earlier one')
+    args = parser.parse_args()
+    delays = dict([(x.split('=')[0], float(x.split('=')[1]))
+                   for x in args.delay])
+    baseline = load_baseline(args.compare) if args.compare else dict()
+    regressions = []
+
+    def report(entry):
+        before = baseline.get((entry['suite'], entry['name'], entry['mode']))
+        if before:
+            entry['baseline_median_ms'] = before['median_ms']
+            entry['ratio'] = round(entry['median_ms'] /
+                                   max(before['median_ms'], 0.001), 3)
+            if entry['ratio'] > args.threshold:
+                regressions.append(entry)
+        print(json.dumps(entry), flush=True)
+
+    print(json.dumps(dict([('meta', dict([
+        ('time', time.strftime('%Y-%m-%dT%H:%M:%S')),
+        ('git', git_revision()), ('python', platform.python_version()),
+        ('runs', args.runs), ('process_runs', args.process_runs),
+        ('latency_s', args.latency), ('jitter_s', args.jitter),
+        ('auth', bool(args.password)), ('delays', delays)]))])), flush=True)
+
+    fake = FakeObs(password=args.password, latency=args.latency,
+                   jitter=args.jitter, request_delays=delays)
+    for source, url in SOURCE_URLS.items():
+        fake.add_browser_source(source, url)
+    start_in_thread(fake, 0)
+
+    for name, func, ws_func in functions(args.password, fake.port):
+        if args.only and name not in args.only:
+            continue
+        report(bench_function(fake, name, func, args.runs))
+        report(bench_session(fake, name, ws_func, args.runs, args.password))
+
+    if not args.no_cli:
+        actions = [x for x in ACTIONS if not args.only or x[0] in args.only]
+        bench_cli(fake, actions, args, report)
+    if regressions:
+        print(f"{len(regressions)} results were more than {args.threshold} "
+              f"times slower than {args.compare}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def bench_cli(fake, actions, args, report):
+    """Run the actions in a fresh interpreter, first on their own and then
+    handed to the daemon
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        config_dir = os.path.join(tmp, 'obs-streamdeck-ctl')
+        os.makedirs(config_dir)
+        with open(os.path.join(config_dir, 'obs-streamdeck.ini'), 'w') as f:
+            f.write(CONFIG.format(password=args.password, port=fake.port))
+        run_dir = os.path.join(tmp, 'run')
+        os.makedirs(run_dir)
+        # Point the config at the throwaway file, and keep away from any
+        # daemon that's already running
+        env = dict(os.environ, XDG_CONFIG_HOME=tmp, XDG_RUNTIME_DIR=run_dir)
+        for name, variants in actions:
+            report(bench_action(fake, name, variants, args.process_runs, env,
+                                'process'))
+        daemon = start_daemon(env, run_dir)
+        try:
+            for name, variants in actions:
+                report(bench_action(fake, name, variants, args.process_runs,
+                                    env, 'daemon'))
+        finally:
+            stop_daemon(daemon)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""Compare chat lockdown through a new bot connection per press with the
+daemon's persistent chat session, against fake_twitch.py.
+
+For each run the time is measured from the button press to the fake server
+receiving the last chat command.  The reconnect test drops the session's
+connection and measures how long it takes to be joined again.
+
+    python benchmarks/bench_twitch_session.py [--runs N] [--latency SECONDS]
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import threading
+import time
+from fake_twitch import FakeTwitch, start_in_thread
+from obs_sd_controls.twitch_controls import TwitchSafetyBot, \
+    TwitchChatSession, safety_commands
+
+CHANNEL = 'tester'
+TOKEN = 'abc'
+# Lock down with emote only and followers only, so each press sends two
+# commands
+SAFETY = dict(enabled=True, emote_mode=True, method='FOLLOWER',
+              follow_time='10m')
+
+
+def wait_for_commands(fake, loop, count, timeout=10):
+    asyncio.run_coroutine_threadsafe(
+        asyncio.wait_for(fake.wait_for_commands(count), timeout),
+        loop).result()
+
+
+def one_shot(fake, loop, target):
+    """Lock down or release chat with a new TwitchSafetyBot, the same way the
+    command line does without the daemon
+
+    :return: The time taken, in seconds
+    :rtype: float
+    """
+    expected = len(fake.commands) + 2
+    start = time.perf_counter()
+    bot = TwitchSafetyBot(CHANNEL, TOKEN, target=target, host='localhost',
+                          port=fake.port, **SAFETY)
+    thread = threading.Thread(target=run_bot, args=(bot, ), daemon=True)
+    thread.start()
+    wait_for_commands(fake, loop, expected)
+    elapsed = time.perf_counter() - start
+    thread.join(10)
+    return elapsed
+
+
+def run_bot(bot):
+    try:
+        bot.start()
+    except SystemExit:
+        # The bot exits once it's sent its commands
+        pass
+
+
+def persistent(fake, loop, session, target):
+    """Lock down or release chat over the persistent chat session, the same
+    way the daemon does
+
+    :return: The time taken, in seconds
+    :rtype: float
+    """
+    expected = len(fake.commands) + 2
+    start = time.perf_counter()
+    session.update_chat(lambda room_state: safety_commands(
+        room_state, target=target, **SAFETY))
+    wait_for_commands(fake, loop, expected)
+    return time.perf_counter() - start
+
+
+def reconnect(fake, loop, session):
+    """Drop the session's connection and wait for it to join again
+
+    :return: The time taken, in seconds
+    :rtype: float
+    """
+    start = time.perf_counter()
+    loop.call_soon_threadsafe(fake.drop_clients)
+    # Wait for the bot to notice that it's been dropped
+    deadline = time.monotonic() + 5
+    while session.joined.is_set() and time.monotonic() < deadline:
+        time.sleep(0.001)
+    if not session.joined.wait(120):
+        raise TimeoutError('The chat session did not rejoin')
+    return time.perf_counter() - start
+
+
+def report(mode, times, fake, **extra):
+    result = {'mode': mode, 'runs': len(times),
+              'median_ms': round(statistics.median(times) * 1000, 2),
+              'min_ms': round(min(times) * 1000, 2),
+              'max_ms': round(max(times) * 1000, 2),
+              'connections': fake.connection_count}
+    result.update(extra)
+    print(json.dumps(result), flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--reconnects', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='Delay added by the fake server to every '
+                             'message it sends, in seconds')
+    args = parser.parse_args()
+
+    fake = FakeTwitch(token=TOKEN, latency=args.latency)
+    loop = start_in_thread(fake, 0)
+    times = [one_shot(fake, loop, bool(run % 2 == 0))
+             for run in range(args.runs)]
+    report('one_shot', times, fake, latency=args.latency)
+
+    fake.connection_count = 0
+    session = TwitchChatSession(CHANNEL, TOKEN, 'localhost', fake.port)
+    session.start_background()
+    if not session.joined.wait(10):
+        raise TimeoutError('Could not join the fake Twitch chat')
+    # Carry on alternating from wherever the one shot bots left chat
+    times = [persistent(fake, loop, session, bool((args.runs + run) % 2 == 0))
+             for run in range(args.runs)]
+    report('persistent', times, fake, latency=args.latency)
+
+    fake.connection_count = 0
+    times = [reconnect(fake, loop, session) for _ in range(args.reconnects)]
+    report('reconnect', times, fake, latency=args.latency)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,357 @@
+import asyncio
+import base64
+import hashlib
+import random
+import threading
+import msgpack
+from websockets.asyncio.server import serve
+from websockets.exceptions import ConnectionClosed
+
+
+class FakeObs:
+    """A local stand in for the obs-websocket v5 server, implementing the
+    requests used by obs_sd_controls against an in memory model of OBS.
+
+    :param password: The password clients must authenticate with, leave blank
+        to disable authentication
+    :type password: str
+    :param latency: Delay added before every message sent to a client, in
+        seconds
+    :type latency: float
+    :param jitter: Random extra delay, up to this many seconds, added to the
+        latency
+    :type jitter: float
+    :param request_delays: Extra delays, in seconds, for specific request
+        types
+    :type request_delays: dict
+    :cvar scenes: The scene names, from the top down
+    :cvar inputs: The inputs, keyed by name, with their kind, settings and
+        mute state
+    :cvar streaming: If the stream is currently running
+    :cvar current_scene: The current program scene
+    :cvar request_count: The number of requests received, including those
+        sent in a batch
+    :cvar message_count: The number of request messages received
+    :cvar connection_count: The number of connections made
+    :cvar salt: The authentication salt
+    """
+
+    def __init__(self, password='', latency=0.0, jitter=0.0,
+                 request_delays=None):
+        self.password = password
+        # Like obs-websocket, the salt stays the same until the password
+        # changes and only the challenge is new for each connection
+        self.salt = base64.b64encode(random.randbytes(32)).decode()
+        self.latency = latency
+        self.jitter = jitter
+        self.request_delays = request_delays or dict()
+        self.scenes = ['Starting Soon', 'Live', 'BRB', 'Ending']
+        self.inputs = {
+            'Mic/Aux': {'kind': 'pulse_input_capture', 'settings': {},
+                        'muted': False},
+            'Desktop Audio': {'kind': 'pulse_output_capture',
+                              'settings': {}, 'muted': False},
+        }
+        self.streaming = False
+        self.current_scene = self.scenes[0]
+        self.scene_collection = 'Untitled'
+        self.request_count = 0
+        self.message_count = 0
+        self.connection_count = 0
+        self.clients = dict()
+        self.server = None
+        self.port = None
+
+    def add_browser_source(self, name, url):
+        """Add a browser source input
+
+        :param name: The name of the input
+        :type name: str
+        :param url: The URL for the browser source
+        :type url: str
+        """
+        self.inputs[name] = {'kind': 'browser_source',
+                             'settings': {'url': url, 'width': 800,
+                                          'height': 600},
+                             'muted': False}
+
+    @property
+    def url(self):
+        """The websocket URL to connect to the fake server"""
+        return f"ws://localhost:{self.port}"
+
+    async def start(self, port=0):
+        """Start listening on localhost
+
+        :param port: The port to listen on, 0 picks a free port
+        :type port: int
+        """
+        self.server = await serve(self._handler, 'localhost', port,
+                                  subprotocols=['obswebsocket.msgpack'])
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        """Stop the server and drop all clients"""
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _delay(self, extra=0.0):
+        delay = self.latency + extra
+        if self.jitter:
+            delay += random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+
+    async def _send(self, ws, op, data, extra_delay=0.0):
+        await self._delay(extra_delay)
+        await ws.send(msgpack.packb({'op': op, 'd': data}))
+
+    async def _handler(self, ws):
+        self.connection_count += 1
+        hello = {'obsWebSocketVersion': '5.0.0-fake', 'rpcVersion': 1}
+        salt = challenge = None
+        if self.password:
+            salt = self.salt
+            challenge = base64.b64encode(random.randbytes(32)).decode()
+            hello['authentication'] = {'salt': salt, 'challenge': challenge}
+        await self._send(ws, 0, hello)
+        try:
+            async for message in ws:
+                payload = msgpack.unpackb(message)
+                op, data = payload['op'], payload['d']
+                if op == 1:
+                    if self.password and not self._check_auth(
+                            data.get('authentication', ''), salt, challenge):
+                        await ws.close(4009, 'Authentication failed.')
+                        return
+                    self.clients[ws] = data.get('eventSubscriptions', 2047)
+                    await self._send(ws, 2, {'negotiatedRpcVersion': 1})
+                elif op == 3:
+                    self.clients[ws] = data.get('eventSubscriptions',
+                                                self.clients[ws])
+                elif op == 6 and ws in self.clients:
+                    self.message_count += 1
+                    result = await self._request(data)
+                    result['requestId'] = data['requestId']
+                    await self._send(ws, 7, result)
+                elif op == 8 and ws in self.clients:
+                    self.message_count += 1
+                    results = []
+                    for request in data['requests']:
+                        results.append(await self._request(request))
+                        # Like OBS, leave out everything after the first
+                        # failure when asked to halt
+                        if data.get('haltOnFailure') and \
+                                not results[-1]['requestStatus']['result']:
+                            break
+                    await self._send(ws, 9, {'requestId': data['requestId'],
+                                             'results': results})
+        finally:
+            self.clients.pop(ws, None)
+
+    def _check_auth(self, authentication, salt, challenge):
+        secret = base64.b64encode(hashlib.sha256(
+            (self.password + salt).encode()).digest())
+        expected = base64.b64encode(hashlib.sha256(
+            secret + challenge.encode()).digest()).decode()
+        return authentication == expected
+
+    async def _request(self, request):
+        self.request_count += 1
+        request_type = request['requestType']
+        if request_type in self.request_delays:
+            await asyncio.sleep(self.request_delays[request_type])
+        handler = getattr(self, f"_req_{request_type}", None)
+        response = {'requestType': request_type,
+                    'requestStatus': {'result': True, 'code': 100}}
+        if handler is None:
+            response['requestStatus'] = {'result': False, 'code': 204,
+                                         'comment': 'Unknown request type'}
+            return response
+        try:
+            data = handler(request.get('requestData') or dict())
+        except KeyError as e:
+            response['requestStatus'] = {'result': False, 'code': 600,
+                                         'comment': f"No resource {e}"}
+            return response
+        except ValueError as e:
+            code, comment = e.args
+            response['requestStatus'] = {'result': False, 'code': code,
+                                         'comment': comment}
+            return response
+        if data is not None:
+            response['responseData'] = data
+        return response
+
+    def emit(self, event_type, event_intent, event_data=None):
+        """Send an event to every client subscribed to it
+
+        :param event_type: The obs-websocket event type
+        :type event_type: str
+        :param event_intent: The event subscription bit for the event
+        :type event_intent: int
+        :param event_data: The data for the event
+        :type event_data: dict
+        """
+        payload = {'eventType': event_type, 'eventIntent': event_intent}
+        if event_data is not None:
+            payload['eventData'] = event_data
+        for ws, subscriptions in list(self.clients.items()):
+            if subscriptions & event_intent:
+                asyncio.ensure_future(self._send_event(ws, payload))
+
+    async def _send_event(self, ws, payload):
+        try:
+            await self._send(ws, 5, payload)
+        except ConnectionClosed:
+            # The client went away before the event was sent
+            pass
+
+    # Request handlers, one per obs-websocket request type
+
+    def _req_GetVersion(self, data):
+        return {'obsVersion': '30.0.0', 'obsWebSocketVersion': '5.0.0-fake',
+                'rpcVersion': 1, 'availableRequests': [], 'platform': 'fake'}
+
+    def _req_GetSceneList(self, data):
+        return {'currentProgramSceneName': self.current_scene,
+                'currentPreviewSceneName': None,
+                'scenes': self._scene_list()}
+
+    def _scene_list(self):
+        count = len(self.scenes)
+        return [{'sceneName': name, 'sceneIndex': count - idx - 1}
+                for idx, name in enumerate(self.scenes)]
+
+    def _req_GetSceneCollectionList(self, data):
+        return {'currentSceneCollectionName': self.scene_collection,
+                'sceneCollections': [self.scene_collection]}
+
+    def set_scenes(self, scenes):
+        """Replace the scene list, as if the user had edited it in OBS
+
+        :param scenes: The scene names, from the top down
+        :type scenes: list
+        """
+        self.scenes = list(scenes)
+        self.emit('SceneListChanged', 1 << 2, {'scenes': self._scene_list()})
+
+    def _req_GetCurrentProgramScene(self, data):
+        return {'currentProgramSceneName': self.current_scene}
+
+    def _req_SetCurrentProgramScene(self, data):
+        if data['sceneName'] not in self.scenes:
+            raise KeyError(data['sceneName'])
+        self.current_scene = data['sceneName']
+        self.emit('CurrentProgramSceneChanged', 1 << 2,
+                  {'sceneName': self.current_scene})
+
+    def _req_GetCurrentSceneCollection(self, data):
+        return {'currentSceneCollectionName': self.scene_collection}
+
+    def _req_GetInputList(self, data):
+        kind = data.get('inputKind')
+        return {'inputs': [{'inputName': name, 'inputKind': value['kind'],
+                            'unversionedInputKind': value['kind']}
+                           for name, value in self.inputs.items()
+                           if kind is None or value['kind'] == kind]}
+
+    def _req_GetInputMute(self, data):
+        item = self.inputs[data['inputName']]
+        # Only the inputs with audio have a mute state
+        if 'muted' not in item:
+            raise ValueError(604, 'The specified input does not support '
+                                  'audio')
+        return {'inputMuted': item['muted']}
+
+    def _req_SetInputMute(self, data):
+        self._set_mute(data['inputName'], data['inputMuted'])
+
+    def _req_ToggleInputMute(self, data):
+        name = data['inputName']
+        self._set_mute(name, not self.inputs[name]['muted'])
+        return {'inputMuted': self.inputs[name]['muted']}
+
+    def _set_mute(self, name, muted):
+        self.inputs[name]['muted'] = muted
+        self.emit('InputMuteStateChanged', 1 << 3,
+                  {'inputName': name, 'inputMuted': muted})
+
+    def _req_GetInputSettings(self, data):
+        value = self.inputs[data['inputName']]
+        return {'inputSettings': dict(value['settings']),
+                'inputKind': value['kind']}
+
+    def _req_SetInputSettings(self, data):
+        value = self.inputs[data['inputName']]
+        if data.get('overlay', True):
+            value['settings'].update(data['inputSettings'])
+        else:
+            value['settings'] = dict(data['inputSettings'])
+        self.emit('InputSettingsChanged', 1 << 3,
+                  {'inputName': data['inputName'],
+                   'inputSettings': dict(value['settings'])})
+
+    def _req_GetStreamStatus(self, data):
+        return {'outputActive': self.streaming, 'outputReconnecting': False,
+                'outputTimecode': '00:00:00.000', 'outputDuration': 0,
+                'outputCongestion': 0, 'outputBytes': 0,
+                'outputSkippedFrames': 0, 'outputTotalFrames': 0}
+
+    def _req_ToggleStream(self, data):
+        self._set_stream(not self.streaming)
+        return {'outputActive': self.streaming}
+
+    def _req_StartStream(self, data):
+        if self.streaming:
+            raise ValueError(500, 'The stream output is already running.')
+        self._set_stream(True)
+
+    def _req_StopStream(self, data):
+        if not self.streaming:
+            raise ValueError(501, 'The stream output is not running.')
+        self._set_stream(False)
+
+    def _set_stream(self, active):
+        self.streaming = active
+        state = 'OBS_WEBSOCKET_OUTPUT_STARTED' if active else \
+            'OBS_WEBSOCKET_OUTPUT_STOPPED'
+        self.emit('StreamStateChanged', 1 << 6,
+                  {'outputActive': active, 'outputState': state})
+
+
+def start_in_thread(fake, port=0):
+    """Run the fake server on its own event loop in a daemon thread, so it
+    can be used by the synchronous obs_controls functions
+
+    :param fake: The fake server
+    :type fake: FakeObs
+    :param port: The port to listen on, a free one by default, which is then
+        in fake.port
+    :type port: int
+    :return: The event loop the server is running on
+    :rtype: asyncio.AbstractEventLoop
+    """
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    asyncio.run_coroutine_threadsafe(fake.start(port), loop).result()
+    return loop
+
+
+async def run_forever(fake):
+    """Run the fake server until interrupted, printing its URL
+
+    :param fake: The fake server
+    :type fake: FakeObs
+    """
+    await fake.start(4455)
+    print(f"Fake obs-websocket listening on {fake.url}")
+    await asyncio.Future()
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(run_forever(FakeObs()))
+    except KeyboardInterrupt:
+        pass
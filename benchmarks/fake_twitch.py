@@ -0,0 +1,304 @@
+import asyncio
+import random
+import threading
+import time
+
+# The ROOMSTATE tags for a channel with every chat mode switched off
+DEFAULT_ROOM_TAGS = {'emote-only': '0', 'followers-only': '-1', 'r9k': '0',
+                     'room-id': '12345', 'slow': '0', 'subs-only': '0'}
+# Chat commands that switch a mode, as the tag they change and the value
+# they set it to
+MODE_COMMANDS = {
+    '/emoteonly': ('emote-only', '1'),
+    '/emoteonlyoff': ('emote-only', '0'),
+    '/followersoff': ('followers-only', '-1'),
+    '/subscribers': ('subs-only', '1'),
+    '/subscribersoff': ('subs-only', '0'),
+    '/slowoff': ('slow', '0'),
+    '/uniquechat': ('r9k', '1'),
+    '/uniquechatoff': ('r9k', '0'),
+}
+DURATION_MINUTES = {'m': 1, 'h': 60, 'd': 60 * 24, 'w': 60 * 24 * 7,
+                    'mo': 60 * 24 * 30}
+
+
+def follow_minutes(duration):
+    """Convert a /followers duration such as 10m or 1h to minutes
+
+    :param duration: The duration given to the /followers command
+    :type duration: str
+    :return: The duration in minutes
+    :rtype: int
+    """
+    duration = duration.strip()
+    if not duration:
+        return 0
+    number = duration.rstrip('abcdefghijklmnopqrstuvwxyz')
+    unit = duration[len(number):] or 'm'
+    return int(number) * DURATION_MINUTES[unit]
+
+
+class FakeTwitch:
+    """A local stand in for Twitch chat, speaking enough of Twitch's flavour
+    of IRC for the chat bots in obs_sd_controls.  It acknowledges the CAP
+    requests, sends tagged ROOMSTATE messages and changes the chat modes when
+    it receives the chat commands for them.
+
+    :param token: The OAUTH token clients must log in with, leave blank to
+        accept any token
+    :type token: str
+    :param latency: Delay added before every message sent to a client, in
+        seconds
+    :type latency: float
+    :param jitter: Random extra delay, up to this many seconds, added to the
+        latency
+    :type jitter: float
+    :cvar room_tags: The ROOMSTATE tags for every channel, keyed by channel
+    :cvar commands: The chat commands received, as (monotonic time, channel,
+        command) tuples
+    :cvar message_count: The number of messages received
+    :cvar connection_count: The number of connections made
+    """
+
+    def __init__(self, token='', latency=0.0, jitter=0.0):
+        self.token = token
+        self.latency = latency
+        self.jitter = jitter
+        self.room_tags = dict()
+        self.commands = []
+        self.message_count = 0
+        self.connection_count = 0
+        self.clients = dict()
+        self.server = None
+        self.port = None
+        self.received = None
+
+    async def start(self, port=0):
+        """Start listening on localhost
+
+        :param port: The port to listen on, 0 picks a free port
+        :type port: int
+        """
+        self.received = asyncio.Condition()
+        self.server = await asyncio.start_server(self._handler, 'localhost',
+                                                 port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        """Stop the server and drop all clients"""
+        self.server.close()
+        self.drop_clients()
+        await self.server.wait_closed()
+
+    def drop_clients(self):
+        """Close every client connection, as if Twitch had dropped them"""
+        for writer in list(self.clients):
+            writer.close()
+
+    async def wait_for_commands(self, count):
+        """Wait until at least this many chat commands have been received
+
+        :param count: The number of commands to wait for
+        :type count: int
+        """
+        await self.wait_for(lambda: len(self.commands) >= count)
+
+    async def wait_for(self, predicate):
+        """Wait until the predicate is true, checking it every time a chat
+        command has been received and the chat modes updated
+
+        :param predicate: A function that takes no arguments
+        :type predicate: function
+        """
+        async with self.received:
+            await self.received.wait_for(predicate)
+
+    async def _delay(self):
+        delay = self.latency
+        if self.jitter:
+            delay += random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+
+    async def _send(self, writer, line):
+        await self._delay()
+        if writer.is_closing():
+            return
+        try:
+            writer.write(line.encode() + b'\r\n')
+            await writer.drain()
+        except ConnectionError:
+            # Like Twitch, carry on with whatever the client sent before it
+            # went away
+            pass
+
+    async def _handler(self, reader, writer):
+        self.connection_count += 1
+        client = {'nick': None, 'password': None, 'channels': set()}
+        self.clients[writer] = client
+        # Read ahead of handling the messages, so that everything a client
+        # sent before it went away is still handled, even when a reply to it
+        # resets the connection
+        lines = asyncio.Queue()
+        read_task = asyncio.create_task(self._read_lines(reader, lines))
+        try:
+            while True:
+                line = await lines.get()
+                if line is None:
+                    break
+                self.message_count += 1
+                await self._message(writer, client, line)
+        finally:
+            read_task.cancel()
+            self.clients.pop(writer, None)
+            writer.close()
+
+    @staticmethod
+    async def _read_lines(reader, lines):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                lines.put_nowait(line.decode().rstrip('\r\n'))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            lines.put_nowait(None)
+
+    async def _message(self, writer, client, line):
+        command, _, params = line.partition(' ')
+        command = command.upper()
+        if command == 'PASS':
+            client['password'] = params
+        elif command == 'NICK':
+            client['nick'] = params.lower()
+            if self.token and client['password'] != f"oauth:{self.token}":
+                await self._send(writer, ':tmi.twitch.tv NOTICE * '
+                                         ':Login authentication failed')
+                writer.close()
+                return
+            for number, text in (('001', 'Welcome, GLHF!'),
+                                 ('002', 'Your host is tmi.twitch.tv'),
+                                 ('003', 'This server is rather new'),
+                                 ('004', '-'),
+                                 ('375', '-'),
+                                 ('372', "You are in a maze of twisty "
+                                         "passages, all alike."),
+                                 ('376', '>')):
+                await self._send(writer, f":tmi.twitch.tv {number} "
+                                         f"{client['nick']} :{text}")
+        elif command == 'CAP':
+            _, _, capability = params.partition(' ')
+            await self._send(writer, f":tmi.twitch.tv CAP * ACK {capability}")
+        elif command == 'JOIN':
+            for channel in params.split(','):
+                channel = channel.strip().lower()
+                if not channel.startswith('#'):
+                    channel = f"#{channel}"
+                client['channels'].add(channel)
+                tags = self.room_tags.setdefault(channel,
+                                                 dict(DEFAULT_ROOM_TAGS))
+                nick = client['nick']
+                await self._send(writer, f":{nick}!{nick}@{nick}.tmi.twitch"
+                                         f".tv JOIN {channel}")
+                await self._send(writer, self._roomstate(channel, tags))
+        elif command == 'PING':
+            await self._send(writer, f":tmi.twitch.tv PONG tmi.twitch.tv "
+                                     f"{params}")
+        elif command == 'PRIVMSG':
+            channel, _, text = params.partition(' :')
+            await self._chat(channel.lower(), text)
+        elif command == 'QUIT':
+            writer.close()
+
+    @staticmethod
+    def _roomstate(channel, tags):
+        tag_text = ';'.join(f"{key}={value}" for key, value in tags.items())
+        return f"@{tag_text} :tmi.twitch.tv ROOMSTATE {channel}"
+
+    async def _chat(self, channel, text):
+        if not text.startswith('/'):
+            return
+        self.commands.append((time.monotonic(), channel, text))
+        reply = self._command(channel, text)
+        # Waiters are woken once the chat modes have been updated, which is
+        # when they take effect for everyone in chat, without waiting for the
+        # reply to get to the clients
+        async with self.received:
+            self.received.notify_all()
+        await self._broadcast(channel, reply)
+
+    def _command(self, channel, text):
+        """Run a chat command
+
+        :return: The line to send to everyone in the channel in reply
+        :rtype: str
+        """
+        name, _, args = text.partition(' ')
+        tags = self.room_tags.setdefault(channel, dict(DEFAULT_ROOM_TAGS))
+        if name in MODE_COMMANDS:
+            key, value = MODE_COMMANDS[name]
+        elif name == '/followers':
+            key, value = 'followers-only', str(follow_minutes(args))
+        elif name == '/slow':
+            key, value = 'slow', args.strip() or '30'
+        elif name == '/clear':
+            return f"@room-id={tags['room-id']};" \
+                   f"tmi-sent-ts={int(time.time() * 1000)} " \
+                   f":tmi.twitch.tv CLEARCHAT {channel}"
+        elif name == '/commercial':
+            length = args.strip() or '30'
+            return f":tmi.twitch.tv NOTICE {channel} :Initiating {length} " \
+                   f"second commercial break."
+        else:
+            return f":tmi.twitch.tv NOTICE {channel} :Unrecognized command: " \
+                   f"{name}"
+        if tags.get(key) == value:
+            return f":tmi.twitch.tv NOTICE {channel} :This room is already " \
+                   f"in that mode."
+        tags[key] = value
+        # Twitch only sends the tag that changed
+        update = dict([('room-id', tags['room-id']), (key, value)])
+        return self._roomstate(channel, update)
+
+    async def _broadcast(self, channel, line):
+        for writer, client in list(self.clients.items()):
+            if channel in client['channels']:
+                await self._send(writer, line)
+
+
+def start_in_thread(fake, port=6667):
+    """Run the fake server on its own event loop in a daemon thread, so it
+    can be used by the chat bots
+
+    :param fake: The fake server
+    :type fake: FakeTwitch
+    :param port: The port to listen on
+    :type port: int
+    :return: The event loop the server is running on
+    :rtype: asyncio.AbstractEventLoop
+    """
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    asyncio.run_coroutine_threadsafe(fake.start(port), loop).result()
+    return loop
+
+
+async def run_forever(fake):
+    """Run the fake server until interrupted, printing its address
+
+    :param fake: The fake server
+    :type fake: FakeTwitch
+    """
+    await fake.start(6667)
+    print(f"Fake Twitch chat listening on localhost:{fake.port}")
+    await asyncio.Future()
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(run_forever(FakeTwitch()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,98 @@
+"""Measure the import cost of each obs-streamdeck-ctl action.
+
+Every action is run in a fresh interpreter with ``python -X importtime``
+against a throwaway config, the same way the Stream Deck launches it, and the
+modules it imported are checked against the ones that only the setup wizard
+and the Twitch actions need.  OBS doesn't need to be running, the imports have
+all happened by the time the connection is refused.
+
+    python benchmarks/import_time.py [ACTION ...]
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+# Modules that only the setup wizard and the Twitch features should load
+WIZARD_MODULES = ('tkinter', '_tkinter', 'http.server', 'webbrowser',
+                  'obs_sd_controls.config_mgmt')
+IRC_MODULES = ('irc', 'irc.bot', 'irc.client', 'obs_sd_controls.twitch_controls')
+# Which of the above each action is expected to leave out
+FORBIDDEN = {
+    'mute_mic': WIZARD_MODULES + IRC_MODULES,
+    'mute_desk': WIZARD_MODULES + IRC_MODULES,
+    'mute_all': WIZARD_MODULES + IRC_MODULES,
+    'scene 1': WIZARD_MODULES + IRC_MODULES,
+    'start_stop': WIZARD_MODULES,
+    'live_safety': WIZARD_MODULES,
+}
+CONFIG = """[obs]
+ws_password =
+mic_source = Mic/Aux
+desktop_source = Desktop Audio
+alert_sources = alerts
+
+[obs_browser_sources]
+alerts = http://localhost/alerts
+"""
+
+
+def parse_importtime(stderr):
+    """Parse the output of python -X importtime
+
+    :param stderr: The stderr output from the interpreter
+    :type stderr: str
+    :return: The self import time, in microseconds, for each module
+    :rtype: dict
+    """
+    modules = dict()
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = int(self_us)
+    return modules
+
+
+def measure(action, env):
+    """Run an action with -X importtime and collect the imported modules
+
+    :param action: The action and its arguments
+    :type action: str
+    :param env: The environment for the interpreter
+    :type env: dict
+    :return: The self import time, in microseconds, for each module
+    :rtype: dict
+    """
+    cmd = [sys.executable, '-X', 'importtime', '-m',
+           'obs_sd_controls.cli_entry'] + action.split()
+    result = subprocess.run(cmd, env=env, capture_output=True, text=True,
+                            timeout=60)
+    return parse_importtime(result.stderr)
+
+
+def main(actions):
+    with tempfile.TemporaryDirectory() as tmp:
+        config_dir = os.path.join(tmp, 'obs-streamdeck-ctl')
+        os.makedirs(config_dir)
+        with open(os.path.join(config_dir, 'obs-streamdeck.ini'), 'w') as f:
+            f.write(CONFIG)
+        # Point the config at the throwaway file, and make sure any running
+        # daemon isn't used
+        env = dict(os.environ, XDG_CONFIG_HOME=tmp, XDG_RUNTIME_DIR=tmp)
+        failed = False
+        for action in actions:
+            modules = measure(action, env)
+            loaded = [x for x in FORBIDDEN.get(action, ()) if x in modules]
+            print(json.dumps({'action': action,
+                              'modules': len(modules),
+                              'import_ms': round(sum(modules.values()) /
+                                                 1000, 1),
+                              'unexpected': loaded}))
+            failed = failed or bool(loaded)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:] or list(FORBIDDEN)))
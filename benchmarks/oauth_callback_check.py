@@ -0,0 +1,163 @@
+"""Check that the Twitch OAuth callback server used by the setup wizard
+closes cleanly, and measure how quickly it answers the web browser.
+
+The server is run over and over, the way the wizard runs it each time Next is
+pressed on the Twitch page: receiving the tokens, cancelled straight away and
+part way through, and timing out.  The threads and open files of the process
+are counted before and after, and after every run the port must refuse
+connections.  Exits with an error if anything is left open.
+
+    python benchmarks/oauth_callback_check.py [--runs N]
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import CancelledError
+from obs_sd_controls.oauth_callback import OAuthCallbackServer
+from obs_sd_controls.obs_controls import submit
+
+TOKENS = {'#access_token': 'abc', 'scope': 'channel:moderate chat:edit '
+          'chat:read channel_commercial channel_editor',
+          'token_type': 'bearer'}
+
+
+def open_files():
+    """The number of open file descriptors, where the platform shows them"""
+    try:
+        return len(os.listdir('/proc/self/fd'))
+    except FileNotFoundError:
+        return None
+
+
+def port_closed(port):
+    try:
+        socket.create_connection(('127.0.0.1', port), 1).close()
+    except ConnectionRefusedError:
+        return True
+    return False
+
+
+def start(timeout=10):
+    """Start a server on a free port
+
+    :return: The server, the future for its result, and its redirect URI
+    :rtype: tuple
+    """
+    listening = threading.Event()
+    uris = []
+
+    def on_listening(uri):
+        uris.append(uri)
+        listening.set()
+
+    server = OAuthCallbackServer(port=0, timeout=timeout)
+    future = submit(server.serve(on_listening))
+    if not listening.wait(5):
+        raise TimeoutError('The server did not start')
+    return server, future, uris[0]
+
+
+def request(url, data=None):
+    """Make a request, returning the status and time taken"""
+    start_time = time.perf_counter()
+    req = urllib.request.Request(url, data=data, headers={
+        'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(req, timeout=5) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as exc:
+        status = exc.code
+    return status, time.perf_counter() - start_time
+
+
+def tokens_run(times):
+    """Load the pages and post the tokens back, like thanks.js"""
+    server, future, uri = start()
+    for path, expected in (('/', 200), ('/thanks.js', 200),
+                           ('/favicon.ico', 404)):
+        status, elapsed = request(uri + path)
+        if status != expected:
+            raise RuntimeError(f"GET {path} returned {status}")
+        if expected == 200:
+            times.append(elapsed)
+    status, _ = request(uri + '/', json.dumps(TOKENS).encode())
+    if status != 202 or future.result(5) != TOKENS:
+        raise RuntimeError('The tokens were not received')
+    return server
+
+
+def cancel_run(times, delay=0.0):
+    """Cancel the wait, as the wizard's Cancel button does"""
+    server, future, uri = start()
+    if delay:
+        time.sleep(delay)
+    future.cancel()
+    try:
+        future.result(5)
+    except CancelledError:
+        pass
+    # Cancelling the future only asks the event loop to stop the server
+    deadline = time.monotonic() + 5
+    while server.server is not None and time.monotonic() < deadline:
+        time.sleep(0.001)
+    return server
+
+
+def timeout_run(times):
+    """Nobody comes back from Twitch"""
+    server, future, uri = start(timeout=0.05)
+    try:
+        future.result(5)
+    except TimeoutError:
+        pass
+    return server
+
+
+async def noop():
+    pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=50,
+                        help='Times to run the server for each way it ends')
+    args = parser.parse_args()
+    # Start the shared event loop first, so its thread isn't counted
+    submit(noop()).result()
+    threads = threading.active_count()
+    files = open_files()
+    failed = False
+    for name, func in (('tokens', tokens_run), ('cancel', cancel_run),
+                       ('cancel_waiting', lambda x: cancel_run(x, 0.01)),
+                       ('timeout', timeout_run)):
+        times = []
+        left_open = 0
+        for _ in range(args.runs):
+            server = func(times)
+            if server.server is not None or not port_closed(server.port):
+                left_open += 1
+        result = dict([('check', name), ('runs', args.runs),
+                       ('left_open', left_open),
+                       ('thread_growth', threading.active_count() - threads)])
+        if files is not None:
+            result['file_growth'] = open_files() - files
+        if times:
+            result['get_median_ms'] = round(statistics.median(times) * 1000,
+                                            3)
+        if left_open or result['thread_growth'] or \
+                result.get('file_growth', 0) > 0:
+            failed = True
+        print(json.dumps(result), flush=True)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
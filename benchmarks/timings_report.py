@@ -0,0 +1,89 @@
+"""Summarise the timings log written by obs-streamdeck-ctl --timings, with the
+p50 and p99 of each action and each of its phases.
+
+Reads the current log and the rotated ones, or the files given.
+
+    python benchmarks/timings_report.py [LOG ...]
+"""
+import argparse
+import glob
+import json
+import os
+from collections import defaultdict
+from appdirs import user_log_dir
+
+
+def percentile(values, pct):
+    """The nearest rank percentile of the values
+
+    :param values: The values, in any order
+    :type values: list
+    :param pct: The percentile, from 0 to 100
+    :type pct: float
+    :rtype: float
+    """
+    values = sorted(values)
+    rank = max(int(round(pct / 100 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def read_entries(files):
+    """Read the log entries, skipping any line that isn't valid JSON
+
+    :param files: The log files
+    :type files: list
+    :return: The log entries
+    :rtype: list
+    """
+    entries = []
+    for file in files:
+        with open(file) as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue
+    return entries
+
+
+def summary(name, values):
+    return dict([('name', name), ('count', len(values)),
+                 ('p50_ms', round(percentile(values, 50), 3)),
+                 ('p99_ms', round(percentile(values, 99), 3))])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('logs', nargs='*')
+    args = parser.parse_args()
+    files = args.logs
+    if not files:
+        log = os.path.join(user_log_dir('obs-streamdeck-ctl', 'djnrrd'),
+                           'timings.jsonl')
+        files = sorted(glob.glob(f"{log}*"))
+    by_action = defaultdict(list)
+    for entry in read_entries(files):
+        by_action[entry['action']].append(entry)
+    for action, entries in sorted(by_action.items()):
+        phases = defaultdict(list)
+        for entry in entries:
+            # A phase can happen more than once in an invocation, so add
+            # them up
+            totals = defaultdict(float)
+            for phase in entry['phases']:
+                totals[phase['name']] += phase['ms']
+            for name, ms in totals.items():
+                phases[name].append(ms)
+        result = summary(action, [x['total_ms'] for x in entries])
+        result['failed'] = len([x for x in entries if not x['ok']])
+        startup = [x['startup_ms'] for x in entries
+                   if x['startup_ms'] is not None]
+        if startup:
+            result['startup_p50_ms'] = round(percentile(startup, 50), 3)
+        result['phases'] = [summary(name, values)
+                            for name, values in phases.items()]
+        print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""Check that the setup wizard's main loop keeps handling events while it
+waits on a slow OBS.
+
+A timer is scheduled with after() every few milliseconds, and the gaps
+between its ticks are measured while the sources are fetched from the fake
+obs-websocket server, slowed down with a delay on every request.  The fetch
+is made straight from the main loop, the way the wizard used to, and with
+the BackgroundTask the wizard uses now, which is also cancelled part way
+through to check the loop carries on without it.  Exits with an error if the
+main loop stalls while the BackgroundTask runs.
+
+Without a display, Tk can't start, so the check runs on a Tcl interpreter
+instead, which has the same event loop and after().
+
+    python benchmarks/wizard_responsiveness.py [--delay SECONDS]
+"""
+import argparse
+import json
+import sys
+import time
+import tkinter as tk
+from fake_obs import FakeObs, start_in_thread
+from obs_sd_controls.config_mgmt import BackgroundTask
+from obs_sd_controls.obs_controls import get_all_sources
+
+PASSWORD = 'benchmark'
+TICK_MS = 10
+
+
+class Ticker:
+    """Count the after() ticks, and the gaps between them, until stopped"""
+
+    def __init__(self, interp):
+        self.interp = interp
+        self.times = []
+        self.running = True
+        self.interp.after(TICK_MS, self.tick)
+
+    def tick(self):
+        self.times.append(time.perf_counter())
+        if self.running:
+            self.interp.after(TICK_MS, self.tick)
+
+    def result(self, start, end):
+        times = [start] + [x for x in self.times if start < x < end] + [end]
+        gaps = [y - x for x, y in zip(times, times[1:])]
+        return dict([('ticks', len(times) - 2),
+                     ('max_gap_ms', round(max(gaps) * 1000, 1))])
+
+
+def make_interp():
+    """A hidden Tk window, or a Tcl interpreter if there's no display
+
+    :rtype: tuple
+    """
+    try:
+        interp = tk.Tk()
+        interp.withdraw()
+        return interp, 'tk'
+    except tk.TclError:
+        return tk.Tcl(), 'tcl'
+
+
+def run_until(interp, check, timeout):
+    """Run the event loop until check() is True"""
+    deadline = time.monotonic() + timeout
+    while not check():
+        if time.monotonic() > deadline:
+            raise TimeoutError('The event loop timed out')
+        interp.tk.dooneevent(0)
+
+
+def blocking(interp, port, timeout):
+    """Fetch the sources straight from a main loop callback"""
+    ticker = Ticker(interp)
+    span = []
+
+    def fetch():
+        span.append(time.perf_counter())
+        get_all_sources(PASSWORD, 'localhost', port)
+        span.append(time.perf_counter())
+
+    interp.after(0, fetch)
+    run_until(interp, lambda: len(span) == 2, timeout)
+    ticker.running = False
+    return ticker.result(*span)
+
+
+def background(interp, port, timeout, cancel_after=None):
+    """Fetch the sources with a BackgroundTask, cancelling it after
+    cancel_after seconds if given
+    """
+    ticker = Ticker(interp)
+    results = []
+    task = BackgroundTask(interp, get_all_sources, PASSWORD, 'localhost',
+                          port, on_done=results.append,
+                          on_error=results.append)
+    start = time.perf_counter()
+    task.start()
+    if cancel_after is None:
+        run_until(interp, lambda: task.finished, timeout)
+        if isinstance(results[0], Exception):
+            raise results[0]
+    else:
+        run_until(interp, lambda: time.perf_counter() - start > cancel_after,
+                  timeout)
+        task.cancel()
+        # Keep the loop going for as long as the fetch would have taken, to
+        # show nothing comes back from it
+        run_until(interp, lambda: time.perf_counter() - start > timeout / 2,
+                  timeout)
+        if results:
+            raise RuntimeError('A cancelled task passed on its result')
+    end = time.perf_counter()
+    ticker.running = False
+    return ticker.result(start, end)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--delay', type=float, default=0.5,
+                        help='Delay added by the fake server to every '
+                             'request, in seconds')
+    args = parser.parse_args()
+    fake = FakeObs(password=PASSWORD, request_delays=dict(
+        [('GetInputList', args.delay)]))
+    start_in_thread(fake, 0)
+    interp, kind = make_interp()
+    timeout = args.delay * 4 + 5
+    failed = False
+    for name, func, kwargs in (
+            ('blocking', blocking, dict()),
+            ('background', background, dict()),
+            ('background_cancelled', background,
+             dict(cancel_after=args.delay / 4))):
+        result = dict([('check', name), ('interp', kind),
+                       ('delay', args.delay)])
+        result.update(func(interp, fake.port, timeout, **kwargs))
+        # The loop should never go much longer than a tick and a poll of the
+        # task between events
+        result['responsive'] = result['max_gap_ms'] < \
+            TICK_MS + BackgroundTask.poll_ms + 50
+        if name != 'blocking' and not result['responsive']:
+            failed = True
+        print(json.dumps(result), flush=True)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,505 @@
+import asyncio
+import shlex
+from .cli_entry import _add_args, raise_half_errors, alert_source_urls, \
+    request_args, obs_targets
+from .config_file import DEFAULT_OBS_TARGET
+from .obs_controls import ObsSessionPool, ObsRequestError, EVENTS_CONFIG, \
+    EVENTS_SCENES, RESOURCE_NOT_FOUND, ws_toggle_mutes, ws_set_mutes, \
+    ws_start_stop_stream, ws_set_stream, ws_toggle_browser_sources, \
+    ws_set_browser_sources, mute_requests, browser_source_requests, run_sync
+# The Twitch chat session is only imported when a step needs it, so a macro
+# that only talks to OBS doesn't load the IRC libraries
+
+# Actions that can't be a macro step
+NOT_STEPS = ('setup', 'daemon', 'watch', 'macro')
+
+
+def parse_macro(steps):
+    """Parse the steps of a macro.  Each step is written the same way as the
+    obs-streamdeck-ctl arguments for the action, e.g. ``scene 3`` or
+    ``mute_mic --on``.  ``delay SECONDS`` waits before the next step, and
+    actions joined with ``&`` are run at the same time.  An ``&`` inside
+    quotes, such as in the JSON for a raw step, is part of the action.
+
+    :param steps: The steps of the macro, one per line
+    :type steps: tuple
+    :return: The actions for each step, as (step text, arguments) pairs
+    :rtype: list
+    """
+    parser = _add_args()
+    parsed = []
+    for step in steps:
+        actions = []
+        for words in _split_step(step):
+            text = ' '.join(shlex.quote(x) for x in words)
+            if words and words[0] == 'delay' and len(words) == 2:
+                try:
+                    actions.append((text, dict([('action', 'delay'),
+                                                ('seconds',
+                                                 float(words[1]))])))
+                    continue
+                except ValueError:
+                    pass
+            try:
+                arg = vars(parser.parse_args(words))
+            except SystemExit:
+                # argparse exits on bad arguments, after printing the usage
+                arg = None
+            if arg is None or arg['action'] in NOT_STEPS:
+                raise ValueError(f"Invalid macro step: {text or step}")
+            actions.append((text, arg))
+        parsed.append(actions)
+    return parsed
+
+
+def _split_step(step):
+    """Split a macro step into the words of each action, on every ``&`` that
+    isn't quoted
+
+    :param step: The text of the step
+    :type step: str
+    :return: The words of each action
+    :rtype: list
+    """
+    lexer = shlex.shlex(step, posix=True, punctuation_chars='&')
+    lexer.whitespace_split = True
+    actions = [[]]
+    for word in lexer:
+        if word == '&':
+            actions.append([])
+        else:
+            actions[-1].append(word)
+    return actions
+
+
+class ActionRunner:
+    """Run actions over a single session with each OBS target and, if a chat
+    safety feature needs it, a single Twitch chat session.  Used by the daemon
+    for every action it's forwarded, and on the command line to run a macro
+    or an action on several OBS targets in one go.
+
+    :param settings: The parsed config
+    :type settings: Settings
+    :cvar settings: The parsed config
+    :cvar pool: The sessions with the OBS targets, each with a scene cache
+        kept up to date by OBS events and the responses to recent read only
+        requests
+    :cvar chat: The Twitch chat session, once started
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        # Receive the events that keep the scene caches up to date
+        self.pool = ObsSessionPool(settings.obs.targets,
+                                   EVENTS_SCENES | EVENTS_CONFIG)
+        self.chat = None
+
+    async def get_session(self, target=DEFAULT_OBS_TARGET):
+        """Return the session with an OBS target, connecting and identifying
+        again if the connection has been lost
+
+        :param target: The name of the target
+        :type target: str
+        :return: The identified session
+        :rtype: ObsSession
+        """
+        return await self.pool.get(target)
+
+    def target_names(self, arg):
+        """The names of the OBS targets to run an action on
+
+        :param arg: The command line arguments for the action
+        :type arg: dict
+        :rtype: list
+        """
+        return [name for name, _ in obs_targets(self.settings,
+                                                arg.get('target'))]
+
+    def start_chat(self):
+        """Start the Twitch chat session in the background, if it hasn't
+        already been started
+
+        :return: The chat session
+        :rtype: TwitchChatSession
+        """
+        if self.chat is None:
+            twitch = self.settings.twitch
+            if twitch is None:
+                raise ValueError('Twitch chat has not been configured')
+            from .twitch_controls import TwitchChatSession
+            self.chat = TwitchChatSession(twitch.channel, twitch.oauth_token,
+                                          twitch.irc_host, twitch.irc_port)
+            self.chat.start_background()
+        return self.chat
+
+    async def close(self):
+        """Disconnect from OBS and leave Twitch chat"""
+        await self.pool.close()
+        if self.chat:
+            self.chat.stop()
+
+    async def do_action(self, arg):
+        """Check the arguments and run the appropriate action
+
+        :param arg: The command line arguments for the action
+        :type arg: dict
+        :return: The response data from OBS for the raw and custom actions,
+            keyed by the target name if there's more than one OBS target
+        :rtype: dict
+        """
+        settings = self.settings
+        action = arg['action']
+        targets = self.target_names(arg)
+        if action == 'live_safety':
+            engage = arg.get('engage')
+            await self.run_halves(self.toggle_alert_sources(targets, engage),
+                                  self.chat_safety(settings.live_safety,
+                                                   engage))
+        elif action == 'start_stop':
+            stream = arg.get('stream')
+            if stream is None:
+                obs_half = self.obs(targets, ws_start_stop_stream)
+                target = None
+            else:
+                obs_half = self.obs(targets, ws_set_stream, stream)
+                # The chat safety modes are engaged while we're offline
+                target = not stream
+            await self.run_halves(obs_half,
+                                  self.chat_safety(settings.start_stop_safety,
+                                                   target))
+        elif action in ('mute_mic', 'mute_desk', 'mute_all'):
+            if arg.get('mute') is None:
+                await self.obs(targets, ws_toggle_mutes,
+                               self.mute_sources(action))
+            else:
+                await self.obs(targets, ws_set_mutes,
+                               self.mute_sources(action), arg['mute'])
+        elif action == 'scene':
+            await self.obs(targets, self.set_scene_number,
+                           arg['scene_number'])
+        elif action in ('raw', 'custom'):
+            return await self.obs(targets, self.cached_request,
+                                  *request_args(settings, arg))
+        elif action == 'delay':
+            await asyncio.sleep(arg['seconds'])
+        elif action == 'macro':
+            await self.run_macro(arg['name'], arg.get('target'))
+        else:
+            raise ValueError(f"Can not run the {action} action")
+
+    def mute_sources(self, action):
+        """The audio sources for one of the mute actions
+
+        :param action: mute_mic, mute_desk or mute_all
+        :type action: str
+        :return: The OBS audio sources
+        :rtype: tuple
+        """
+        mic, desktop = self.settings.obs.mic_source, \
+            self.settings.obs.desktop_source
+        return dict([('mute_mic', (mic, )), ('mute_desk', (desktop, )),
+                     ('mute_all', (desktop, mic))])[action]
+
+    async def obs(self, targets, ws_func, *args):
+        """Run one of the obs_controls ws_ coroutines over the open session
+        with each OBS target at the same time.  A failure on one target does
+        not stop the others.
+
+        :param targets: The names of the targets
+        :type targets: list
+        :param ws_func: The coroutine function to run, which takes the session
+            as its last argument
+        :type ws_func: function
+        :return: The result from the coroutine, keyed by the target name if
+            there's more than one target
+        """
+        results = await self.pool.fan_out(targets, ws_func, *args)
+        errors = dict([(name, result) for name, result in results.items()
+                       if isinstance(result, Exception)])
+        if len(results) == 1:
+            # A single target fails with its own error
+            if errors:
+                raise list(errors.values())[0]
+            return list(results.values())[0]
+        raise_half_errors(errors)
+        return results
+
+    async def set_scene_number(self, scene_number, session):
+        """Set the current scene by its number, with the scene cache for the
+        OBS target the session is with
+
+        :param scene_number: The scene number to make active
+        :type scene_number: int
+        :param session: An open session from the pool
+        :type session: ObsSession
+        """
+        scene_cache = self.pool.scene_caches[self.pool.target_name(session)]
+        await scene_cache.set_scene_number(scene_number, session)
+
+    async def cached_request(self, request_type, data, cache_ttl, session):
+        """Make a request, with the response cache for the OBS target the
+        session is with
+
+        :param request_type: The obs-websocket request type
+        :type request_type: str
+        :param data: The request data, if any
+        :type data: dict
+        :param cache_ttl: How long the response can be cached for, in
+            seconds
+        :type cache_ttl: float
+        :param session: An open session from the pool
+        :type session: ObsSession
+        :return: The response data from OBS
+        :rtype: dict
+        """
+        response_cache = \
+            self.pool.response_caches[self.pool.target_name(session)]
+        return await response_cache.call(request_type, data, cache_ttl,
+                                         session)
+
+    @staticmethod
+    async def run_halves(obs_half, twitch_half):
+        """Run the OBS and Twitch halves of an action at the same time, a
+        failure in one half does not stop the other
+
+        :param obs_half: The coroutine for the OBS half of the action
+        :type obs_half: coroutine
+        :param twitch_half: The coroutine for the Twitch half of the action
+        :type twitch_half: coroutine
+        """
+        results = await asyncio.gather(obs_half, twitch_half,
+                                       return_exceptions=True)
+        raise_half_errors(dict([(half, result) for half, result
+                                in zip(('OBS', 'Twitch'), results)
+                                if isinstance(result, Exception)]))
+
+    async def toggle_alert_sources(self, targets, engage=None):
+        """Swap the alert sources between invalid.lan and their configured
+        URLs
+
+        :param targets: The names of the OBS targets
+        :type targets: list
+        :param engage: True to set the alert sources to invalid.lan and False
+            to set them to their configured URLs.  None swaps them
+        :type engage: bool
+        """
+        source_urls = alert_source_urls(self.settings)
+        if engage is None:
+            await self.obs(targets, ws_toggle_browser_sources, source_urls)
+        else:
+            await self.obs(targets, ws_set_browser_sources, source_urls,
+                           not engage)
+
+    async def chat_safety(self, safety, target=None):
+        """Send the chat safety commands over the Twitch chat session
+
+        :param safety: The chat safety settings for the action, None if they
+            haven't been set up
+        :type safety: SafetySettings
+        :param target: True to switch the safety modes on and False to switch
+            them off.  None toggles them
+        :type target: bool
+        """
+        if safety is None:
+            return
+        chat = self.start_chat()
+        from .twitch_controls import safety_commands, live_commands
+
+        def chat_commands(room_state):
+            # The live commands are only switched on for live_safety
+            return live_commands(room_state, safety.enabled, safety.advert,
+                                 safety.clear_chat, target) + \
+                safety_commands(room_state, safety.enabled, safety.emote_mode,
+                                safety.method, safety.follow_time, target)
+
+        # Wait for the chat session to join in a thread so OBS isn't held up
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, chat.update_chat, chat_commands)
+
+    async def obs_requests(self, arg):
+        """The OBS requests for an action, if it can be sent in a batch with
+        other requests.  Actions that need to read from OBS first, or that
+        have a Twitch half, can't be.
+
+        :param arg: The command line arguments for the action
+        :type arg: dict
+        :return: The requests, as (request_type, data) pairs, or None if the
+            action can't be batched
+        :rtype: list
+        """
+        action = arg['action']
+        if action in ('mute_mic', 'mute_desk', 'mute_all'):
+            return mute_requests(self.mute_sources(action), arg.get('mute'))
+        elif action == 'scene':
+            targets = self.target_names(arg)
+            if len(targets) > 1:
+                # The scene number could be a different scene on each target
+                return None
+            session = await self.get_session(targets[0])
+            scenes = await self.pool.scene_caches[targets[0]].get_scene_names(
+                session)
+            if 1 <= arg['scene_number'] <= len(scenes):
+                return [('SetCurrentProgramScene',
+                         {'sceneName': scenes[arg['scene_number'] - 1]})]
+        elif action in ('raw', 'custom'):
+            return [request_args(self.settings, arg)[:2]]
+        elif action == 'live_safety' and arg.get('engage') is not None and \
+                self.settings.live_safety is None:
+            return browser_source_requests(alert_source_urls(self.settings),
+                                           not arg['engage'])
+        # Starting and stopping the stream fails if it's already in that
+        # state, which would stop the rest of the batch
+        return None
+
+    async def run_macro(self, name, targets=None):
+        """Run the steps of a macro in order.  Steps that only make OBS
+        requests are sent together in a single batch, up to the next step that
+        can't be batched, the next delay, or the next step on other OBS
+        targets.  The macro stops at the first step that fails.
+
+        :param name: The name of the macro, from its [macro:name] section
+        :type name: str
+        :param targets: The names of the OBS targets for the steps that don't
+            have a --target of their own, defaults to the one in the [obs]
+            section
+        :type targets: list
+        """
+        macros = dict(self.settings.macros)
+        if name not in macros:
+            raise ValueError(f"No macro called {name} has been set up")
+        batch = []
+        batch_steps = []
+        batch_targets = None
+        # The scene number for each scene step's request, by its position in
+        # the batch, in case the cached scene list is out of date
+        batch_scenes = dict()
+        for actions in parse_macro(macros[name]):
+            requests = []
+            step_targets = None
+            step_scenes = dict()
+            for text, arg in actions:
+                if arg['action'] == 'delay':
+                    requests = None
+                    break
+                if arg.get('target') is None:
+                    arg['target'] = targets
+                step_requests = await self.obs_requests(arg)
+                # Actions joined with & on different targets can't share a
+                # batch either
+                if step_requests is None or \
+                        step_targets not in (None, self.target_names(arg)):
+                    requests = None
+                    break
+                step_targets = self.target_names(arg)
+                if arg['action'] == 'scene':
+                    step_scenes[len(requests)] = arg['scene_number']
+                requests += step_requests
+            if requests is not None and \
+                    batch_targets in (None, step_targets):
+                batch_scenes.update([(len(batch) + idx, number) for
+                                     idx, number in step_scenes.items()])
+                batch += requests
+                batch_steps += [text for text, arg in actions]
+                batch_targets = step_targets
+                continue
+            await self.run_batch(batch, batch_steps, batch_targets,
+                                 batch_scenes)
+            batch, batch_steps, batch_targets = [], [], None
+            batch_scenes = dict()
+            if requests is not None:
+                # Starts a new batch on its own targets
+                batch = requests
+                batch_steps = [text for text, arg in actions]
+                batch_targets = step_targets
+                batch_scenes = step_scenes
+                continue
+            results = await asyncio.gather(*[self.do_action(arg)
+                                             for text, arg in actions],
+                                           return_exceptions=True)
+            raise_half_errors(dict([(text, result) for (text, arg), result
+                                    in zip(actions, results)
+                                    if isinstance(result, Exception)]))
+        await self.run_batch(batch, batch_steps, batch_targets, batch_scenes)
+
+    async def run_batch(self, requests, steps, targets, scene_numbers=None):
+        """Send the OBS requests for several macro steps in one batch to each
+        OBS target, stopping at the first request that fails
+
+        :param requests: The requests, as (request_type, data) pairs
+        :type requests: list
+        :param steps: The text of the steps the requests are for
+        :type steps: list
+        :param targets: The names of the targets
+        :type targets: list
+        :param scene_numbers: The scene number for each request from a scene
+            step, keyed by its position in requests
+        :type scene_numbers: dict
+        """
+        if not requests:
+            return
+        results = await self.pool.fan_out(targets, self.call_batch, requests,
+                                          scene_numbers or dict())
+        steps = ', '.join(steps)
+        errors = dict([(steps if len(targets) == 1 else f"{name}: {steps}",
+                        result) for name, result in results.items()
+                       if isinstance(result, Exception)])
+        raise_half_errors(errors)
+
+    async def call_batch(self, requests, scene_numbers, session):
+        """Send requests in one batch, stopping at the first that fails.  If
+        OBS can't find the scene for a scene step, the scene list is fetched
+        again and the rest of the batch is sent again from that step, the
+        same as SceneCache does for a single scene step
+
+        :param requests: The requests, as (request_type, data) pairs
+        :type requests: list
+        :param scene_numbers: The scene number for each request from a scene
+            step, keyed by its position in requests
+        :type scene_numbers: dict
+        :param session: An open session from the pool
+        :type session: ObsSession
+        :return: The response data for each request that was sent last, in
+            order
+        :rtype: list
+        """
+        try:
+            return await session.call_batch(requests, halt_on_failure=True)
+        except ObsRequestError as e:
+            if e.code != RESOURCE_NOT_FOUND or e.index not in scene_numbers:
+                raise
+            failed = e.index
+        # The cached list was out of date, fetch it again and retry
+        scene_cache = self.pool.scene_caches[self.pool.target_name(session)]
+        scenes = await scene_cache.get_scene_names(session, refresh=True)
+        retry = []
+        for idx, request in enumerate(requests[failed:], failed):
+            if idx in scene_numbers:
+                # Adjust for zero indexing
+                request = ('SetCurrentProgramScene',
+                           {'sceneName': scenes[scene_numbers[idx] - 1]})
+            retry.append(request)
+        return await session.call_batch(retry, halt_on_failure=True)
+
+
+def run_action(settings, arg):
+    """Run an action over a single session with each of its OBS targets, and
+    with Twitch if it needs it, then disconnect
+
+    :param settings: The parsed config
+    :type settings: Settings
+    :param arg: The command line arguments for the action
+    :type arg: dict
+    :return: The response data from OBS for the raw and custom actions,
+        keyed by the target name if there's more than one OBS target
+    :rtype: dict
+    """
+    runner = ActionRunner(settings)
+
+    async def run():
+        try:
+            return await runner.do_action(arg)
+        finally:
+            await runner.close()
+
+    return run_sync(run())
+
@@ -1,8 +1,44 @@
+# Imported first, so the timings start as early as possible
+from . import timings
 import argparse
-from .obs_controls import mute_audio_source, start_stop_stream, set_scene, \
-    get_source_settings, set_source_settings
-from .config_mgmt import load_config, SetupApp
-from .twitch_controls import start_stop_safety, live_safety
+import json
+import os
+import sys
+import threading
+import time
+from functools import partial
+# Only import what every action needs here.  The Stream Deck starts a new
+# process for every button press, so each action imports the modules it uses
+# itself, rather than everyone paying to load Tk and the IRC libraries.
+from .config_file import load_config, load_settings
+from .daemon_client import forward_action
+
+# How long to wait for the Twitch half of an action before giving up
+TWITCH_TIMEOUT = 15
+
+
+def _add_target_args(parser, dest, on_flag, off_flag, on_help, off_help):
+    """Add a pair of options to set an absolute state for an action, rather
+    than toggling whatever the current state is
+
+    :param parser: The sub parser for the action
+    :type parser: argparse.ArgumentParser
+    :param dest: The name of the attribute to store the state in
+    :type dest: str
+    :param on_flag: The option that sets the state to True
+    :type on_flag: str
+    :param off_flag: The option that sets the state to False
+    :type off_flag: str
+    :param on_help: The help text for the on option
+    :type on_help: str
+    :param off_help: The help text for the off option
+    :type off_help: str
+    """
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument(on_flag, dest=dest, action='store_const', const=True,
+                       help=on_help)
+    group.add_argument(off_flag, dest=dest, action='store_const', const=False,
+                       help=off_help)
 
 
 def _add_args():
@@ -12,27 +48,86 @@ def _add_args():
     :rtype: argparse.ArgumentParser
     """
     parser = argparse.ArgumentParser()
+    parser.add_argument('--timings', action='store_true',
+                        help=f"Record how long each phase of the action "
+                             f"takes in the timings log.  Setting "
+                             f"{timings.ENV_VAR}=1 does the same.  Not "
+                             f"recorded for daemon and watch")
+    parser.add_argument('--target', action='append', metavar='NAME',
+                        help='The OBS to run the action on, from its '
+                             '[obs:NAME] section.  Give it more than once to '
+                             'run the action on several at the same time, '
+                             'or use all for every OBS that has been set up')
     sub_parser = parser.add_subparsers(dest='action', required=True)
-    sub_parser.add_parser('start_stop', description='Start/Stop the stream')
-    sub_parser.add_parser('mute_mic',
-                          description='Mute/Unmute the Microphone source')
-    sub_parser.add_parser('mute_desk',
-                          description='Mute/Unmute the Desktop audio source')
-    sub_parser.add_parser('mute_all',
-                          description='Mute/Unmute both Desktop and Microphone '
-                                      'sources')
-    sub_parser.add_parser('live_safety',
-                          description='Disable/Enable alert sources in OBS '
-                                      'and lockdown Twitch chat in case of '
-                                      'hate raids')
+    start_stop_parser = sub_parser.add_parser('start_stop',
+                                              description='Start/Stop the '
+                                                          'stream')
+    _add_target_args(start_stop_parser, 'stream', '--start', '--stop',
+                     'Start the stream and release the chat safety modes',
+                     'Stop the stream and engage the chat safety modes')
+    mute_parsers = [
+        sub_parser.add_parser('mute_mic',
+                              description='Mute/Unmute the Microphone source'),
+        sub_parser.add_parser('mute_desk',
+                              description='Mute/Unmute the Desktop audio '
+                                          'source'),
+        sub_parser.add_parser('mute_all',
+                              description='Mute/Unmute both Desktop and '
+                                          'Microphone sources')]
+    for mute_parser in mute_parsers:
+        _add_target_args(mute_parser, 'mute', '--on', '--off',
+                         'Mute the source', 'Unmute the source')
+    live_safety_parser = sub_parser.add_parser('live_safety',
+                                               description='Disable/Enable '
+                                                           'alert sources in '
+                                                           'OBS and lockdown '
+                                                           'Twitch chat in '
+                                                           'case of hate '
+                                                           'raids')
+    _add_target_args(live_safety_parser, 'engage', '--engage', '--release',
+                     'Disable the alert sources and lockdown chat',
+                     'Enable the alert sources and release chat')
     scene_parser = sub_parser.add_parser('scene',
                                          description='Switch between scenes in '
                                                      'OBS')
     scene_parser.add_argument('scene_number', type=int,
                               help='The scene number to select (from the top '
                                    'down)')
+    raw_parser = sub_parser.add_parser('raw', description='Make any '
+                                                          'obs-websocket '
+                                                          'request and print '
+                                                          'the response')
+    raw_parser.add_argument('request_type', help='The request type, e.g. '
+                                                 'GetVersion')
+    raw_parser.add_argument('data', nargs='?', help='The request data, as a '
+                                                    'JSON object')
+    raw_parser.add_argument('--cache-ttl', type=float,
+                            help='How long the daemon can cache the '
+                                 'response to a Get request for, in seconds')
+    custom_parser = sub_parser.add_parser('custom',
+                                          description='Make the request for '
+                                                      'a custom button from '
+                                                      'the config file and '
+                                                      'print the response')
+    custom_parser.add_argument('name', help='The name of the button, from its '
+                                            '[custom:name] section')
+    macro_parser = sub_parser.add_parser('macro',
+                                         description='Run the steps of a '
+                                                     'macro from the config '
+                                                     'file in one go')
+    macro_parser.add_argument('name', help='The name of the macro, from its '
+                                           '[macro:name] section')
     sub_parser.add_parser('setup', description='Run the setup wizard to '
                                                'create your configuration file')
+    sub_parser.add_parser('watch', description='Keep files with the current '
+                                               'OBS state up to date, for '
+                                               'Stream Deck plugins to show '
+                                               'on the buttons')
+    sub_parser.add_parser('daemon', description='Run in the background, '
+                                                'keeping OBS and Twitch '
+                                                'connected so that other '
+                                                'actions run without any '
+                                                'start up delay')
     return parser
 
 
@@ -41,61 +136,254 @@ def _do_action(arg):
 
     :param arg: The command line arguments as gathered by argparser
     :type arg: argparse.ArgumentParser
-    :param config: Config details loaded by ConfigParser
-    :type config: ConfigParser
     """
-    config = load_config()
-    if config.has_option('obs', 'ws_password'):
-        ws_password = config['obs']['ws_password']
-    else:
-        ws_password = ''
     if arg.action == 'setup':
-        app = SetupApp(config)
+        # The wizard edits the config itself, so give it the ConfigParser
+        from .config_mgmt import SetupApp
+        app = SetupApp(load_config())
         app.mainloop()
+        return
+    with timings.Span('load_settings'):
+        settings = load_settings()
+    targets = obs_targets(settings, arg.target)
+    if len(targets) > 1 and arg.action not in ('daemon', 'watch'):
+        # Run it on every target at the same time, over a session with each
+        from .actions import run_action
+        print_result(run_action(settings, vars(arg)))
+        return
+    elif len(targets) > 1 and arg.action == 'watch':
+        raise ValueError('Only one OBS can be watched at a time')
+    # Everything below talks to a single OBS, so point the [obs] settings at
+    # the one asked for
+    _, target = targets[0]
+    settings = settings._replace(obs=settings.obs._replace(
+        host=target.host, port=target.port, ws_password=target.ws_password))
+    ws_password = settings.obs.ws_password
+    obs_address = dict([('host', target.host), ('port', target.port)])
+    if arg.action == 'daemon':
+        from .daemon import run_daemon
+        run_daemon(settings)
+    elif arg.action == 'watch':
+        from .watch import run_watch
+        run_watch(settings)
     elif arg.action == 'live_safety':
-        live_safety_button(config, ws_password)
+        live_safety_button(settings, arg.engage)
     elif arg.action == 'start_stop':
-        start_stop(config, ws_password)
+        start_stop(settings, arg.stream)
     elif arg.action == 'mute_mic':
-        mute_audio_source(config['obs']['mic_source'], ws_password)
+        from .obs_controls import mute_audio_source
+        mute_audio_source(settings.obs.mic_source, ws_password, arg.mute,
+                          **obs_address)
     elif arg.action == 'mute_desk':
-        mute_audio_source(config['obs']['desktop_source'], ws_password)
+        from .obs_controls import mute_audio_source
+        mute_audio_source(settings.obs.desktop_source, ws_password, arg.mute,
+                          **obs_address)
     elif arg.action == 'mute_all':
-        for source in (config['obs']['desktop_source'],
-                       config['obs']['mic_source']):
-            mute_audio_source(source, ws_password)
+        from .obs_controls import mute_audio_sources
+        mute_audio_sources((settings.obs.desktop_source,
+                            settings.obs.mic_source), ws_password, arg.mute,
+                           **obs_address)
     elif arg.action == 'scene':
-        set_scene(arg.scene_number, ws_password)
+        from .obs_controls import set_scene
+        set_scene(arg.scene_number, ws_password, **obs_address)
+    elif arg.action in ('raw', 'custom'):
+        from .obs_controls import obs_request
+        request_type, data, _ = request_args(settings, vars(arg))
+        print_result(obs_request(request_type, data, ws_password,
+                                 **obs_address))
+    elif arg.action == 'macro':
+        from .actions import run_action
+        run_action(settings, vars(arg))
     else:
         raise ValueError('Could not find a valid action from the command line '
                          'arguments')
 
 
-def start_stop(config, ws_password):
+def run_halves(obs_half, twitch_half=None, timeout=TWITCH_TIMEOUT):
+    """Run the OBS and Twitch halves of an action at the same time, with the
+    Twitch half in a worker thread, so the action takes as long as the slower
+    of the two rather than both added together.  A failure in one half does
+    not stop the other.
+
+    :param obs_half: The function to run the OBS half of the action
+    :type obs_half: function
+    :param twitch_half: The function to run the Twitch half of the action, if
+        any
+    :type twitch_half: function
+    :param timeout: How long to wait for the Twitch half, in seconds
+    :type timeout: float
+    """
+    errors = dict()
+
+    def run_twitch():
+        try:
+            twitch_half()
+        except SystemExit:
+            # The chat bots exit once they've sent their commands
+            pass
+        except Exception as e:
+            errors['Twitch'] = e
+
+    twitch_thread = None
+    if twitch_half:
+        # A daemon thread, so a Twitch connection that never completes can't
+        # keep the process running
+        twitch_thread = threading.Thread(target=run_twitch, daemon=True)
+        twitch_thread.start()
+    try:
+        obs_half()
+    except Exception as e:
+        errors['OBS'] = e
+    if twitch_thread:
+        twitch_thread.join(timeout)
+        if twitch_thread.is_alive():
+            errors['Twitch'] = TimeoutError('Twitch chat did not respond in '
+                                            'time')
+    raise_half_errors(errors)
+
+
+def raise_half_errors(errors):
+    """Raise a single error reporting the failures from each half of an
+    action
+
+    :param errors: The exceptions raised, keyed by the half of the action
+        they came from, OBS or Twitch
+    :type errors: dict
+    """
+    if errors:
+        messages = [f"{half}: {type(e).__name__}: {e}"
+                    for half, e in sorted(errors.items())]
+        raise RuntimeError('\n'.join(messages))
+
+
+def alert_source_urls(settings):
+    """Get the URL of each alert source when it's enabled
+
+    :param settings: The parsed config
+    :type settings: Settings
+    :return: The URL of each alert source, keyed by the source name
+    :rtype: dict
+    """
+    missing = [x for x, url in settings.obs.alert_urls if url is None]
+    if missing:
+        raise ValueError(f"No URL has been set up for the alert sources "
+                         f"{', '.join(missing)}, please run setup again")
+    return dict(settings.obs.alert_urls)
+
+
+def twitch_settings(settings):
+    """Get the Twitch settings, making sure Twitch has been set up
+
+    :param settings: The parsed config
+    :type settings: Settings
+    :return: The Twitch settings
+    :rtype: TwitchSettings
+    """
+    if settings.twitch is None:
+        raise ValueError('Twitch chat has not been configured')
+    return settings.twitch
+
+
+def obs_targets(settings, names=None):
+    """Get the OBS targets to run an action on
+
+    :param settings: The parsed config
+    :type settings: Settings
+    :param names: The names of the targets from the command line, all for
+        every target.  Defaults to the one in the [obs] section
+    :type names: list
+    :return: The (name, ObsTargetSettings) pair for each target, in the
+        order given
+    :rtype: list
+    """
+    from .config_file import DEFAULT_OBS_TARGET
+    targets = dict(settings.obs.targets)
+    names = names or [DEFAULT_OBS_TARGET]
+    if 'all' in names:
+        names = list(targets)
+    missing = [x for x in names if x not in targets]
+    if missing:
+        raise ValueError(f"No OBS target called {', '.join(missing)} has "
+                         f"been set up")
+    # Once each, even if it was given twice
+    return [(x, targets[x]) for x in dict.fromkeys(names)]
+
+
+def request_args(settings, arg):
+    """Work out the obs-websocket request for the raw and custom actions
+
+    :param settings: The parsed config
+    :type settings: Settings
+    :param arg: The command line arguments for the action
+    :type arg: dict
+    :return: The request type, the request data, and how long the response
+        can be cached for in seconds
+    :rtype: tuple
+    """
+    if arg['action'] == 'custom':
+        custom = dict(settings.custom)
+        if arg['name'] not in custom:
+            raise ValueError(f"No custom button called {arg['name']} has been "
+                             f"set up")
+        request_type, data, cache_ttl = custom[arg['name']]
+        if not request_type:
+            raise ValueError(f"No request has been set up for the custom "
+                             f"button {arg['name']}")
+    else:
+        request_type, data, cache_ttl = arg['request_type'], arg.get('data'), \
+            arg.get('cache_ttl')
+    try:
+        data = json.loads(data) if data else None
+    except ValueError:
+        raise ValueError(f"The data for the {request_type} request is not "
+                         f"valid JSON")
+    if data is not None and not isinstance(data, dict):
+        raise ValueError(f"The data for the {request_type} request must be a "
+                         f"JSON object")
+    if cache_ttl is None:
+        cache_ttl = settings.obs.cache_ttl
+    return request_type, data, cache_ttl
+
+
+def print_result(result):
+    """Print the response data from OBS as JSON, if there is any
+
+    :param result: The response data
+    :type result: dict
+    """
+    if result is not None:
+        print(json.dumps(result, indent=2))
+
+
+def start_stop(settings, stream=None):
     """Start/Stop streaming in OBS and if twitch chat safety features have
     been enabled switch those as well
 
-    :param config: Config details loaded by ConfigParser
-    :type config: ConfigParser
-    :param ws_password: The password for the OBS WebSockets server
-    :type ws_password: str
+    :param settings: The parsed config
+    :type settings: Settings
+    :param stream: True to start the stream and False to stop it, whatever
+        its current state.  None toggles it
+    :type stream: bool
     """
-    start_stop_stream(ws_password)
-    if config.has_option('start_stop_safety', 'enabled'):
-        username = config['twitch']['channel']
-        token = config['twitch']['oauth_token']
-        enabled = eval(config['start_stop_safety']['enabled'])
-        emote_mode = eval(config['start_stop_safety']['emote_mode']) if \
-            config.has_option('start_stop_safety', 'emote_mode') else False
-        method = config['start_stop_safety']['method'] if \
-            config.has_option('start_stop_safety', 'method') else ''
-        follow_time = config['start_stop_safety']['follow_time'] if \
-            config.has_option('start_stop_safety', 'follow_time') else ''
-        start_stop_safety(username, token, enabled, emote_mode, method,
-                          follow_time)
-
-
-def live_safety_button(config, ws_password):
+    from .obs_controls import start_stop_stream
+    safety = settings.start_stop_safety
+
+    def twitch_half():
+        from .twitch_controls import start_stop_safety
+        twitch = twitch_settings(settings)
+        # The chat safety modes are engaged while we're offline
+        start_stop_safety(twitch.channel, twitch.oauth_token, safety.enabled,
+                          safety.emote_mode, safety.method,
+                          safety.follow_time,
+                          None if stream is None else not stream,
+                          twitch.irc_host, twitch.irc_port)
+
+    run_halves(partial(start_stop_stream, settings.obs.ws_password, stream,
+                       settings.obs.host, settings.obs.port),
+               twitch_half if safety else None)
+
+
+def live_safety_button(settings, engage=None):
     """Sadly, people are performing "hate raids" on twitch, raiding channels
     and getting bot accounts to follow the streamer and spam chat with
     hateful messages.
@@ -104,48 +392,73 @@ def live_safety_button(config, ws_password):
     so this function will disable and re-enable those overlays as configured
     in the ini file.  Additionally, chat safety features can be enabled
 
-    :param config: ConfigParser object created in cli_tools
-    :type config: ConfigParser
-    :param ws_password: The password for the OBS WebSockets server
-    :type ws_password: str
+    :param settings: The parsed config
+    :type settings: Settings
+    :param engage: True to disable the alerts and lockdown chat and False to
+        enable and release them, whatever their current state.  None toggles
+        them
+    :type engage: bool
     """
-    for source in config['obs']['alert_sources'].split(':'):
-        # Get the current settings for the alert source from OBS.
-        settings = get_source_settings(source, ws_password)
-        # Swap between invalid.lan and the value from config
-        if settings['url'] == 'http://invalid.lan':
-            settings['url'] = config['obs_browser_sources'][source]
+    from .obs_controls import toggle_browser_sources, set_browser_sources
+    ws_password = settings.obs.ws_password
+    safety = settings.live_safety
+
+    def obs_half():
+        source_urls = alert_source_urls(settings)
+        if engage is None:
+            toggle_browser_sources(source_urls, ws_password, settings.obs.host,
+                                   settings.obs.port)
         else:
-            settings['url'] = 'http://invalid.lan'
-        # Update the settings in OBS
-        set_source_settings(source, settings, ws_password)
-    if config.has_option('live_safety', 'enabled'):
-        username = config['twitch']['channel']
-        token = config['twitch']['oauth_token']
-        # Use eval to make sure the string 'False' is passed as a boolean False
-        enabled = eval(config['live_safety']['enabled'])
-        emote_mode = eval(config['live_safety']['emote_mode']) if \
-            config.has_option('live_safety', 'emote_mode') else False
-        method = config['live_safety']['method'] if \
-            config.has_option('live_safety', 'method') else ''
-        follow_time = config['live_safety']['follow_time'] if \
-            config.has_option('live_safety', 'follow_time') else ''
-        advert = eval(config['additional']['advert']) if \
-            config.has_option('additional', 'advert') else False
-        clear_chat = eval(config['additional']['clear_chat']) if \
-            config.has_option('additional', 'clear_chat') else False
-        live_safety(username, token, enabled, emote_mode, method,
-                    follow_time, advert, clear_chat)
+            # No need to read the current URLs when we know what we want
+            set_browser_sources(source_urls, not engage, ws_password,
+                                settings.obs.host, settings.obs.port)
+
+    def twitch_half():
+        from .twitch_controls import live_safety
+        twitch = twitch_settings(settings)
+        live_safety(twitch.channel, twitch.oauth_token, safety.enabled,
+                    safety.emote_mode, safety.method, safety.follow_time,
+                    safety.advert, safety.clear_chat, engage,
+                    twitch.irc_host, twitch.irc_port)
+
+    run_halves(obs_half, twitch_half if safety else None)
 
 
 def main():
     """Entry point for the console script 'obs-streamdeck-ctl'
     """
+    start = time.monotonic()
     # Get CLI arguments
     parser = _add_args()
     arg = parser.parse_args()
-    # Main functions.
-    _do_action(arg)
+    # The daemon and watch keep running, so their phases would pile up until
+    # they exit and only then be written, all on one line
+    if (arg.timings or os.environ.get(timings.ENV_VAR) == '1') and \
+            arg.action not in ('daemon', 'watch'):
+        timings.enable()
+    timings.record('import', timings.STARTED, start)
+    timings.record('parse_args', start)
+    error = None
+    try:
+        # Hand the action to the daemon if one is running, otherwise run it
+        # here
+        if arg.action not in ('setup', 'daemon', 'watch'):
+            with timings.Span('forward'):
+                response = forward_action(arg)
+            if response is not None:
+                if not response['ok']:
+                    sys.exit(response['error'])
+                print_result(response.get('result'))
+                return
+        # Main functions.
+        _do_action(arg)
+    except BaseException as e:
+        # sys.exit() with no message isn't a failure
+        if not isinstance(e, SystemExit) or e.code:
+            error = e
+        raise
+    finally:
+        timings.write(arg.action, error)
 
 
 if __name__ == '__main__':
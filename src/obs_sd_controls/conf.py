@@ -1,3 +1,7 @@
 CLIENT_ID = 'YOUR CLIENT ID'
 REDIRECT_URI = 'http://localhost:8000'
 VERSION = '0.2.4'
+TWITCH_IRC_HOST = 'irc.twitch.tv'
+TWITCH_IRC_PORT = 6667
+OBS_WS_HOST = 'localhost'
+OBS_WS_PORT = 4455
@@ -0,0 +1,260 @@
+from collections import namedtuple
+from appdirs import user_config_dir
+import json
+import os
+from . import conf
+# configparser is imported when the config is actually parsed, most button
+# presses are served from the settings cache without it
+
+# The config, parsed once into read only settings so that every action gets
+# the right types without converting the strings itself
+Settings = namedtuple('Settings', ('obs', 'twitch', 'start_stop_safety',
+                                   'live_safety', 'macros', 'custom'))
+ObsSettings = namedtuple('ObsSettings', ('ws_password', 'mic_source',
+                                         'desktop_source', 'alert_urls',
+                                         'cache_ttl', 'host', 'port',
+                                         'targets'))
+# The obs-websocket server for each OBS target, such as separate streaming
+# and recording machines
+ObsTargetSettings = namedtuple('ObsTargetSettings', ('host', 'port',
+                                                     'ws_password'))
+TwitchSettings = namedtuple('TwitchSettings', ('channel', 'oauth_token',
+                                               'irc_host', 'irc_port'))
+SafetySettings = namedtuple('SafetySettings', ('enabled', 'emote_mode',
+                                               'method', 'follow_time',
+                                               'advert', 'clear_chat'))
+# The data is kept as the JSON text from the config, and the cache_ttl is None
+# to use the one from the [obs] section
+CustomSettings = namedtuple('CustomSettings', ('request_type', 'data',
+                                               'cache_ttl'))
+# The OBS target set up in the [obs] section, the others come from the
+# [obs:name] sections
+DEFAULT_OBS_TARGET = 'default'
+
+
+def load_config():
+    """Load the config file and return the ConfigParser object
+
+    :return: the ConfigParser object
+    :rtype: ConfigParser
+    """
+    # Attempt to load the config file
+    config_dir = user_config_dir('obs-streamdeck-ctl', 'djnrrd')
+    if not os.path.isdir(config_dir):
+        # On windows appdirs always have to be %appdir%//author//appname so
+        # we have to create the author folder first
+        if not os.path.isdir(os.path.join(user_config_dir(), 'djnrrd')):
+            os.mkdir(os.path.join(user_config_dir(), 'djnrrd'))
+        os.mkdir(config_dir)
+    config_file = os.path.join(config_dir, 'obs-streamdeck.ini')
+    from configparser import ConfigParser
+    config = ConfigParser()
+    config.read(config_file)
+    return config
+
+
+def save_config(config):
+    """Save the config file to the user's local config directory.
+
+    :param config: The ConfigParser object
+    :type config: ConfigParser
+    """
+    config_dir = user_config_dir('obs-streamdeck-ctl', 'djnrrd')
+    config_file = os.path.join(config_dir, 'obs-streamdeck.ini')
+    if not all([os.path.exists(config_dir), os.path.isdir(config_dir)]):
+        os.mkdir(config_dir)
+    with open(config_file, 'w') as f:
+        config.write(f)
+    # Save the parsed settings as well, so the next button press doesn't have
+    # to parse the config again
+    _write_cache(config_file, parse_config(config))
+
+
+def parse_config(config):
+    """Parse the config into Settings, converting every option to the type
+    it's used as
+
+    :param config: Config details loaded by ConfigParser
+    :type config: ConfigParser
+    :return: The parsed settings
+    :rtype: Settings
+    """
+    obs = config['obs'] if config.has_section('obs') else dict()
+    browser_sources = config['obs_browser_sources'] if \
+        config.has_section('obs_browser_sources') else dict()
+    alert_sources = obs['alert_sources'].split(':') if \
+        obs.get('alert_sources') else []
+    # A tuple of (source, URL) pairs, the URL is None if it's missing
+    alert_urls = tuple([(x, browser_sources.get(x)) for x in alert_sources])
+    host = obs.get('host', conf.OBS_WS_HOST)
+    port = config.getint('obs', 'port', fallback=conf.OBS_WS_PORT)
+    # A tuple of (name, ObsTargetSettings) pairs, starting with the default
+    # target from the [obs] section and then the [obs:name] sections
+    targets = [(DEFAULT_OBS_TARGET,
+                ObsTargetSettings(host, port, obs.get('ws_password', '')))]
+    for section in config.sections():
+        name = section.partition(':')[2].strip()
+        if not section.startswith('obs:') or \
+                name in dict(targets) or name == 'all':
+            continue
+        targets.append((name, ObsTargetSettings(
+            config.get(section, 'host', fallback=conf.OBS_WS_HOST),
+            config.getint(section, 'port', fallback=conf.OBS_WS_PORT),
+            config.get(section, 'ws_password', fallback=''))))
+    obs_settings = ObsSettings(obs.get('ws_password', ''),
+                               obs.get('mic_source', 'Mic/Aux'),
+                               obs.get('desktop_source', 'Desktop Audio'),
+                               alert_urls,
+                               config.getfloat('obs', 'cache_ttl',
+                                               fallback=0.0),
+                               host, port, tuple(targets))
+    twitch_settings = None
+    if all([config.has_option('twitch', 'channel'),
+            config.has_option('twitch', 'oauth_token')]):
+        twitch_settings = TwitchSettings(
+            config['twitch']['channel'], config['twitch']['oauth_token'],
+            config.get('twitch', 'irc_host', fallback=conf.TWITCH_IRC_HOST),
+            config.getint('twitch', 'irc_port',
+                          fallback=conf.TWITCH_IRC_PORT))
+    # A tuple of (name, steps) pairs, from the [macro:name] sections
+    macros = tuple([(x.partition(':')[2].strip(),
+                     tuple([y.strip() for y in
+                            config.get(x, 'steps', fallback='').splitlines()
+                            if y.strip()]))
+                    for x in config.sections() if x.startswith('macro:')])
+    # A tuple of (name, CustomSettings) pairs, from the [custom:name] sections
+    custom = tuple([(x.partition(':')[2].strip(),
+                     CustomSettings(config.get(x, 'request', fallback=''),
+                                    config.get(x, 'data', fallback=''),
+                                    config.getfloat(x, 'cache_ttl',
+                                                    fallback=None)))
+                    for x in config.sections() if x.startswith('custom:')])
+    return Settings(obs_settings, twitch_settings,
+                    _parse_safety(config, 'start_stop_safety', False),
+                    _parse_safety(config, 'live_safety', True), macros,
+                    custom)
+
+
+def _parse_safety(config, section, live):
+    """Parse a chat safety section of the config
+
+    :param config: Config details loaded by ConfigParser
+    :type config: ConfigParser
+    :param section: The config section, either start_stop_safety or
+        live_safety
+    :type section: str
+    :param live: If the additional options for live streams apply
+    :type live: bool
+    :return: The parsed settings, or None if the chat safety features haven't
+        been set up
+    :rtype: SafetySettings
+    """
+    if not config.has_option(section, 'enabled'):
+        return None
+    return SafetySettings(
+        config.getboolean(section, 'enabled'),
+        config.getboolean(section, 'emote_mode', fallback=False),
+        config.get(section, 'method', fallback=''),
+        config.get(section, 'follow_time', fallback=''),
+        live and config.getboolean('additional', 'advert', fallback=False),
+        live and config.getboolean('additional', 'clear_chat',
+                                   fallback=False))
+
+
+def load_settings():
+    """Load the parsed settings from the settings cache next to the config
+    file, as long as the config file hasn't changed since the cache was
+    written.  Otherwise load and parse the config file, and update the cache
+
+    :return: The parsed settings
+    :rtype: Settings
+    """
+    config_file = os.path.join(user_config_dir('obs-streamdeck-ctl', 'djnrrd'),
+                               'obs-streamdeck.ini')
+    try:
+        config_stat = os.stat(config_file)
+    except FileNotFoundError:
+        # Nothing to cache until the setup wizard has been run
+        return parse_config(load_config())
+    settings = _read_cache(config_file, config_stat)
+    if settings is None:
+        settings = parse_config(load_config())
+        _write_cache(config_file, settings, config_stat)
+    return settings
+
+
+def _cache_key(config_stat):
+    """The details that tell if the settings cache is still valid, the
+    modified time and size of the config file, and the layout of the Settings
+
+    :param config_stat: The stat result for the config file
+    :type config_stat: os.stat_result
+    :return: The cache key, as it would be read back from JSON
+    :rtype: list
+    """
+    return [config_stat.st_mtime_ns, config_stat.st_size,
+            [list(x._fields) for x in (Settings, ObsSettings,
+                                       ObsTargetSettings, TwitchSettings,
+                                       SafetySettings, CustomSettings)]]
+
+
+def _read_cache(config_file, config_stat):
+    """Read the settings cache for the config file
+
+    :param config_file: The path to the config file
+    :type config_file: str
+    :param config_stat: The stat result for the config file
+    :type config_stat: os.stat_result
+    :return: The parsed settings, or None if the cache is missing or out of
+        date
+    :rtype: Settings
+    """
+    try:
+        with open(f"{config_file}.cache", 'r') as f:
+            cache = json.load(f)
+        if cache['key'] != _cache_key(config_stat):
+            return None
+        obs, twitch, start_stop_safety, live_safety, macros, custom = \
+            cache['settings']
+        return Settings(
+            ObsSettings(*obs[:3], tuple([tuple(x) for x in obs[3]]),
+                        *obs[4:7],
+                        tuple([(name, ObsTargetSettings(*x))
+                               for name, x in obs[7]])),
+            TwitchSettings(*twitch) if twitch else None,
+            SafetySettings(*start_stop_safety) if start_stop_safety else None,
+            SafetySettings(*live_safety) if live_safety else None,
+            tuple([(name, tuple(steps)) for name, steps in macros]),
+            tuple([(name, CustomSettings(*x)) for name, x in custom]))
+    except (OSError, ValueError, KeyError, TypeError):
+        # A missing or broken cache is just a cache miss
+        return None
+
+
+def _write_cache(config_file, settings, config_stat=None):
+    """Write the settings cache for the config file
+
+    :param config_file: The path to the config file
+    :type config_file: str
+    :param settings: The parsed settings
+    :type settings: Settings
+    :param config_stat: The stat result for the config file from before it
+        was read, so a change while it was being read is caught next time
+    :type config_stat: os.stat_result
+    """
+    config_stat = config_stat or os.stat(config_file)
+    cache_file = f"{config_file}.cache"
+    temp_file = f"{cache_file}.{os.getpid()}"
+    try:
+        # The cache has the same passwords in it as the config, so keep it
+        # private.  Write it to one side and then move it into place, so a
+        # button press never reads half a cache
+        fd = os.open(temp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with open(fd, 'w') as f:
+            json.dump({'key': _cache_key(config_stat),
+                       'settings': settings}, f)
+        os.replace(temp_file, cache_file)
+    except OSError:
+        # The cache only saves time, carry on without it
+        if os.path.exists(temp_file):
+            os.unlink(temp_file)
@@ -1,63 +1,134 @@
-from configparser import ConfigParser
-from appdirs import user_config_dir
-import os
+import queue
 import tkinter as tk
 from tkinter import font as tk_font
 from tkinter import messagebox as tk_mb
-from .obs_controls import get_all_sources, get_source_settings
+from tkinter import ttk
+from .obs_controls import get_source_inventory, get_sources_settings, \
+    submit
+from .oauth_callback import OAuthCallbackServer, REDIRECT_PORT
 from . import text_includes as ti
-from .conf import CLIENT_ID, REDIRECT_URI
+from .conf import CLIENT_ID, OBS_WS_HOST, OBS_WS_PORT
+from .config_file import save_config
 import webbrowser
 import threading
-from http.server import HTTPServer, BaseHTTPRequestHandler
-import json
-from functools import partial
+import asyncio
 from urllib.parse import urlencode
 from simpleobsws import MessageTimeout
-import os
 
 
-def load_config():
-    """Load the config file and return the ConfigParser object
-
-    :return: the ConfigParser object
-    :rtype: ConfigParser
+class BackgroundTask:
+    r"""Run a blocking function on a worker thread, so the Tk main loop keeps
+    handling events while it waits.  The result comes back through a queue,
+    which the main loop checks with after(), so on_done and on_error are
+    called on the main thread, the only one that can use Tk
+
+    :param widget: The widget to schedule the checks with
+    :type widget: tk.Misc
+    :param func: The blocking function to run
+    :type func: function
+    :param \*args: The arguments for the function
+    :param on_done: Called with the result from the function
+    :type on_done: function
+    :param on_error: Called with the exception if the function raises one
+    :type on_error: function
+    :cvar poll_ms: How often to check for the result, in milliseconds
+    :cvar cancelled: True once the task has been cancelled
+    :cvar finished: True once the result has been passed on
     """
-    # Attempt to load the config file
-    config_dir = user_config_dir('obs-streamdeck-ctl', 'djnrrd')
-    if not os.path.isdir(config_dir):
-        # On windows appdirs always have to be %appdir%//author//appname so
-        # we have to create the author folder first
-        if not os.path.isdir(os.path.join(user_config_dir(), 'djnrrd')):
-            os.mkdir(os.path.join(user_config_dir(), 'djnrrd'))
-        os.mkdir(config_dir)
-    config_file = os.path.join(config_dir, 'obs-streamdeck.ini')
-    config = ConfigParser()
-    config.read(config_file)
-    return config
-
-
-def save_config(config):
-    """Save the config file to the user's local config directory.
-
-    :param config: The ConfigParser object
-    :type config: ConfigParser
+    poll_ms = 50
+
+    def __init__(self, widget, func, *args, on_done=None, on_error=None):
+        self.widget = widget
+        self.func = func
+        self.args = args
+        self.on_done = on_done
+        self.on_error = on_error
+        self.cancelled = False
+        self.finished = False
+        self._results = queue.Queue()
+        self._after_id = None
+
+    def start(self):
+        """Start the worker thread and begin checking for the result"""
+        worker = threading.Thread(target=self._run, daemon=True)
+        worker.start()
+        self._after_id = self.widget.after(self.poll_ms, self._poll)
+
+    def cancel(self):
+        """Stop waiting for the result.  The worker thread can't be stopped,
+        but whatever it returns is thrown away
+        """
+        self.cancelled = True
+        if self._after_id is not None:
+            self.widget.after_cancel(self._after_id)
+            self._after_id = None
+
+    @property
+    def running(self):
+        return not (self.cancelled or self.finished)
+
+    def _run(self):
+        try:
+            self._results.put((True, self.func(*self.args)))
+        except Exception as exc:
+            self._results.put((False, exc))
+
+    def _poll(self):
+        """Pass the result on if it's ready, otherwise check again later"""
+        self._after_id = None
+        if self.cancelled:
+            return
+        try:
+            ok, result = self._results.get_nowait()
+        except queue.Empty:
+            self._after_id = self.widget.after(self.poll_ms, self._poll)
+            return
+        self.finished = True
+        callback = self.on_done if ok else self.on_error
+        if callback:
+            callback(result)
+        elif not ok:
+            raise result
+
+
+class FutureTask(BackgroundTask):
+    """A BackgroundTask for a coroutine on the shared event loop from
+    obs_controls, rather than a blocking function on a thread of its own.
+    The function is called on the main thread and returns the future from
+    submit(), and cancelling the task cancels the coroutine as well
     """
-    config_dir = user_config_dir('obs-streamdeck-ctl', 'djnrrd')
-    config_file = os.path.join(config_dir, 'obs-streamdeck.ini')
-    if not all([os.path.exists(config_dir), os.path.isdir(config_dir)]):
-        os.mkdir(config_dir)
-    with open(config_file, 'w') as f:
-        config.write(f)
+
+    def start(self):
+        """Start the coroutine and begin checking for the result"""
+        self.future = self.func(*self.args)
+        self.future.add_done_callback(self._future_done)
+        self._after_id = self.widget.after(self.poll_ms, self._poll)
+
+    def cancel(self):
+        """Stop waiting for the result and cancel the coroutine"""
+        super().cancel()
+        self.future.cancel()
+
+    def _future_done(self, future):
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is None:
+            self._results.put((True, future.result()))
+        else:
+            self._results.put((False, error))
 
 
 class SetupApp(tk.Tk):
     """The main Tkinter GUI for the config setup wizard
 
     :param config: The ConfigParser object that was loaded from
-        config_mgmt.load_config
+        config_file.load_config
     :type config: ConfigParser
     :cvar obs_config: The stored ConfigParser object
+    :cvar source_inventory: The sources in OBS, shared by the wizard pages
+    :cvar inventory_key: The password, host and port the source inventory
+        was fetched with
     """
 
     def __init__(self, config):
@@ -65,6 +136,8 @@ class SetupApp(tk.Tk):
         # Add the config to the application, we'll be calling it from some of
         # the wizard frames
         self.obs_config = config
+        self.source_inventory = None
+        self.inventory_key = None
         self.title(ti.APP_HEADER)
         self.title_font = tk_font.Font(family='Helvetica', size=18,
                                        weight='bold', slant='italic')
@@ -123,6 +196,25 @@ class SetupApp(tk.Tk):
         """Set the cursor back to normal"""
         self.config(cursor='')
 
+    def cancel(self):
+        """Cancel whatever the wizard is waiting on, or quit the wizard if
+        it isn't waiting on anything
+        """
+        for frame in self.frames.values():
+            if frame.task and frame.task.running:
+                frame.cancel_task()
+                return
+        self.destroy()
+
+    def destroy(self):
+        """Cancel anything still running in the background, such as the
+        Twitch web server, before closing the wizard
+        """
+        for frame in self.frames.values():
+            if frame.task and frame.task.running:
+                frame.task.cancel()
+        super().destroy()
+
 
 class SetupPage(tk.Frame):
     """A superclass frame that should not be called directly, but instead
@@ -144,11 +236,13 @@ class SetupPage(tk.Frame):
     :cvar top_frame: The header frame
     :cvar middle_frame: The main frame for the wizard pages
     :cvar bottom_frame: The navigation frame
+    :cvar task: The BackgroundTask the page is waiting on, if any
     """
 
     def __init__(self, parent, controller, name='', headers=(), footers=()):
         super().__init__(parent, name=name)
         self.controller = controller
+        self.task = None
         # Layouts
         self._layout_frames()
         self._setup_header(*headers)
@@ -193,7 +287,7 @@ class SetupPage(tk.Frame):
                                  state='normal')
             back_btn.grid(row=0, column=1, sticky='e', padx=5)
         cancel_btn = tk.Button(self.bottom_frame, text='Cancel',
-                               command=self.controller.destroy, name='cancel',
+                               command=self.controller.cancel, name='cancel',
                                state='normal')
         cancel_btn.grid(row=0, column=0, sticky='e')
         next_btn = tk.Button(self.bottom_frame, text=next_text,
@@ -204,6 +298,87 @@ class SetupPage(tk.Frame):
         self.bottom_frame.grid_columnconfigure(1, weight=0)
         if back_function:
             self.bottom_frame.grid_columnconfigure(2, weight=0)
+        # The progress bar and message for run_in_background, only shown
+        # while waiting
+        status_lbl = tk.Label(self.bottom_frame, name='status')
+        status_lbl.grid(row=1, column=0, columnspan=3, sticky='w')
+        progress = ttk.Progressbar(self.bottom_frame, mode='indeterminate',
+                                   name='progress')
+        progress.grid(row=2, column=0, columnspan=3, sticky='ew')
+        status_lbl.grid_remove()
+        progress.grid_remove()
+
+    def run_in_background(self, message, func, *args, on_done=None,
+                          on_error=None, task_class=BackgroundTask):
+        r"""Run a blocking function, like one that connects to OBS, on a worker
+        thread.  The page shows the message and a progress bar, and Next and
+        Back are disabled until it's finished.  Cancel stops waiting for it
+
+        :param message: The message to show while waiting
+        :type message: str
+        :param func: The blocking function to run
+        :type func: function
+        :param \*args: The arguments for the function
+        :param on_done: Called with the result from the function
+        :type on_done: function
+        :param on_error: Called with the exception if the function raises one
+        :type on_error: function
+        :param task_class: BackgroundTask, or FutureTask if func returns a
+            future from submit()
+        :type task_class: type
+        """
+        def done(result):
+            self.clear_progress()
+            if on_done:
+                on_done(result)
+
+        def error(exc):
+            self.clear_progress()
+            if on_error:
+                on_error(exc)
+            else:
+                raise exc
+
+        self.show_progress(message)
+        self.task = task_class(self, func, *args, on_done=done,
+                               on_error=error)
+        self.task.start()
+
+    def cancel_task(self):
+        """Stop waiting on the background task and let the user carry on"""
+        if self.task:
+            self.task.cancel()
+        self.clear_progress()
+
+    def show_progress(self, message):
+        """Show the progress bar and message, and disable the navigation"""
+        self.controller.show_busy()
+        self.nav_buttons_state('disabled')
+        status_lbl = self.bottom_frame.nametowidget('status')
+        status_lbl['text'] = message
+        status_lbl.grid()
+        progress = self.bottom_frame.nametowidget('progress')
+        progress.grid()
+        progress.start(20)
+
+    def clear_progress(self):
+        """Hide the progress bar and message, and enable the navigation"""
+        progress = self.bottom_frame.nametowidget('progress')
+        progress.stop()
+        progress.grid_remove()
+        self.bottom_frame.nametowidget('status').grid_remove()
+        self.nav_buttons_state('normal')
+        self.controller.clear_busy()
+
+    def nav_buttons_state(self, state):
+        """Set the state of the Next and Back buttons
+
+        :param state: 'normal' or 'disabled'
+        :type state: str
+        """
+        for name in ('next', 'back'):
+            if name in self.bottom_frame.children:
+                self.bottom_frame.children[name]['state'] = state
 
     def _setup_header(self, header_text, body_text):
         """Setup the heading section in the top frame.
@@ -464,18 +639,35 @@ class ObsWsPass(SetupPage):
         raising an alert if we're unable to connect.  Then pass that list to
         the next frame to load into its Listbox before showing the next frame
         """
-        self.controller.show_busy()
         config = self.controller.obs_config
-        try:
-            obs_sources = get_all_sources(config['obs']['ws_password'])
-            self.controller.clear_busy()
-            self.controller.frames['ObsAudioSources']. \
-                load_obs_sources(obs_sources)
-            self.controller.show_frame('ObsAudioSources')
-        except (ConnectionRefusedError, NameError, MessageTimeout):
-            self.controller.clear_busy()
-            tk_mb.showwarning(title=ti.OBSWSPASS_WARN_HEADER,
-                              message=ti.OBSWSPASS_WARN)
+        key = (config['obs']['ws_password'],
+               config.get('obs', 'host', fallback=OBS_WS_HOST),
+               config.getint('obs', 'port', fallback=OBS_WS_PORT))
+        # Only fetch the sources again if we're connecting somewhere new,
+        # not every time the user comes back to this page
+        if self.controller.source_inventory and \
+                self.controller.inventory_key == key:
+            self.show_obs_sources(self.controller.source_inventory)
+            return
+
+        def done(inventory):
+            self.controller.inventory_key = key
+            self.show_obs_sources(inventory)
+
+        self.run_in_background(ti.OBSWSPASS_BUSY, get_source_inventory,
+                               *key, on_done=done,
+                               on_error=obs_connect_warning)
+
+    def show_obs_sources(self, inventory):
+        """Share the OBS Sources with the other pages, load them into the
+        next frame and show it
+
+        :param inventory: The sources from get_source_inventory
+        :type inventory: SourceInventory
+        """
+        self.controller.source_inventory = inventory
+        self.controller.frames['ObsAudioSources'].load_obs_sources(inventory)
+        self.controller.show_frame('ObsAudioSources')
 
 
 class ObsAudioSources(SetupPage):
@@ -569,14 +761,18 @@ class ObsAudioSources(SetupPage):
         else:
             return 'Desktop Audio'
 
-    def load_obs_sources(self, obs_sources):
-        """Load the OBS Sources from the previous frame into the Listbox"""
+    def load_obs_sources(self, inventory):
+        """Load the OBS audio sources into the Listbox
+
+        :param inventory: The sources from get_source_inventory
+        :type inventory: SourceInventory
+        """
         self.obs_sources.delete(0, 'end')
-        sources = [x['inputName'] for x in obs_sources]
-        default_sources = (self.mic_source.get(), self.desktop_source.get())
-        for source in sources:
-            if source not in default_sources:
-                self.obs_sources.insert('end', source)
+        # Fall back to every source if OBS didn't say that any have audio
+        sources = inventory.audio_sources or list(inventory.kinds)
+        default_sources = {self.mic_source.get(), self.desktop_source.get()}
+        self.obs_sources.insert('end', *[x for x in sources
+                                         if x not in default_sources])
 
     def update_sources(self):
         """Get the updated value from the entry box and update the config
@@ -585,9 +781,8 @@ class ObsAudioSources(SetupPage):
         config = self.controller.obs_config
         config['obs']['mic_source'] = self.mic_source.get()
         config['obs']['desktop_source'] = self.desktop_source.get()
-        obs_sources = self.obs_sources.get(0, 'end')
-        obs_sources += (self.mic_source.get(), self.desktop_source.get())
-        self.controller.frames['ObsAlertSources'].load_obs_sources(obs_sources)
+        self.controller.frames['ObsAlertSources']. \
+            load_obs_sources(self.controller.source_inventory)
         self.controller.show_frame('ObsAlertSources')
 
     def select_mic_source(self):
@@ -675,12 +870,17 @@ class ObsAlertSources(SetupPage):
             for source in alert_sources:
                 self.alert_sources.insert('end', source)
 
-    def load_obs_sources(self, obs_sources):
-        """Load the OBS Sources from the previous frame into the Listbox"""
-        default_sources = self.alert_sources.get(0, 'end')
-        for source in obs_sources:
-            if source not in default_sources:
-                self.obs_sources.insert('end', source)
+    def load_obs_sources(self, inventory):
+        """Load the OBS browser sources that aren't already alert sources into
+        the Listbox
+
+        :param inventory: The sources from get_source_inventory
+        :type inventory: SourceInventory
+        """
+        self.obs_sources.delete(0, 'end')
+        default_sources = set(self.alert_sources.get(0, 'end'))
+        self.obs_sources.insert('end', *[x for x in inventory.browser_sources
+                                         if x not in default_sources])
 
     def update_sources(self):
         """Get the updated values from the Alert sources Listbox and add them to
@@ -690,17 +890,46 @@ class ObsAlertSources(SetupPage):
         None if config.has_section('obs_browser_sources') else \
             config.add_section('obs_browser_sources')
         config['obs']['alert_sources'] = ':'.join(alerts)
-        for source in alerts:
-            config['obs_browser_sources'][source] = self.get_source_url(source)
+        self.run_in_background(
+            ti.OBSALERT_BUSY, self.get_source_urls, alerts,
+            config['obs']['ws_password'],
+            config.get('obs', 'host', fallback=OBS_WS_HOST),
+            config.getint('obs', 'port', fallback=OBS_WS_PORT),
+            on_done=self.save_source_urls, on_error=obs_connect_warning)
+
+    def save_source_urls(self, source_urls):
+        """Add the URLs for the alert sources to the config and move to the
+        twitch stage
+
+        :param source_urls: The URL for each alert source, keyed by name
+        :type source_urls: dict
+        """
+        config = self.controller.obs_config
+        for source, url in source_urls.items():
+            config['obs_browser_sources'][source] = url
         self.controller.show_frame('LaunchTwitch')
 
-    def get_source_url(self, source):
-        """Connect to OBS to get the URL for the supplied source
+    @staticmethod
+    def get_source_urls(sources, ws_password, host, port):
+        """Connect to OBS to get the URL for each of the supplied sources,
+        with one batch over a single connection.  This blocks, so is run in
+        the background
+
+        :param sources: The names of the browser sources
+        :type sources: tuple
+        :param ws_password: The password for the OBS WebSockets server
+        :type ws_password: str
+        :param host: The OBS WebSockets server
+        :type host: str
+        :param port: The OBS WebSockets server port
+        :type port: int
+        :return: The URL for each source, keyed by name
+        :rtype: dict
         """
-        config = self.controller.obs_config
-        ws_password = config['obs']['ws_password']
-        settings = get_source_settings(source, ws_password)
-        return settings['url']
+        if not sources:
+            return dict()
+        settings = get_sources_settings(sources, ws_password, host, port)
+        return dict([(source, settings[source]['url']) for source in sources])
 
 
 class LaunchTwitch(SetupPage):
@@ -756,35 +985,37 @@ class LaunchTwitch(SetupPage):
             return ''
 
     def launch_browser(self):
-        """Disable the Next button, launch the user's web browser and take
-        them to the Twitch OAuth page.  Start a web server to listen for the
-        response"""
-        # Disable my next button
-        self.enable_disable_widgets(False, ('next',), 'bottom_frame')
+        """Start a web server to listen for the response, which launches the
+        user's web browser and takes them to the Twitch OAuth page once it's
+        listening.  Next and Back are disabled until Twitch responds, or the
+        user cancels"""
+        config = self.controller.obs_config
+        server = OAuthCallbackServer(port=config.getint(
+            'twitch', 'redirect_port', fallback=REDIRECT_PORT))
+        # The server runs on the event loop shared with obs_controls, and
+        # closes itself when it's finished, cancelled or timed out
+        self.run_in_background(ti.LAUNCH_TWITCH_BUSY,
+                               lambda: submit(server.serve(self.open_twitch)),
+                               on_done=self.return_from_web_server,
+                               on_error=twitch_warning, task_class=FutureTask)
+
+    @staticmethod
+    def open_twitch(redirect_uri):
+        """Open a new web browser tab at the Twitch OAuth page
+
+        :param redirect_uri: Where Twitch should send the user back to
+        :type redirect_uri: str
+        """
         base_url = 'https://id.twitch.tv/oauth2/authorize'
-        params = {'client_id': CLIENT_ID, 'redirect_uri': REDIRECT_URI,
+        params = {'client_id': CLIENT_ID, 'redirect_uri': redirect_uri,
                   'response_type': 'token',
                   'scope': 'channel:moderate chat:edit chat:read '
                            'channel_commercial channel_editor'}
         url_params = urlencode(params)
         url = f"{base_url}?{url_params}"
         # Placeholder while building. don't want to hammer Twitch
-        # url = 'http://localhost:8000/'
+        # url = redirect_uri
         webbrowser.open_new_tab(url)
-        # Launch the Web Server in a separate thread to wait for the response
-        httpd = threading.Thread(target=self.start_web_server)
-        httpd.daemon = True
-        httpd.start()
-
-    def start_web_server(self):
-        """Start a web server using the custom response handler which will
-        have a reference to the controller app to return the values from twitch.
-        """
-        # Use partial to add custom arguments to the TwitchResponseHandler
-        handler = partial(TwitchResponseHandler, self.controller)
-        server_address = ('', 8000)
-        httpd = HTTPServer(server_address, handler)
-        httpd.serve_forever()
 
     def return_from_web_server(self, return_object):
         """Receive the Twitch object from the web server and update the
@@ -807,8 +1038,6 @@ class LaunchTwitch(SetupPage):
         config = self.controller.obs_config
         config['twitch']['oauth_token'] = return_object['#access_token']
         config['twitch']['channel'] = self.twitch_channel.get()
-        next_button_path = 'main_frame.launchtwitch.bottom_frame.next'
-        self.controller.nametowidget(next_button_path)['state'] = 'active'
         self.controller.show_frame('StartStopOptions')
 
 
@@ -927,11 +1156,13 @@ class SafetyOptions(SetupPage):
         None if config.has_section(section_name) else \
             config.add_section(section_name)
         if config.has_option(section_name, 'enabled'):
-            self.safety_check_value.set(eval(config[section_name]['enabled']))
+            self.safety_check_value.set(
+                config.getboolean(section_name, 'enabled'))
             self.safety_option.set(config[section_name]['method'])
             if self.safety_option.get() == 'FOLLOWER':
                 self.follow_time.set(config[section_name]['follow_time'])
-            self.emote_option.set(eval(config[section_name]['emote_mode']))
+            self.emote_option.set(
+                config.getboolean(section_name, 'emote_mode'))
             self.safety_check_changed()
             self.safety_radio_change()
 
@@ -1067,10 +1298,11 @@ class AdditionalSafetyOptions(SetupPage):
         None if config.has_section('additional') else \
             config.add_section('additional')
         if config.has_option('additional', 'advert'):
-            self.ad_check_value.set(eval(config['additional']['advert']))
+            self.ad_check_value.set(
+                config.getboolean('additional', 'advert'))
         if config.has_option('additional', 'clear_chat'):
             self.clear_chat_check_value.set(
-                eval(config['additional']['clear_chat']))
+                config.getboolean('additional', 'clear_chat'))
 
 
 class SetupComplete(SetupPage):
@@ -1102,54 +1334,34 @@ class SetupComplete(SetupPage):
         self.controller.destroy()
 
 
-class TwitchResponseHandler(BaseHTTPRequestHandler):
-    """Local web server handler to handle the return request from the Twitch
-    authentication portal.  Normally the __init__ method would not be
-    overridden but we need to reference the Setup Wizard application
-    stored in the object to change frames when complete
+def obs_connect_warning(error):
+    """Warn the user that the wizard couldn't talk to OBS, passing on any
+    other errors
 
-    :param controller: A reference to the main TK application
-    :type controller: tk.Tk
-    :param \*args: List of arguments accepted by BaseHTTPRequestHandler
-    :param \*\*kwargs: Dictionary of keyword arguments accepted by
-        BaseHTTPRequestHandler
+    :param error: The exception from the background task
+    :type error: Exception
     """
+    # ConnectionRefusedError is an OSError, as are the other ways the
+    # connection can fail
+    if isinstance(error, (OSError, NameError, MessageTimeout)):
+        tk_mb.showwarning(title=ti.OBSWSPASS_WARN_HEADER,
+                          message=ti.OBSWSPASS_WARN)
+    else:
+        raise error
 
-    def __init__(self, controller, *args, **kwargs):
-        self.controller = controller
-        super().__init__(*args, **kwargs)
 
-    def do_GET(self):
-        """GET only serves 2 files, thanks.html and thanks.js. As the twitch
-        response is in the document hash, it's easier to get through
-        Javascript
-        """
-        base_dir = os.path.dirname(ti.__file__)
-        self.send_response(200)
-        file = 'thanks.js' if self.path == '/thanks.js' \
-            else 'thanks.html'
-        content_type = 'application/ecmascript' if self.path == '/thanks.js' \
-            else 'text/html'
-        with open(os.path.join(base_dir, file), 'r') as f:
-            html = f.read()
-        self.send_header('Content-type', content_type)
-        self.end_headers()
-        self.wfile.write(html.encode())
-
-    def do_POST(self):
-        """Receive the Twitch tokens via a POST from thanks.js. Update the
-        original setup app with the values received and shut down the web
-        server"""
-        # Read the POST body and convert from JSON to a dict.
-        data_string = self.rfile.read(int(self.headers['Content-Length']))
-        new_object = json.loads(data_string.decode('utf-8'))
-        # Send headers
-        self.send_response(202)
-        self.send_header("Content-type", "text/html")
-        self.end_headers()
-        # Pass the twitch object back to the setup app and shut down the server
-        self.controller.frames['LaunchTwitch']. \
-            return_from_web_server(new_object)
-        safe_shut = threading.Thread(target=self.server.shutdown)
-        safe_shut.daemon = True
-        safe_shut.start()
+def twitch_warning(error):
+    """Warn the user that the authorisation with Twitch didn't finish,
+    passing on any other errors
+
+    :param error: The exception from the background task
+    :type error: Exception
+    """
+    if isinstance(error, asyncio.TimeoutError):
+        tk_mb.showwarning(title=ti.LAUNCH_TWITCH_WARN_HEADER,
+                          message=ti.LAUNCH_TWITCH_TIMEOUT)
+    elif isinstance(error, OSError):
+        tk_mb.showwarning(title=ti.LAUNCH_TWITCH_WARN_HEADER,
+                          message=ti.LAUNCH_TWITCH_PORT.format(error))
+    else:
+        raise error
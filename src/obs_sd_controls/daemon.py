@@ -0,0 +1,94 @@
+import asyncio
+import json
+import os
+import socket
+import sys
+from .actions import ActionRunner
+from .config_file import DEFAULT_OBS_TARGET
+from .daemon_client import claim_socket, socket_path, stop_on_signals
+
+
+class ObsStreamDeckDaemon(ActionRunner):
+    """A long running server that keeps an identified connection to OBS
+    WebSockets and a joined Twitch chat session open, running the actions
+    forwarded to it by obs-streamdeck-ctl over a Unix socket.
+
+    :param settings: The parsed config
+    :type settings: Settings
+    :cvar lock: Makes sure that actions are run in the order they arrive
+    """
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.lock = None
+
+    async def serve(self, path):
+        """Listen on the Unix socket until the daemon is stopped
+
+        :param path: The path for the Unix socket
+        :type path: str
+        """
+        if not claim_socket(path):
+            sys.exit(f"A daemon is already running on {path}")
+        self.lock = asyncio.Lock()
+        if self.settings.twitch:
+            self.start_chat()
+        # Connected and identified with every OBS target up front.  Only the
+        # one in the [obs] section has to be there, the others are connected
+        # when they're first needed
+        errors = await self.pool.connect_all()
+        if DEFAULT_OBS_TARGET in errors:
+            raise errors[DEFAULT_OBS_TARGET]
+        server = await asyncio.start_unix_server(self.handle_client, path)
+        # Only the user running the daemon should be able to send it actions
+        os.chmod(path, 0o600)
+        # Shut down cleanly when we're asked to stop, so the socket is removed
+        stop = asyncio.Event()
+        stop_on_signals(asyncio.get_running_loop(), stop)
+        try:
+            async with server:
+                await stop.wait()
+        finally:
+            await self.close()
+            if os.path.exists(path):
+                os.unlink(path)
+
+    async def handle_client(self, reader, writer):
+        """Read a single action from a client, run it, and return the result
+
+        :param reader: The stream reader for the client connection
+        :type reader: asyncio.StreamReader
+        :param writer: The stream writer for the client connection
+        :type writer: asyncio.StreamWriter
+        """
+        line = await reader.readline()
+        if not line:
+            # Only checking that the daemon is running, see claim_socket
+            writer.close()
+            return
+        try:
+            arg = json.loads(line)
+            async with self.lock:
+                result = await self.do_action(arg)
+            response = {'ok': True}
+            if result is not None:
+                response['result'] = result
+        except Exception as e:
+            response = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+        writer.write(json.dumps(response).encode() + b'\n')
+        await writer.drain()
+        writer.close()
+
+
+def run_daemon(settings):
+    """Run the daemon in the foreground until it is interrupted
+
+    :param settings: The parsed config
+    :type settings: Settings
+    """
+    if not hasattr(socket, 'AF_UNIX'):
+        raise OSError('The daemon requires Unix socket support')
+    path = socket_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    daemon = ObsStreamDeckDaemon(settings)
+    asyncio.run(daemon.serve(path))
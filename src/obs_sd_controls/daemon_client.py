@@ -0,0 +1,105 @@
+import json
+import os
+import socket
+from appdirs import user_cache_dir
+
+
+def runtime_dir():
+    """Get the directory for the sockets and state files of the long running
+    modes
+
+    :return: The path to the directory
+    :rtype: str
+    """
+    return os.environ.get('XDG_RUNTIME_DIR') or \
+        user_cache_dir('obs-streamdeck-ctl', 'djnrrd')
+
+
+def socket_path():
+    """Get the path to the Unix socket that the daemon listens on
+
+    :return: The path to the socket
+    :rtype: str
+    """
+    return os.path.join(runtime_dir(), 'obs-streamdeck-ctl.sock')
+
+
+def claim_socket(path):
+    """Check that nothing is listening on a Unix socket before serving on it,
+    removing the socket if it was left over from a daemon or watcher that
+    didn't shut down cleanly
+
+    :param path: The path for the Unix socket
+    :type path: str
+    :return: False if something is still listening on the socket
+    :rtype: bool
+    """
+    if not os.path.exists(path):
+        return True
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(path)
+    except ConnectionRefusedError:
+        # Nothing is listening, so it's safe to take over
+        os.unlink(path)
+        return True
+    except FileNotFoundError:
+        return True
+    finally:
+        client.close()
+    return False
+
+
+def stop_on_signals(loop, stop):
+    """Set an event when the process is asked to stop by SIGINT or SIGTERM,
+    so the daemon and watcher can shut down cleanly
+
+    :param loop: The running event loop
+    :type loop: asyncio.AbstractEventLoop
+    :param stop: The event to set
+    :type stop: asyncio.Event
+    """
+    # Only the long running modes need this, so it isn't imported for every
+    # button press
+    import signal
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            # The Windows event loops don't support signal handlers, fall
+            # back to a plain one that hands the stop over to the loop
+            signal.signal(sig, lambda signum, frame:
+                          loop.call_soon_threadsafe(stop.set))
+
+
+def forward_action(arg, timeout=15):
+    """Forward the command line action to a running daemon.
+
+    :param arg: The command line arguments as gathered by argparser
+    :type arg: argparse.Namespace
+    :param timeout: How long to wait for the daemon to respond, in seconds
+    :type timeout: float
+    :return: The response from the daemon, or None if the action couldn't be
+        handed to a daemon, in which case the caller should run the action
+        itself
+    :rtype: dict
+    """
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(timeout)
+    with client:
+        try:
+            client.connect(socket_path())
+            client.sendall(json.dumps(vars(arg)).encode() + b'\n')
+        except OSError:
+            # No daemon, or it went away before taking the action
+            return None
+        try:
+            return json.loads(client.makefile('rb').readline())
+        except (OSError, ValueError):
+            # The daemon has the action, so running it here as well could
+            # do it twice, e.g. toggling a mute back
+            return dict([('ok', False),
+                         ('error', 'The daemon did not respond, the action '
+                                   'may not have run')])
@@ -0,0 +1,163 @@
+import asyncio
+import json
+import os
+from functools import lru_cache
+from urllib.parse import urlsplit
+from .conf import REDIRECT_URI
+
+# The port Twitch sends the user back to, which has to match the redirect URI
+# registered for the application
+REDIRECT_PORT = urlsplit(REDIRECT_URI).port or 80
+# How long to wait for the user to authorise the application, in seconds
+CALLBACK_TIMEOUT = 300
+# How long a single request from the web browser can take, in seconds
+REQUEST_TIMEOUT = 10
+ASSETS = dict([('/', ('thanks.html', 'text/html')),
+               ('/thanks.js', ('thanks.js', 'application/ecmascript'))])
+REASONS = dict([(200, 'OK'), (202, 'Accepted'), (400, 'Bad Request'),
+                (404, 'Not Found'), (405, 'Method Not Allowed')])
+
+
+@lru_cache(maxsize=None)
+def load_assets():
+    """Read the pages served to the web browser once, rather than for every
+    request
+
+    :return: The content type and body for each path
+    :rtype: dict
+    """
+    base_dir = os.path.dirname(__file__)
+    assets = dict()
+    for path, (file, content_type) in ASSETS.items():
+        with open(os.path.join(base_dir, file), 'rb') as f:
+            assets[path] = (content_type, f.read())
+    return assets
+
+
+class OAuthCallbackServer:
+    """A small web server for the return from the Twitch authentication
+    portal.  The Twitch response is in the document hash, so GET serves
+    thanks.html and thanks.js, which POST the tokens back.
+
+    The server runs on an event loop rather than a thread of its own, and
+    closes itself and any open connections once the tokens have been
+    received, the wait is cancelled, or it times out.
+
+    :param host: The address to listen on
+    :type host: str
+    :param port: The port to listen on, 0 picks a free port
+    :type port: int
+    :param timeout: How long to wait for the tokens, in seconds
+    :type timeout: float
+    :cvar port: The port being listened on, once started
+    :cvar server: The asyncio server, while it's running
+    """
+
+    def __init__(self, host='127.0.0.1', port=REDIRECT_PORT,
+                 timeout=CALLBACK_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.server = None
+        self._assets = dict()
+        self._writers = set()
+        self._tokens = None
+
+    @property
+    def redirect_uri(self):
+        """The URI for Twitch to send the user back to"""
+        return f"http://localhost:{self.port}"
+
+    async def start(self):
+        """Start listening, so the port is known and any problems with it
+        are found before sending the user to Twitch
+        """
+        self._assets = load_assets()
+        self._tokens = asyncio.get_running_loop().create_future()
+        self.server = await asyncio.start_server(self._handler, self.host,
+                                                 self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def serve(self, on_listening=None):
+        """Start listening and wait for the tokens from Twitch.  The server
+        is closed whether the tokens arrive or not
+
+        :param on_listening: Called with the redirect URI once the server is
+            listening, to send the user to Twitch
+        :type on_listening: function
+        :return: The tokens posted back by thanks.js
+        :rtype: dict
+        """
+        try:
+            await self.start()
+            if on_listening:
+                on_listening(self.redirect_uri)
+            return await asyncio.wait_for(self._tokens, self.timeout)
+        finally:
+            await self.close()
+
+    async def close(self):
+        """Stop listening and close any open connections"""
+        if self.server is None:
+            return
+        self.server.close()
+        for writer in list(self._writers):
+            writer.close()
+        await self.server.wait_closed()
+        self.server = None
+
+    async def _handler(self, reader, writer):
+        self._writers.add(writer)
+        try:
+            status, content_type, body, tokens = await asyncio.wait_for(
+                self._request(reader), REQUEST_TIMEOUT)
+            writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                         f"Content-Type: {content_type}\r\n"
+                         f"Content-Length: {len(body)}\r\n"
+                         f"Connection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+            # Only pass the tokens on once the response has gone, as the
+            # server closes straight away
+            if tokens is not None and not self._tokens.done():
+                self._tokens.set_result(tokens)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError,
+                ConnectionError, ValueError):
+            # Nothing useful can be sent back for a broken request
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _request(self, reader):
+        """Read a request from the web browser and work out the response.
+        Any JSON object that's posted back is taken as the tokens
+
+        :return: The status, content type and body of the response, and the
+            tokens if any were posted
+        :rtype: tuple
+        """
+        method, path, _ = (await reader.readline()).decode('latin-1'). \
+            split(' ', 2)
+        headers = dict()
+        while True:
+            line = (await reader.readline()).decode('latin-1')
+            if line in ('\r\n', '\n', ''):
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if method == 'GET':
+            path = urlsplit(path).path
+            if path not in self._assets:
+                return 404, 'text/plain', b'', None
+            return (200, ) + self._assets[path] + (None, )
+        elif method == 'POST':
+            body = await reader.readexactly(
+                int(headers.get('content-length', 0)))
+            try:
+                tokens = json.loads(body.decode('utf-8'))
+            except ValueError:
+                tokens = None
+            if not isinstance(tokens, dict):
+                return 400, 'text/plain', b'', None
+            return 202, 'text/html', b'', tokens
+        return 405, 'text/plain', b'', None
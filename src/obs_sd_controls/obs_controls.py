@@ -1,186 +1,919 @@
+import time
+# Time the imports, websockets and asyncio take a while to load
+_import_started = time.monotonic()
 import asyncio
+import json
+import threading
 import simpleobsws
+from . import conf, timings
 
+# Browser sources are pointed here to disable them during Live Safety
+DISABLED_URL = 'http://invalid.lan'
+# obs-websocket EventSubscription bits, used to pick the events a session
+# receives
+EVENTS_GENERAL = 1 << 0
+EVENTS_CONFIG = 1 << 1
+EVENTS_SCENES = 1 << 2
+EVENTS_INPUTS = 1 << 3
+EVENTS_OUTPUTS = 1 << 6
+# The obs-websocket request status code when a resource doesn't exist
+RESOURCE_NOT_FOUND = 600
+# StartStream and StopStream fail with these if the stream is already in the
+# requested state
+OUTPUT_RUNNING = 500
+OUTPUT_NOT_RUNNING = 501
+BROWSER_SOURCE_KIND = 'browser_source'
+# The event loop shared by the synchronous functions, see submit()
+_loop = None
+_loop_lock = threading.Lock()
 
-def _load_obs_ws(ws_password=''):
+
+def _load_obs_ws(ws_password='', event_subscriptions=0,
+                 host=conf.OBS_WS_HOST, port=conf.OBS_WS_PORT):
     """Load the simpleobsws object and return it.
 
     :param ws_password: The password for the OBS WebSockets server
     :type ws_password: str
+    :param event_subscriptions: The obs-websocket EventSubscription bitmask
+        of events to receive.  Defaults to none, as unread events queue up
+        and can hold up the disconnect
+    :type event_subscriptions: int
+    :param host: The OBS WebSockets server
+    :type host: str
+    :param port: The OBS WebSockets server port
+    :type port: int
     :return: The simpleobsws object
-    :rtype: simpleobsws.obsws
+    :rtype: simpleobsws.WebSocketClient
     """
-    obs_url = 'ws://localhost:4455'
+    if ':' in host and not host.startswith('['):
+        # An IPv6 address
+        host = f"[{host}]"
+    obs_url = f"ws://{host}:{port}"
+    params = simpleobsws.IdentificationParameters(
+        eventSubscriptions=event_subscriptions)
     if ws_password:
-        ws = simpleobsws.WebSocketClient(obs_url, password=ws_password)
+        ws = simpleobsws.WebSocketClient(obs_url, password=ws_password,
+                                         identification_parameters=params)
     else:
-        ws = simpleobsws.WebSocketClient(obs_url)
+        ws = simpleobsws.WebSocketClient(obs_url,
+                                         identification_parameters=params)
     return ws
 
 
-async def _ws_toggle_mute(source, ws):
+class ObsRequestError(ValueError):
+    """Raised when OBS reports that a request failed
+
+    :param request_type: The obs-websocket request type
+    :type request_type: str
+    :param status: The request status returned by OBS
+    :type status: simpleobsws.RequestStatus
+    :param index: The position of the request in its batch, if it was sent
+        in one
+    :type index: int
+    :cvar code: The obs-websocket request status code
+    :cvar index: The position of the request in its batch
+    """
+
+    def __init__(self, request_type, status, index=None):
+        self.code = status.code
+        self.index = index
+        message = f"{request_type} failed with code {status.code}"
+        if status.comment:
+            message = f"{message}: {status.comment}"
+        super().__init__(message)
+
+
+class ObsSession:
+    """A single identified connection to the OBS WebSockets server, that any
+    number of requests can be made over before disconnecting.  Use it as an
+    async context manager::
+
+        async with ObsSession(ws_password) as session:
+            await session.call('ToggleInputMute', {'inputName': 'Mic/Aux'})
+
+    The ws_ coroutines below take a session as their last argument, so
+    several of them can be run over it at the same time::
+
+        async with ObsSession(ws_password) as session:
+            await asyncio.gather(ws_toggle_mute('Mic/Aux', session),
+                                 ws_set_scene_number(2, session))
+
+    :param ws_password: The password for the OBS WebSockets server
+    :type ws_password: str
+    :param event_subscriptions: The EVENTS_ bits for the events this session
+        should receive, defaults to none
+    :type event_subscriptions: int
+    :param host: The OBS WebSockets server
+    :type host: str
+    :param port: The OBS WebSockets server port
+    :type port: int
+    :cvar ws: The simpleobsws client for the connection
+    """
+
+    def __init__(self, ws_password='', event_subscriptions=0,
+                 host=conf.OBS_WS_HOST, port=conf.OBS_WS_PORT):
+        self.ws = _load_obs_ws(ws_password, event_subscriptions, host, port)
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.disconnect()
+
+    @property
+    def identified(self):
+        """If the connection is open and identified with OBS"""
+        return self.ws.ws_open and self.ws.identified
+
+    async def connect(self):
+        """Make the connection to obs-websocket and wait until we've been
+        identified
+        """
+        with timings.Span('obs_connect'):
+            await self.ws.connect()
+        # Covers the Hello message and authentication
+        with timings.Span('obs_identify'):
+            await self.ws.wait_until_identified()
+
+    async def disconnect(self):
+        """Clean things up by disconnecting. Only really required in a few
+        specific situations, but good practice if you are done making
+        requests or listening to events.
+        """
+        with timings.Span('obs_disconnect'):
+            await self.ws.disconnect()
+
+    async def wait_closed(self):
+        """Wait until the connection to OBS has been closed, from either end
+        """
+        if self.ws.recv_task is not None:
+            # Shielded, so cancelling the wait doesn't close the connection
+            await asyncio.shield(self.ws.recv_task)
+
+    async def call(self, request_type, data=None):
+        """Make a single request to OBS
+
+        :param request_type: The obs-websocket request type
+        :type request_type: str
+        :param data: The request data, if any
+        :type data: dict
+        :return: The response data from OBS
+        :rtype: dict
+        """
+        request = simpleobsws.Request(request_type, requestData=data)
+        with timings.Span(f"obs_request:{request_type}"):
+            result = await self.ws.call(request)
+        if not result.ok():
+            raise ObsRequestError(request_type, result.requestStatus)
+        return result.responseData
+
+    async def call_batch(self, requests, halt_on_failure=None,
+                         execution_type=None, allow_failures=False):
+        """Send several requests to OBS in a single RequestBatch message
+
+        :param requests: The requests to make, as (request_type, data) pairs
+        :type requests: list
+        :param halt_on_failure: If OBS should stop processing the batch
+            after the first failed request
+        :type halt_on_failure: bool
+        :param execution_type: How OBS should run the batch, defaults to
+            SerialRealtime
+        :type execution_type: simpleobsws.RequestBatchExecutionType
+        :param allow_failures: Give None for the requests that failed, rather
+            than raising ObsRequestError for the first one
+        :type allow_failures: bool
+        :return: The response data for each request, in order
+        :rtype: list
+        """
+        if not requests:
+            return []
+        batch = [simpleobsws.Request(request_type, requestData=data)
+                 for request_type, data in requests]
+        with timings.Span(f"obs_batch:{len(batch)}"):
+            results = await self.ws.call_batch(
+                batch, halt_on_failure=halt_on_failure,
+                execution_type=execution_type)
+        if allow_failures:
+            # Failed requests can have response data too, so it's dropped
+            return [result.responseData if result.ok() else None
+                    for result in results]
+        for index, result in enumerate(results):
+            if not result.ok():
+                raise ObsRequestError(result.requestType,
+                                      result.requestStatus, index)
+        return [result.responseData for result in results]
+
+
+class SceneCache:
+    """Keep the scene list for each scene collection, so that switching
+    scenes by number doesn't need to fetch the scene list every time.  The
+    cache is kept up to date by OBS events, so the session it's used with
+    must be subscribed to EVENTS_SCENES and EVENTS_CONFIG.
+
+    A cached scene list is only trusted on the session that it was fetched
+    with, as events could have been missed while disconnected.  If OBS can't
+    find a cached scene, the scene list is fetched again before retrying.
+
+    :cvar session: The session the cache is being kept for
+    :cvar collection: The name of the current scene collection
+    :cvar scenes: The scene names from the top down, keyed by the scene
+        collection name
+    """
+
+    def __init__(self):
+        self.session = None
+        self.collection = None
+        self.scenes = dict()
+
+    def attach(self, session):
+        """Start keeping the cache for a new session, dropping anything
+        cached from an earlier one
+
+        :param session: An open session with OBS WebSockets
+        :type session: ObsSession
+        """
+        self.session = session
+        self.collection = None
+        self.scenes = dict()
+        session.ws.register_event_callback(self.on_event)
+
+    async def on_event(self, event_type, event_data):
+        """Update the cache from the OBS events that change the scene list
+
+        :param event_type: The obs-websocket event type
+        :type event_type: str
+        :param event_data: The data for the event
+        :type event_data: dict
+        """
+        if event_type == 'SceneListChanged':
+            # The event has the full new list, so there's no need to fetch it
+            if self.collection is not None:
+                self.scenes[self.collection] = \
+                    self._scene_names(event_data['scenes'])
+        elif event_type == 'SceneNameChanged':
+            self.scenes.pop(self.collection, None)
+        elif event_type == 'CurrentSceneCollectionChanging':
+            self.collection = None
+        elif event_type == 'CurrentSceneCollectionChanged':
+            self.collection = event_data['sceneCollectionName']
+            # Scenes could have changed while we weren't watching it
+            self.scenes.pop(self.collection, None)
+
+    @staticmethod
+    def _scene_names(scenes):
+        """Get the scene names in the same order as the scene list that
+        set_scene counts through
+
+        :param scenes: The scenes from GetSceneList or SceneListChanged
+        :type scenes: list
+        :return: The scene names
+        :rtype: list
+        """
+        return [x['sceneName'] for x in scenes]
+
+    async def get_scene_names(self, session, refresh=False):
+        """Get the scene names for the current scene collection, from the
+        cache if we can
+
+        :param session: An open session with OBS WebSockets
+        :type session: ObsSession
+        :param refresh: Fetch the scene list even if it's already cached
+        :type refresh: bool
+        :return: The scene names from the top down
+        :rtype: list
+        """
+        if session is not self.session:
+            self.attach(session)
+        if refresh or self.scenes.get(self.collection) is None:
+            collection, scene_list = await session.call_batch(
+                [('GetSceneCollectionList', None), ('GetSceneList', None)])
+            self.collection = collection['currentSceneCollectionName']
+            self.scenes[self.collection] = \
+                self._scene_names(scene_list['scenes'])
+        return self.scenes[self.collection]
+
+    async def set_scene_number(self, scene_number, session):
+        """Set the current scene by its number, from the top down
+
+        :param scene_number: The scene number to make active
+        :type scene_number: int
+        :param session: An open session with OBS WebSockets
+        :type session: ObsSession
+        """
+        scenes = await self.get_scene_names(session)
+        try:
+            # Adjust for zero indexing
+            await ws_set_scene(scenes[scene_number - 1], session)
+        except (IndexError, ObsRequestError) as e:
+            if isinstance(e, ObsRequestError) and \
+                    e.code != RESOURCE_NOT_FOUND:
+                raise
+            # The cached list was out of date, fetch it again and retry
+            scenes = await self.get_scene_names(session, refresh=True)
+            await ws_set_scene(scenes[scene_number - 1], session)
+
+
+class ResponseCache:
+    """Keep the responses to read only requests, such as GetVersion or
+    GetInputList, for a short time so that buttons which only read from OBS
+    don't send it the same request on every press.  Every obs-websocket
+    request that starts with Get only reads from OBS.
+
+    :cvar responses: The response data and the time it expires, keyed by the
+        request type and data
+    """
+
+    def __init__(self):
+        self.responses = dict()
+
+    def clear(self):
+        """Forget every response, e.g. after reconnecting to OBS"""
+        self.responses.clear()
+
+    async def call(self, request_type, data, cache_ttl, session):
+        """Make a request to OBS, or return the cached response if the same
+        request was made less than cache_ttl seconds ago
+
+        :param request_type: The obs-websocket request type
+        :type request_type: str
+        :param data: The request data, if any
+        :type data: dict
+        :param cache_ttl: How long the response can be cached for, in
+            seconds.  0 never uses the cache
+        :type cache_ttl: float
+        :param session: An open session with OBS WebSockets
+        :type session: ObsSession
+        :return: The response data from OBS
+        :rtype: dict
+        """
+        if cache_ttl <= 0 or not request_type.startswith('Get'):
+            return await session.call(request_type, data)
+        key = (request_type, json.dumps(data, sort_keys=True))
+        now = time.monotonic()
+        if key in self.responses and self.responses[key][1] > now:
+            return self.responses[key][0]
+        response = await session.call(request_type, data)
+        self.responses[key] = (response, now + cache_ttl)
+        return response
+
+
+class ObsSessionPool:
+    """Keep an identified session open with each of several OBS WebSockets
+    servers, such as separate streaming and recording machines, so that an
+    action can be run on any number of them at the same time.  A session is
+    connected the first time it's needed, or every one of them up front with
+    connect_all, and connected again if it has been lost.  Each target has a
+    SceneCache and a ResponseCache of its own, as their scenes and responses
+    differ::
+
+        pool = ObsSessionPool(dict([('streaming', ('localhost', 4455, '')),
+                                    ('recording', ('rec.lan', 4455, ''))]))
+        results = await pool.fan_out(['streaming', 'recording'],
+                                     ws_set_mutes, ['Mic/Aux'], True)
+
+    :param targets: The host, port and password of the OBS WebSockets server
+        for each target, keyed by the target name
+    :type targets: dict
+    :param event_subscriptions: The EVENTS_ bits for the events each session
+        should receive, defaults to none
+    :type event_subscriptions: int
+    :cvar sessions: The session with each target, once connected
+    :cvar scene_caches: The SceneCache for each target
+    :cvar response_caches: The ResponseCache for each target
+    """
+
+    def __init__(self, targets, event_subscriptions=0):
+        self.targets = dict(targets)
+        self.event_subscriptions = event_subscriptions
+        self.sessions = dict()
+        self.scene_caches = dict([(x, SceneCache()) for x in self.targets])
+        self.response_caches = dict([(x, ResponseCache())
+                                     for x in self.targets])
+        self._locks = dict()
+
+    async def get(self, name):
+        """Return the session with a target, connecting and identifying
+        again if the connection has been lost
+
+        :param name: The name of the target
+        :type name: str
+        :return: The identified session
+        :rtype: ObsSession
+        """
+        if name not in self.targets:
+            raise ValueError(f"No OBS target called {name} has been set up")
+        # So actions running at the same time don't both connect
+        lock = self._locks.setdefault(name, asyncio.Lock())
+        async with lock:
+            session = self.sessions.get(name)
+            if session is None or not session.identified:
+                if session:
+                    await session.disconnect()
+                host, port, ws_password = self.targets[name]
+                session = ObsSession(ws_password, self.event_subscriptions,
+                                     host, port)
+                self.sessions[name] = session
+                # Receive the events that keep the scene cache up to date
+                self.scene_caches[name].attach(session)
+                self.response_caches[name].clear()
+                await session.connect()
+        return session
+
+    def target_name(self, session):
+        """Get the name of the target a session is with
+
+        :param session: A session from this pool
+        :type session: ObsSession
+        :rtype: str
+        """
+        for name, x in self.sessions.items():
+            if x is session:
+                return name
+        raise ValueError('The session is not from this pool')
+
+    async def connect_all(self):
+        """Connect to every target at the same time, so that they're all
+        identified before an action needs them
+
+        :return: The error for each target that couldn't be connected to,
+            keyed by the target name
+        :rtype: dict
+        """
+        results = await asyncio.gather(*[self.get(x) for x in self.targets],
+                                       return_exceptions=True)
+        return dict([(name, result) for name, result
+                     in zip(self.targets, results)
+                     if isinstance(result, Exception)])
+
+    async def close(self):
+        """Disconnect from every target"""
+        await asyncio.gather(*[x.disconnect() for x in self.sessions.values()],
+                             return_exceptions=True)
+
+    async def fan_out(self, names, ws_func, *args):
+        """Run one of the ws_ coroutines on several targets at the same time,
+        a failure on one target does not stop the others.  The time taken on
+        each target is recorded as the obs_target:name phase.
+
+        :param names: The names of the targets
+        :type names: list
+        :param ws_func: The coroutine function to run, which takes the session
+            as its last argument
+        :type ws_func: function
+        :return: The result from the coroutine, or the exception it raised,
+            keyed by the target name
+        :rtype: dict
+        """
+        async def run(name):
+            with timings.Span(f"obs_target:{name}"):
+                return await ws_func(*args, await self.get(name))
+
+        results = await asyncio.gather(*[run(x) for x in names],
+                                       return_exceptions=True)
+        return dict(zip(names, results))
+
+
+class SourceInventory:
+    """The inputs from a GetInputList response, indexed by name and by kind,
+    so the setup wizard can fill each list with just the sources that belong
+    in it, without going through every input each time
+
+    :param inputs: The inputs from a GetInputList response
+    :type inputs: list
+    :param audio_inputs: The names of the inputs that have audio, any kind of
+        input can, e.g. a media source.  Defaults to every input
+    :type audio_inputs: list
+    :cvar kinds: The kind of each input, keyed by the input name, in the
+        same order as OBS
+    :cvar by_kind: The names of the inputs of each kind, keyed by kind
+    :cvar audio_sources: The names of the inputs that have audio, in the
+        same order as OBS
+    :cvar browser_sources: The names of the browser sources
+    """
+
+    def __init__(self, inputs, audio_inputs=None):
+        self.kinds = dict()
+        self.by_kind = dict()
+        self._positions = dict()
+        for item in inputs:
+            # Prefer the kind without the version, so browser_source_v2 would
+            # still be a browser_source
+            kind = item.get('unversionedInputKind') or item['inputKind']
+            self._positions[item['inputName']] = len(self.kinds)
+            self.kinds[item['inputName']] = kind
+            self.by_kind.setdefault(kind, []).append(item['inputName'])
+        if audio_inputs is None:
+            self.audio_sources = list(self.kinds)
+        else:
+            self.audio_sources = sorted(
+                [x for x in set(audio_inputs) if x in self.kinds],
+                key=self._positions.get)
+        self.browser_sources = self.names([BROWSER_SOURCE_KIND])
+
+    def __contains__(self, name):
+        return name in self.kinds
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def names(self, kinds):
+        """The names of the inputs of any of the given kinds, in the same
+        order as OBS
+
+        :param kinds: The input kinds
+        :type kinds: list
+        :rtype: list
+        """
+        names = [name for kind in set(kinds)
+                 for name in self.by_kind.get(kind, ())]
+        # Put the kinds back together in the order OBS has them
+        return sorted(names, key=self._positions.get)
+
+
+async def _in_session(ws_password, ws_func, *args, host=conf.OBS_WS_HOST,
+                      port=conf.OBS_WS_PORT):
+    """Run one of the ws_ coroutines in a new session, disconnecting
+    afterwards
+
+    :param ws_password: The password for the OBS WebSockets server
+    :type ws_password: str
+    :param ws_func: The coroutine function to run, which takes the session as
+        its last argument
+    :type ws_func: function
+    :param host: The OBS WebSockets server
+    :type host: str
+    :param port: The OBS WebSockets server port
+    :type port: int
+    :return: The result from the coroutine
+    """
+    async with ObsSession(ws_password, host=host, port=port) as session:
+        return await ws_func(*args, session)
+
+
+def mute_requests(sources, muted=None):
+    """The requests to mute/unmute several audio sources, so they can be sent
+    in a batch along with other requests
+
+    :param sources: The OBS audio sources to mute/unmute
+    :type sources: list
+    :param muted: True to mute the sources and False to unmute them, None
+        toggles them
+    :type muted: bool
+    :return: The requests, as (request_type, data) pairs
+    :rtype: list
+    """
+    if muted is None:
+        return [('ToggleInputMute', {'inputName': source})
+                for source in sources]
+    return [('SetInputMute', {'inputName': source, 'inputMuted': muted})
+            for source in sources]
+
+
+def browser_source_requests(source_urls, enabled):
+    """The requests to set browser sources to either their own URLs or
+    DISABLED_URL, so they can be sent in a batch along with other requests
+
+    :param source_urls: The URL of each browser source when enabled, keyed
+        by the source name
+    :type source_urls: dict
+    :param enabled: True to set the sources to their own URLs, False to set
+        them to DISABLED_URL
+    :type enabled: bool
+    :return: The requests, as (request_type, data) pairs
+    :rtype: list
+    """
+    return [('SetInputSettings',
+             {'inputName': source,
+              'inputSettings': {'url': url if enabled else DISABLED_URL}})
+            for source, url in source_urls.items()]
+
+
+async def ws_toggle_mute(source, session):
     """Use the OBS-Websocket to mute/unmute an audio source
 
     :param source: The OBS audio source to mute/unmute
     :type source: str
-    :param ws: OBS WebSockets library created in cli_tools
-    :type ws: simpleobsws.obsws
-    """
-    # Make the connection to obs-websocket
-    await ws.connect()
-    await ws.wait_until_identified()
-    data = {'inputName': source}
-    request = simpleobsws.Request('ToggleInputMute', requestData=data)
-    await ws.call(request)
-    # Clean things up by disconnecting. Only really required in a few specific
-    # situations, but good practice if you are done making requests or listening
-    # to events.
-    await ws.disconnect()
-
-
-async def _ws_get_scene_list(ws):
+    :param session: An open session with OBS WebSockets
+    :type session: ObsSession
+    """
+    await session.call('ToggleInputMute', {'inputName': source})
+
+
+async def ws_toggle_mutes(sources, session):
+    """Use the OBS-Websocket to mute/unmute several audio sources in one
+    batch
+
+    :param sources: The OBS audio sources to mute/unmute
+    :type sources: list
+    :param session: An open session with OBS WebSockets
+    :type session: ObsSession
+    """
+    await session.call_batch(mute_requests(sources))
+
+
+async def ws_set_mutes(sources, muted, session):
+    """Use the OBS-Websocket to mute or unmute several audio sources in one
+    batch, whatever their current state
+
+    :param sources: The OBS audio sources to mute/unmute
+    :type sources: list
+    :param muted: True to mute the sources, False to unmute them
+    :type muted: bool
+    :param session: An open session with OBS WebSockets
+    :type session: ObsSession
+    """
+    await session.call_batch(mute_requests(sources, muted))
+
+
+async def ws_get_scene_list(session):
     """Use the OBS-Websocket to get the list of scenes
 
-    :param ws: OBS WebSockets library created in cli_tools
-    :type ws: simpleobsws.obsws
+    :param session: An open session with OBS WebSockets
+    :type session: ObsSession
     :return: The currently active scene and an ordered list of all scenes
         configured in OBS
     :rtype: dict
     """
-    # Make the connection to obs-websocket
-    await ws.connect()
-    await ws.wait_until_identified()
-    request = simpleobsws.Request('GetSceneList')
-    result = await ws.call(request)
-    # Clean things up by disconnecting. Only really required in a few specific
-    # situations, but good practice if you are done making requests or listening
-    # to events.
-    await ws.disconnect()
-    return result.responseData
+    return await session.call('GetSceneList')
 
 
-async def _ws_set_scene(scene, ws):
+async def ws_set_scene(scene, session):
     """Use the OBS-Websocket to set the current scene
 
     :param scene: The name of the scene in OBS to make active
     :type scene: str
-    :param ws: OBS WebSockets library created in cli_tools
-    :type ws: simpleobsws.obsws
-    """
-    # Make the connection to obs-websocket
-    await ws.connect()
-    await ws.wait_until_identified()
-    data = {'sceneName': scene}
-    request = simpleobsws.Request('SetCurrentProgramScene', requestData=data)
-    await ws.call(request)
-    # Clean things up by disconnecting. Only really required in a few specific
-    # situations, but good practice if you are done making requests or listening
-    # to events.
-    await ws.disconnect()
-
-
-async def _ws_start_stop_stream(ws):
+    :param session: An open session with OBS WebSockets
+    :type session: ObsSession
+    """
+    await session.call('SetCurrentProgramScene', {'sceneName': scene})
+
+
+async def ws_set_scene_number(scene_number, session):
+    """Use the OBS-Websocket to get the list of scenes and set the current
+    scene by its number
+
+    :param scene_number: The scene number to make active, from the top down
+    :type scene_number: int
+    :param session: An open session with OBS WebSockets
+    :type session: ObsSession
+    :return: The scene list from before the scene was changed
+    :rtype: dict
+    """
+    scene_list = await ws_get_scene_list(session)
+    # Adjust for zero indexing
+    scene_number = scene_number - 1
+    new_scene = scene_list['scenes'][scene_number]['sceneName']
+    await ws_set_scene(new_scene, session)
+    return scene_list
+
+
+async def ws_start_stop_stream(session):
     """Use the OBS-Websocket to start or stop streaming
 
-    :param ws: OBS WebSockets library created in cli_tools
-    :type ws: simpleobsws.obsws
+    :param session: An open session with OBS WebSockets
+    :type session: ObsSession
+    """
+    await session.call('ToggleStream')
+
+
+async def ws_set_stream(active, session):
+    """Use the OBS-Websocket to start or stop streaming, whatever the
+    current state of the stream
+
+    :param active: True to start the stream, False to stop it
+    :type active: bool
+    :param session: An open session with OBS WebSockets
+    :type session: ObsSession
     """
-    # Make the connection to obs-websocket
-    await ws.connect()
-    await ws.wait_until_identified()
-    request = simpleobsws.Request('ToggleStream')
-    await ws.call(request)
-    # Clean things up by disconnecting. Only really required in a few specific
-    # situations, but good practice if you are done making requests or listening
-    # to events.
-    await ws.disconnect()
+    try:
+        await session.call('StartStream' if active else 'StopStream')
+    except ObsRequestError as e:
+        # Already in the state we asked for, nothing to do
+        if e.code not in (OUTPUT_RUNNING, OUTPUT_NOT_RUNNING):
+            raise
 
 
-async def _ws_get_source_settings(source, ws):
+async def ws_get_source_settings(source, session):
     """Use the OBS-Websocket to get the settings for a source
 
     :param source: The OBS source to get the settings for
     :type source: str
-    :param ws: OBS WebSockets library created in cli_tools
-    :type ws: simpleobsws.obsws
+    :param session: An open session with OBS WebSockets
+    :type session: ObsSession
     :return: Details on the source name, type and the settings for the source
     :rtype: dict
     """
-    # Make the connection to obs-websocket
-    await ws.connect()
-    await ws.wait_until_identified()
-    data = {'inputName': source}
-    request = simpleobsws.Request('GetInputSettings', requestData=data)
-    result = await ws.call(request)
-    # Clean things up by disconnecting. Only really required in a few specific
-    # situations, but good practice if you are done making requests or listening
-    # to events.
-    await ws.disconnect()
-    return result.responseData
+    return await session.call('GetInputSettings', {'inputName': source})
 
 
-async def _ws_set_source_settings(source, settings, ws):
+async def ws_set_source_settings(source, settings, session):
     """Use the OBS-Websocket to set new settings for a source
 
     :param source: The OBS source to update
     :type source: str
     :param settings: The updated settings to apply to the source in the same
         format as the sourceSettings section returned from
-        _ws_get_source_settings
+        ws_get_source_settings
     :type settings: dict
-    :param ws: OBS WebSockets library created in cli_tools
-    :type ws: simpleobsws.obsws
-    :return: Details on the source name, type and the updated settings for the
-        source
-    :rtype: dict
+    :param session: An open session with OBS WebSockets
+    :type session: ObsSession
     """
-    # Make the connection to obs-websocket
-    await ws.connect()
-    await ws.wait_until_identified()
     data = {'inputName': source, 'inputSettings': settings}
-    request = simpleobsws.Request('SetInputSettings', requestData=data)
-    result = await ws.call(request)
-    # Clean things up by disconnecting. Only really required in a few specific
-    # situations, but good practice if you are done making requests or listening
-    # to events.
-    await ws.disconnect()
-    return result
+    await session.call('SetInputSettings', data)
+
+
+async def ws_get_sources_settings(sources, session):
+    """Use the OBS-Websocket to get the settings for several sources in one
+    batch
+
+    :param sources: The OBS sources to get the settings for
+    :type sources: list
+    :param session: An open session with OBS WebSockets
+    :type session: ObsSession
+    :return: The settings for each source, keyed by the source name
+    :rtype: dict
+    """
+    results = await session.call_batch([('GetInputSettings',
+                                         {'inputName': source})
+                                        for source in sources])
+    return dict([(source, result['inputSettings'])
+                 for source, result in zip(sources, results)])
 
 
-async def _ws_get_all_sources(ws):
+async def ws_set_sources_settings(sources_settings, session):
+    """Use the OBS-Websocket to set new settings for several sources in one
+    batch
+
+    :param sources_settings: The settings to apply, keyed by the source name.
+        Settings not included are left unchanged
+    :type sources_settings: dict
+    :param session: An open session with OBS WebSockets
+    :type session: ObsSession
+    """
+    await session.call_batch([('SetInputSettings',
+                               {'inputName': source, 'inputSettings': settings})
+                              for source, settings in sources_settings.items()])
+
+
+async def ws_toggle_browser_sources(source_urls, session):
+    """Use the OBS-Websocket to swap browser sources between DISABLED_URL and
+    their own URLs, with one batch to read their current URLs and another to
+    update them
+
+    :param source_urls: The URL of each browser source when enabled, keyed
+        by the source name
+    :type source_urls: dict
+    :param session: An open session with OBS WebSockets
+    :type session: ObsSession
+    """
+    settings = await ws_get_sources_settings(list(source_urls), session)
+    new_settings = dict()
+    for source, url in source_urls.items():
+        # Swap between invalid.lan and the value from config
+        if settings[source].get('url') == DISABLED_URL:
+            new_settings[source] = {'url': url}
+        else:
+            new_settings[source] = {'url': DISABLED_URL}
+    await ws_set_sources_settings(new_settings, session)
+
+
+async def ws_set_browser_sources(source_urls, enabled, session):
+    """Use the OBS-Websocket to set browser sources to either their own URLs
+    or DISABLED_URL in one batch, without reading their current URLs first
+
+    :param source_urls: The URL of each browser source when enabled, keyed
+        by the source name
+    :type source_urls: dict
+    :param enabled: True to set the sources to their own URLs, False to set
+        them to DISABLED_URL
+    :type enabled: bool
+    :param session: An open session with OBS WebSockets
+    :type session: ObsSession
+    """
+    await session.call_batch(browser_source_requests(source_urls, enabled))
+
+
+async def ws_request(request_type, data, session):
+    """Use the OBS-Websocket to make any request, for the actions that don't
+    have a function of their own
+
+    :param request_type: The obs-websocket request type
+    :type request_type: str
+    :param data: The request data, if any
+    :type data: dict
+    :param session: An open session with OBS WebSockets
+    :type session: ObsSession
+    :return: The response data from OBS
+    :rtype: dict
+    """
+    return await session.call(request_type, data)
+
+
+async def ws_get_all_sources(session):
     """Use the OBS-Websocket to get a list of sources
 
-    :param ws: OBS WebSockets library created in cli_tools
-    :type ws: simpleobsws.obsws
+    :param session: An open session with OBS WebSockets
+    :type session: ObsSession
     :return: a list of all sources configured in OBS
     :rtype: dict
     """
-    # Make the connection to obs-websocket
-    await ws.connect()
-    await ws.wait_until_identified()
-    request = simpleobsws.Request('GetInputList')
-    result = await ws.call(request)
-    # Clean things up by disconnecting. Only really required in a few specific
-    # situations, but good practice if you are done making requests or listening
-    # to events.
-    await ws.disconnect()
-    return result.responseData
+    return await session.call('GetInputList')
+
+
+async def ws_get_source_inventory(session):
+    """Use the OBS-Websocket to get the sources, and which of them have
+    audio.  The kind doesn't say, so every input is asked for its mute state
+    in one batch, which OBS fails for the inputs without audio
+
+    :param session: An open session with OBS WebSockets
+    :type session: ObsSession
+    :rtype: SourceInventory
+    """
+    inputs = (await ws_get_all_sources(session))['inputs']
+    mutes = await session.call_batch(
+        [('GetInputMute', dict([('inputName', x['inputName'])]))
+         for x in inputs], halt_on_failure=False, allow_failures=True)
+    return SourceInventory(inputs, [x['inputName'] for x, mute in
+                                    zip(inputs, mutes) if mute is not None])
+
+
+def submit(coro):
+    """Schedule a coroutine on the event loop shared by the synchronous
+    functions below.  The loop runs in its own daemon thread, started the
+    first time it's needed, so it can be used from any thread, including one
+    that already has its own event loop running
+
+    :param coro: The coroutine to run
+    :type coro: coroutine
+    :return: A future for the result of the coroutine
+    :rtype: concurrent.futures.Future
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=_loop.run_forever,
+                                      name='obs-controls', daemon=True)
+            thread.start()
+    return asyncio.run_coroutine_threadsafe(coro, _loop)
 
 
-def mute_audio_source(source, ws_password):
+def run_sync(coro):
+    """Run a coroutine on the shared event loop and wait for the result
+
+    :param coro: The coroutine to run
+    :type coro: coroutine
+    :return: The result from the coroutine
+    """
+    return submit(coro).result()
+
+
+def mute_audio_source(source, ws_password, muted=None, host=conf.OBS_WS_HOST,
+                      port=conf.OBS_WS_PORT):
     """Mute/Unmute the Microphone audio source as configured in sd_controls.ini
 
     :param source: the audio source to mute
     :type source: str
     :param ws_password: The password for the OBS WebSockets server
     :type ws_password: str
+    :param muted: True to mute the source and False to unmute it, whatever
+        its current state.  None toggles it
+    :type muted: bool
+    :param host: The OBS WebSockets server
+    :type host: str
+    :param port: The OBS WebSockets server port
+    :type port: int
     """
-    ws = _load_obs_ws(ws_password)
-    loop = asyncio.get_event_loop()
-    loop.run_until_complete(_ws_toggle_mute(source, ws))
+    mute_audio_sources((source, ), ws_password, muted, host, port)
 
 
-def set_scene(scene_number, ws_password):
+def mute_audio_sources(sources, ws_password, muted=None,
+                       host=conf.OBS_WS_HOST, port=conf.OBS_WS_PORT):
+    """Mute/Unmute several audio sources over a single connection
+
+    :param sources: the audio sources to mute
+    :type sources: list
+    :param ws_password: The password for the OBS WebSockets server
+    :type ws_password: str
+    :param muted: True to mute the sources and False to unmute them, whatever
+        their current state.  None toggles them
+    :type muted: bool
+    :param host: The OBS WebSockets server
+    :type host: str
+    :param port: The OBS WebSockets server port
+    :type port: int
+    """
+    if muted is None:
+        run_sync(_in_session(ws_password, ws_toggle_mutes, sources,
+                             host=host, port=port))
+    else:
+        run_sync(_in_session(ws_password, ws_set_mutes, sources, muted,
+                             host=host, port=port))
+
+
+def set_scene(scene_number, ws_password, host=conf.OBS_WS_HOST,
+              port=conf.OBS_WS_PORT):
     """Set the active scene in OBS using the number of the scene as counted
     from the top down of the scene list in OBS
 
@@ -188,46 +921,80 @@ def set_scene(scene_number, ws_password):
     :type scene_number: int
     :param ws_password: The password for the OBS WebSockets server
     :type ws_password: str
+    :param host: The OBS WebSockets server
+    :type host: str
+    :param port: The OBS WebSockets server port
+    :type port: int
     """
-    ws = _load_obs_ws(ws_password)
-    loop = asyncio.get_event_loop()
-    scene_list = loop.run_until_complete(_ws_get_scene_list(ws))
-    # Adjust for zero indexing
-    scene_number = scene_number - 1
-    new_scene = scene_list['scenes'][scene_number]['sceneName']
-    loop.run_until_complete(_ws_set_scene(new_scene, ws))
-    return scene_list
+    return run_sync(_in_session(ws_password, ws_set_scene_number,
+                                scene_number, host=host, port=port))
 
 
-def start_stop_stream(ws_password):
+def start_stop_stream(ws_password, active=None, host=conf.OBS_WS_HOST,
+                      port=conf.OBS_WS_PORT):
     """Start/Stop the stream
 
     :param ws_password: The password for the OBS WebSockets server
     :type ws_password: str
+    :param active: True to start the stream and False to stop it, whatever
+        its current state.  None toggles it
+    :type active: bool
+    :param host: The OBS WebSockets server
+    :type host: str
+    :param port: The OBS WebSockets server port
+    :type port: int
     """
-    ws = _load_obs_ws(ws_password)
-    loop = asyncio.get_event_loop()
-    loop.run_until_complete(_ws_start_stop_stream(ws))
+    if active is None:
+        run_sync(_in_session(ws_password, ws_start_stop_stream, host=host,
+                             port=port))
+    else:
+        run_sync(_in_session(ws_password, ws_set_stream, active, host=host,
+                             port=port))
 
 
-def get_source_settings(source, ws_password):
+def get_source_settings(source, ws_password, host=conf.OBS_WS_HOST,
+                        port=conf.OBS_WS_PORT):
     """Get the current settings for an OBS Source
 
     :param source: The name of the OBS source
     :type source: str
     :param ws_password: The password for the OBS WebSockets server
     :type ws_password: str
+    :param host: The OBS WebSockets server
+    :type host: str
+    :param port: The OBS WebSockets server port
+    :type port: int
     :return: The current settings for the OBS source
     :rtype: dict
     """
-    ws = _load_obs_ws(ws_password)
-    loop = asyncio.get_event_loop()
-    settings = loop.run_until_complete(_ws_get_source_settings(source, ws))
+    settings = run_sync(_in_session(ws_password, ws_get_source_settings,
+                                    source, host=host, port=port))
     settings = settings['inputSettings']
     return settings
 
 
-def set_source_settings(source, settings, ws_password):
+def get_sources_settings(sources, ws_password, host=conf.OBS_WS_HOST,
+                         port=conf.OBS_WS_PORT):
+    """Get the current settings for several OBS Sources over a single
+    connection, in one batch
+
+    :param sources: The names of the OBS sources
+    :type sources: list
+    :param ws_password: The password for the OBS WebSockets server
+    :type ws_password: str
+    :param host: The OBS WebSockets server
+    :type host: str
+    :param port: The OBS WebSockets server port
+    :type port: int
+    :return: The current settings for each source, keyed by the source name
+    :rtype: dict
+    """
+    return run_sync(_in_session(ws_password, ws_get_sources_settings,
+                                list(sources), host=host, port=port))
+
+
+def set_source_settings(source, settings, ws_password,
+                        host=conf.OBS_WS_HOST, port=conf.OBS_WS_PORT):
     """Apply new settings for the selected source
 
     :param source: The name of the OBS source
@@ -238,21 +1005,108 @@ def set_source_settings(source, settings, ws_password):
     :type settings: dict
     :param ws_password: The password for the OBS WebSockets server
     :type ws_password: str
+    :param host: The OBS WebSockets server
+    :type host: str
+    :param port: The OBS WebSockets server port
+    :type port: int
+    """
+    run_sync(_in_session(ws_password, ws_set_source_settings, source,
+                         settings, host=host, port=port))
+
+
+def toggle_browser_sources(source_urls, ws_password, host=conf.OBS_WS_HOST,
+                           port=conf.OBS_WS_PORT):
+    """Swap browser sources between DISABLED_URL and their own URLs over a
+    single connection
+
+    :param source_urls: The URL of each browser source when enabled, keyed
+        by the source name
+    :type source_urls: dict
+    :param ws_password: The password for the OBS WebSockets server
+    :type ws_password: str
+    :param host: The OBS WebSockets server
+    :type host: str
+    :param port: The OBS WebSockets server port
+    :type port: int
     """
-    ws = _load_obs_ws(ws_password)
-    loop = asyncio.get_event_loop()
-    loop.run_until_complete(_ws_set_source_settings(source, settings, ws))
+    run_sync(_in_session(ws_password, ws_toggle_browser_sources,
+                         source_urls, host=host, port=port))
 
 
-def get_all_sources(ws_password):
+def set_browser_sources(source_urls, enabled, ws_password,
+                        host=conf.OBS_WS_HOST, port=conf.OBS_WS_PORT):
+    """Set browser sources to either their own URLs or DISABLED_URL over a
+    single connection
+
+    :param source_urls: The URL of each browser source when enabled, keyed
+        by the source name
+    :type source_urls: dict
+    :param enabled: True to set the sources to their own URLs, False to set
+        them to DISABLED_URL
+    :type enabled: bool
+    :param ws_password: The password for the OBS WebSockets server
+    :type ws_password: str
+    :param host: The OBS WebSockets server
+    :type host: str
+    :param port: The OBS WebSockets server port
+    :type port: int
+    """
+    run_sync(_in_session(ws_password, ws_set_browser_sources, source_urls,
+                         enabled, host=host, port=port))
+
+
+def get_all_sources(ws_password, host=conf.OBS_WS_HOST, port=conf.OBS_WS_PORT):
     """Get a list of all sources currently configured in OBS
 
     :param ws_password: The password for the OBS WebSockets server
     :type ws_password: str
+    :param host: The OBS WebSockets server
+    :type host: str
+    :param port: The OBS WebSockets server port
+    :type port: int
     :return: A list of sources
     :rtype: list
     """
-    ws = _load_obs_ws(ws_password)
-    loop = asyncio.get_event_loop()
-    results = loop.run_until_complete(_ws_get_all_sources(ws))
-    return results
+    return run_sync(_in_session(ws_password, ws_get_all_sources, host=host,
+                                port=port))
+
+
+def get_source_inventory(ws_password, host=conf.OBS_WS_HOST,
+                         port=conf.OBS_WS_PORT):
+    """Get all of the sources currently configured in OBS, indexed by name
+    and by kind, and which of them have audio
+
+    :param ws_password: The password for the OBS WebSockets server
+    :type ws_password: str
+    :param host: The OBS WebSockets server
+    :type host: str
+    :param port: The OBS WebSockets server port
+    :type port: int
+    :rtype: SourceInventory
+    """
+    return run_sync(_in_session(ws_password, ws_get_source_inventory,
+                                host=host, port=port))
+
+
+def obs_request(request_type, data, ws_password, host=conf.OBS_WS_HOST,
+                port=conf.OBS_WS_PORT):
+    """Make any request to OBS
+
+    :param request_type: The obs-websocket request type
+    :type request_type: str
+    :param data: The request data, if any
+    :type data: dict
+    :param ws_password: The password for the OBS WebSockets server
+    :type ws_password: str
+    :param host: The OBS WebSockets server
+    :type host: str
+    :param port: The OBS WebSockets server port
+    :type port: int
+    :return: The response data from OBS
+    :rtype: dict
+    """
+    return run_sync(_in_session(ws_password, ws_request, request_type, data,
+                                host=host, port=port))
+
+
+timings.record('import_obs_controls', _import_started)
@@ -21,6 +21,7 @@ OBSWSPASS_WARN = """Unable to connect to OBS WebSockets.  Please make sure that:
 1) OBS is running
 2) OBS WebSockets is enabled
 3) The password and port number are correct"""
+OBSWSPASS_BUSY = 'Connecting to OBS WebSockets...'
 
 OBSAUDIO_HEADING = 'Select OBS Audio Sources'
 OBSAUDIO_TEXT = 'Please select your Microphone and Desktop Audio sources. ' \
@@ -34,12 +35,21 @@ OBSALERT_TEXT = 'Please select the browser sources used for notifications ' \
                 '"Live Safety" function'
 OBSALERT_SOURCE_PROMPT = 'OBS Sources'
 OBSALERT_ALERT_PROMPT = 'Notification/Chat Sources'
+OBSALERT_BUSY = 'Getting the browser source URLs from OBS...'
 
 LAUNCH_TWITCH_HEADING = 'Authorise OBS Streamdeck CTL with Twitch'
 LAUNCH_TWITCH_TEXT = 'Please provide your Twitch channel name then click Next' \
                      ' to launch a new web browser tab and authorise OBS ' \
                      'Streamdeck CTL to use your twitch account.'
 LAUNCH_TWITCH_PROMPT = 'Twitch channel name'
+LAUNCH_TWITCH_BUSY = 'Waiting for you to authorise OBS Streamdeck CTL in ' \
+                     'your web browser...'
+LAUNCH_TWITCH_WARN_HEADER = 'Could not authorise with Twitch'
+LAUNCH_TWITCH_TIMEOUT = 'Twitch did not respond in time. Please click Next ' \
+                        'to try again.'
+LAUNCH_TWITCH_PORT = 'Unable to listen for the response from Twitch:\n\n{}' \
+                     '\n\nPlease close anything else using the port and ' \
+                     'try again.'
 
 START_STOP_HEADING = 'Offline Safety Features'
 START_STOP_TEXT = 'The Start/Stop function can be used to lock down your chat' \
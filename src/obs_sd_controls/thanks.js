@@ -7,7 +7,7 @@ function paramsToObject(entries) {
 }
 
 function post(data) {
-    return fetch('http://localhost:8000/', {
+    return fetch('/', {
             method: 'POST',
             headers: {
                 'Accept': 'application/json',
@@ -0,0 +1,123 @@
+import json
+import os
+import sys
+import time
+
+# Set this to 1 to record the timings for every action, the same as passing
+# --timings
+ENV_VAR = 'OBS_STREAMDECK_TIMINGS'
+# The timings log is rotated when it reaches this size, keeping LOG_BACKUPS
+# old logs
+LOG_MAX_BYTES = 1024 * 1024
+LOG_BACKUPS = 5
+# Imported by cli_entry before anything else, so this is as close to the
+# start of the program as we can get
+STARTED = time.monotonic()
+_phases = None
+
+
+def enable():
+    """Start recording the phases of this invocation"""
+    global _phases
+    if _phases is None:
+        _phases = []
+
+
+def record(name, start, end=None):
+    """Record a phase of the action, if timings are enabled.  Phases can be
+    recorded from any thread.
+
+    :param name: The name of the phase
+    :type name: str
+    :param start: When the phase started, from time.monotonic()
+    :type start: float
+    :param end: When the phase ended, defaults to now
+    :type end: float
+    """
+    if _phases is not None:
+        _phases.append((name, start, time.monotonic() if end is None else
+                        end))
+
+
+class Span:
+    """Record the time spent inside a with block as a phase::
+
+        with timings.Span('load_settings'):
+            settings = load_settings()
+
+    :param name: The name of the phase
+    :type name: str
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        record(self.name, self.start)
+
+
+def _process_age():
+    """How long ago the process was started, so the time the interpreter
+    took to start up can be included.  Only Linux makes this available
+
+    :return: The age of the process in seconds, or None if it isn't known
+    :rtype: float
+    """
+    try:
+        with open('/proc/self/stat') as f:
+            # The process name can have spaces in it, so count from the end
+            # of it.  starttime is the 22nd field, in clock ticks since boot
+            fields = f.read().rpartition(')')[2].split()
+        started = int(fields[19]) / os.sysconf('SC_CLK_TCK')
+        return time.clock_gettime(time.CLOCK_BOOTTIME) - started
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def write(action, error=None):
+    """Write the recorded phases as a single line of JSON to the rotating
+    timings log, if timings are enabled
+
+    :param action: The action that was run
+    :type action: str
+    :param error: The error the action failed with, if any
+    :type error: Exception
+    """
+    if _phases is None:
+        return
+    now = time.monotonic()
+    age = _process_age()
+    # The interpreter start up is everything before this module was imported
+    startup = None if age is None else max(age - (now - STARTED), 0)
+    entry = dict([
+        ('time', time.time()),
+        ('action', action),
+        ('argv', sys.argv[1:]),
+        ('ok', error is None),
+        ('error', None if error is None else
+            f"{type(error).__name__}: {error}"),
+        ('startup_ms', None if startup is None else round(startup * 1000, 3)),
+        ('total_ms', round((now - STARTED) * 1000, 3)),
+        ('phases', [dict([('name', name),
+                          ('start_ms', round((start - STARTED) * 1000, 3)),
+                          ('ms', round((end - start) * 1000, 3))])
+                    for name, start, end in list(_phases)])])
+    # Only loaded when timings are enabled, as logging isn't cheap to import
+    import logging
+    from logging.handlers import RotatingFileHandler
+    from appdirs import user_log_dir
+    log_dir = user_log_dir('obs-streamdeck-ctl', 'djnrrd')
+    os.makedirs(log_dir, exist_ok=True)
+    handler = RotatingFileHandler(os.path.join(log_dir, 'timings.jsonl'),
+                                  maxBytes=LOG_MAX_BYTES,
+                                  backupCount=LOG_BACKUPS)
+    try:
+        handler.emit(logging.makeLogRecord(dict([('msg', json.dumps(entry)),
+                                                 ('levelno', logging.INFO)])))
+    finally:
+        handler.close()
@@ -1,5 +1,243 @@
-from irc.bot import SingleServerIRCBot
-from . import conf
+import time
+# Time the imports, the IRC libraries take a while to load
+_import_started = time.monotonic()
+import threading
+from irc.bot import SingleServerIRCBot, ExponentialBackoff, ReconnectStrategy
+from . import conf, timings
+
+# The shortest and longest waits between attempts to reconnect to Twitch chat
+RECONNECT_MIN = 1
+RECONNECT_MAX = 60
+
+
+# How many minutes are in each unit of time Twitch accepts for /followers
+FOLLOW_UNITS = (('mo', 60 * 24 * 30), ('m', 1), ('h', 60), ('d', 60 * 24),
+                ('w', 60 * 24 * 7))
+
+
+def _follow_minutes(follow_time):
+    """Convert a follow time for the /followers command, such as 10m, 1 hour
+    or 2 weeks, to the number of minutes Twitch reports in ROOMSTATE
+
+    :param follow_time: The follow time
+    :type follow_time: str
+    :return: The number of minutes, or None if the follow time isn't
+        understood
+    :rtype: int
+    """
+    follow_time = follow_time.strip().lower()
+    if not follow_time:
+        return 0
+    number = follow_time.rstrip('abcdefghijklmnopqrstuvwxyz ')
+    unit = follow_time[len(number):].strip() or 'm'
+    if not number.isdigit():
+        return None
+    for prefix, minutes in FOLLOW_UNITS:
+        if unit.startswith(prefix):
+            return int(number) * minutes
+    return None
+
+
+class RoomState:
+    """The chat modes of a channel, kept up to date from the ROOMSTATE tags
+    that Twitch sends.  Twitch sends every tag when the channel is joined, but
+    only the tag that changed after that, so updates are applied on top of
+    what we already know.
+
+    Chat commands can also be applied as soon as they're sent, so that a
+    second button press doesn't act on modes that Twitch hasn't confirmed
+    yet.  Until Twitch does confirm them, any older ROOMSTATE tags that arrive
+    in the meantime don't overwrite them.
+
+    :param tags: The ROOMSTATE tags from Twitch IRC
+    :type tags: dict
+    :cvar emote_only: If Emote Only chat is on
+    :cvar followers_only: How many minutes a user has to follow for before
+        they can chat, or -1 if Followers only chat is off
+    :cvar subs_only: If Subscriber only chat is on
+    :cvar slow: How many seconds users have to wait between messages, or 0 if
+        slow mode is off
+    :cvar r9k: If Unique chat is on
+    """
+    # The attribute for each ROOMSTATE tag, and how to convert its value
+    TAGS = {'emote-only': ('emote_only', lambda x: x == '1'),
+            'followers-only': ('followers_only', int),
+            'subs-only': ('subs_only', lambda x: x == '1'),
+            'slow': ('slow', int),
+            'r9k': ('r9k', lambda x: x == '1')}
+    # The attribute and new value for each chat command that switches a mode
+    COMMANDS = {'/emoteonly': ('emote_only', True),
+                '/emoteonlyoff': ('emote_only', False),
+                '/followersoff': ('followers_only', -1),
+                '/subscribers': ('subs_only', True),
+                '/subscribersoff': ('subs_only', False),
+                '/slowoff': ('slow', 0),
+                '/uniquechat': ('r9k', True),
+                '/uniquechatoff': ('r9k', False)}
+
+    def __init__(self, tags=None):
+        self.emote_only = False
+        self.followers_only = -1
+        self.subs_only = False
+        self.slow = 0
+        self.r9k = False
+        self._pending = dict()
+        if tags:
+            self.update(tags)
+
+    @property
+    def followers_mode(self):
+        """If Followers only chat is on"""
+        return self.followers_only >= 0
+
+    @property
+    def locked(self):
+        """If chat is locked down to Followers or Subscribers"""
+        return self.followers_mode or self.subs_only
+
+    def reset(self):
+        """Forget the changes waiting on Twitch, ready for the full ROOMSTATE
+        sent when the channel is joined again"""
+        self._pending = dict()
+
+    def update(self, tags):
+        """Apply ROOMSTATE tags from Twitch
+
+        :param tags: The ROOMSTATE tags from Twitch IRC, all of them or just
+            the ones that changed
+        :type tags: dict
+        """
+        for tag, value in tags.items():
+            if tag not in self.TAGS:
+                continue
+            attr, convert = self.TAGS[tag]
+            value = convert(value)
+            pending = self._pending.get(attr)
+            if pending and value in pending:
+                # Twitch has caught up with one of our changes, keep any
+                # later ones that it hasn't confirmed yet
+                del pending[:pending.index(value) + 1]
+                if pending:
+                    continue
+            else:
+                # Someone else changed the mode, so Twitch knows best
+                self._pending.pop(attr, None)
+            setattr(self, attr, value)
+
+    def apply_command(self, command):
+        """Apply a chat command that has just been sent, before Twitch has
+        confirmed it
+
+        :param command: The chat command
+        :type command: str
+        """
+        name, _, args = command.partition(' ')
+        if name in self.COMMANDS:
+            attr, value = self.COMMANDS[name]
+        elif name == '/followers':
+            attr, value = 'followers_only', _follow_minutes(args)
+        elif name == '/slow':
+            attr, value = 'slow', int(args) if args.strip().isdigit() else 30
+        else:
+            return
+        if value is None:
+            # We don't know how many minutes Twitch will report, so just
+            # switch the mode on and take Twitch's word for the minutes
+            self.followers_only = max(self.followers_only, 0)
+            return
+        self._pending.setdefault(attr, []).append(value)
+        setattr(self, attr, value)
+
+
+def _mode_command(current, target, on_command, off_command):
+    """Pick the command to switch a chat mode on or off
+
+    :param current: If the chat mode is currently on
+    :type current: bool
+    :param target: If the chat mode should be on, or None to toggle it
+    :type target: bool
+    :param on_command: The command to switch the chat mode on
+    :type on_command: str
+    :param off_command: The command to switch the chat mode off
+    :type off_command: str
+    :return: The command to send, or None if the mode is already as requested
+    :rtype: str
+    """
+    if target is None:
+        target = not current
+    if target == current:
+        return None
+    return on_command if target else off_command
+
+
+def safety_commands(room_state, enabled, emote_mode, method, follow_time,
+                    target=None):
+    """Work out the chat commands required to toggle the requested safety
+    modes, based on the current chat modes of the channel
+
+    :param room_state: The current chat modes of the channel
+    :type room_state: RoomState
+    :param enabled: If this safety mode is enabled
+    :type enabled: bool
+    :param emote_mode: If Emote Only chat is part of the requested safety
+        mode
+    :type emote_mode: bool
+    :param method: The preferred chat lockdown method
+    :type method: str
+    :param follow_time: If the lockdown method is Followers only, the length
+        of follow time allowed before a user can chat
+    :type follow_time: str
+    :param target: True to switch the safety modes on and False to switch
+        them off, whatever their current state.  None toggles them
+    :type target: bool
+    :return: The chat commands to send to the channel
+    :rtype: list
+    """
+    commands = []
+    if not enabled:
+        return commands
+    # check if emote mode was selected
+    if emote_mode:
+        commands.append(_mode_command(room_state.emote_only, target,
+                                      '/emoteonly', '/emoteonlyoff'))
+    # Check which method we're locking down to
+    if method == 'FOLLOWER':
+        commands.append(_mode_command(room_state.followers_mode, target,
+                                      f"/followers {follow_time}",
+                                      '/followersoff'))
+    elif method == 'SUBSCRIBER':
+        commands.append(_mode_command(room_state.subs_only, target,
+                                      '/subscribers', '/subscribersoff'))
+    return [x for x in commands if x]
+
+
+def live_commands(room_state, enabled, advert, clear_chat, target=None):
+    """Work out the live related chat commands that run before the chat modes
+    are locked down.  These are only sent if chat is not already locked down
+
+    :param room_state: The current chat modes of the channel
+    :type room_state: RoomState
+    :param enabled: If this safety mode is enabled
+    :type enabled: bool
+    :param advert: If a 1m advert should currently be played
+    :type advert: bool
+    :param clear_chat: If chat should be cleared
+    :type clear_chat: bool
+    :param target: False if the safety modes are being switched off, in which
+        case there's nothing to do
+    :type target: bool
+    :return: The chat commands to send to the channel
+    :rtype: list
+    """
+    commands = []
+    if target is False:
+        return commands
+    if enabled and not room_state.locked:
+        if advert:
+            commands.append('/commercial 60')
+        if clear_chat:
+            commands.append('/clear')
+    return commands
 
 
 class TwitchSafetyBot(SingleServerIRCBot):
@@ -20,6 +258,13 @@ class TwitchSafetyBot(SingleServerIRCBot):
     :param follow_time: If the lockdown method is Followers only, the length
         of follow time allowed before a user can chat
     :type follow_time: str
+    :param target: True to switch the safety modes on and False to switch
+        them off, whatever their current state.  None toggles them
+    :type target: bool
+    :param host: The Twitch IRC server
+    :type host: str
+    :param port: The Twitch IRC server port
+    :type port: int
     :cvar VERSION: IRC Bot Version
     :cvar channel: The user's chat channel
     :cvar enabled: If this safety mode is enabled
@@ -27,24 +272,33 @@ class TwitchSafetyBot(SingleServerIRCBot):
     :cvar method: The preferred chat lockdown method
     :cvar follow_time: If the lockdown method is Followers only, the length
         of follow time allowed before a user can chat
+    :cvar target: The requested state for the safety modes
+    :cvar started: When the bot was created, for the timings
+    :cvar welcomed: When Twitch welcomed the bot, for the timings
     """
     VERSION = conf.VERSION
 
     def __init__(self, nickname, token, enabled, emote_mode, method,
-                 follow_time):
+                 follow_time, target=None, host=conf.TWITCH_IRC_HOST,
+                 port=conf.TWITCH_IRC_PORT):
         token = f"oauth:{token}"
-        super().__init__([('irc.twitch.tv', 6667, token)], nickname,
-                         nickname)
+        super().__init__([(host, port, token)], nickname, nickname)
         self.channel = nickname
         self.enabled = enabled
         self.emote_mode = emote_mode
         self.method = method
         self.follow_time = follow_time
+        self.target = target
+        self.started = time.monotonic()
+        self.welcomed = None
 
     def on_welcome(self, connection, event):
         """Event handler to make sure the extra twitch capabilities are
         requested and to join the user's channel
         """
+        self.welcomed = time.monotonic()
+        # Covers the connection and logging in
+        timings.record('irc_connect', self.started, self.welcomed)
         connection.cap('REQ', ':twitch.tv/membership')
         connection.cap('REQ', ':twitch.tv/tags')
         connection.cap('REQ', ':twitch.tv/commands')
@@ -53,36 +307,25 @@ class TwitchSafetyBot(SingleServerIRCBot):
     def on_roomstate(self, connection, event):
         """After receiving the ROOMSTATE tags from Twitch IRC, toggle between
         the requested safety modes before gracefully logging out of IRC"""
-        if self.enabled:
-            # We are performing a safety action
-            room_tags = dict([(x['key'], x['value']) for x in event.tags])
-            # check if emote mode was selected
-            if self.emote_mode:
-                # Check if emote only mode is currently enabled, use eval
-                # because it's a text '0' or '1' returned
-                if eval(room_tags['emote-only']):
-                    connection.privmsg(event.target, '/emoteonlyoff')
-                else:
-                    connection.privmsg(event.target, '/emoteonly')
-            # Check which method we're locking down to
-            if self.method == 'FOLLOWER':
-                # If follower mode is enabled we should have a positive
-                # number for the value. Use eval because it's read as a text
-                # field
-                if eval(room_tags['followers-only']) > 0:
-                    connection.privmsg(event.target, '/followersoff')
-                else:
-                    connection.privmsg(event.target, f"/followers "
-                                                     f"{self.follow_time}")
-            elif self.method == 'SUBSCRIBER':
-                # Check if subscriber only mode is currently enabled, use eval
-                # because it's a text '0' or '1' returned
-                if eval(room_tags['subs-only']):
-                    connection.privmsg(event.target, '/subscribersoff')
-                else:
-                    connection.privmsg(event.target, '/subscribers')
+        timings.record('irc_join', self.welcomed)
+        room_state = RoomState(dict([(x['key'], x['value'])
+                                     for x in event.tags]))
+        with timings.Span('irc_commands'):
+            for command in self.chat_commands(room_state):
+                connection.privmsg(event.target, command)
         self.die('Chat safety measures enabled')
 
+    def chat_commands(self, room_state):
+        """Work out the chat commands to send
+
+        :param room_state: The current chat modes of the channel
+        :type room_state: RoomState
+        :return: The chat commands to send to the channel
+        :rtype: list
+        """
+        return safety_commands(room_state, self.enabled, self.emote_mode,
+                               self.method, self.follow_time, self.target)
+
 
 class TwitchLiveSafetyBot(TwitchSafetyBot):
     """A simple bot that logs into the twitch user's own channel to run a
@@ -107,6 +350,13 @@ class TwitchLiveSafetyBot(TwitchSafetyBot):
     :type advert: bool
     :param marker: If a marker should be placed
     :type marker: bool
+    :param target: True to switch the safety modes on and False to switch
+        them off, whatever their current state.  None toggles them
+    :type target: bool
+    :param host: The Twitch IRC server
+    :type host: str
+    :param port: The Twitch IRC server port
+    :type port: int
     :cvar channel: The user's chat channel
     :cvar enabled: If this safety mode is enabled
     :cvar emote_mode: If Emote Only chat is part of the requested safety
@@ -119,36 +369,169 @@ class TwitchLiveSafetyBot(TwitchSafetyBot):
     """
 
     def __init__(self, nickname, token, enabled, emote_mode, method,
-                 follow_time, advert, clear_chat):
+                 follow_time, advert, clear_chat, target=None,
+                 host=conf.TWITCH_IRC_HOST, port=conf.TWITCH_IRC_PORT):
         super().__init__(nickname, token, enabled, emote_mode, method,
-                         follow_time)
+                         follow_time, target, host, port)
         self.advert = advert
         self.clear_chat = clear_chat
 
+    def chat_commands(self, room_state):
+        """Override the parent method to run the live related features before
+        the chat modes.
+        """
+        return live_commands(room_state, self.enabled, self.advert,
+                             self.clear_chat, self.target) + \
+            super().chat_commands(room_state)
+
+
+class _NoReconnect(ReconnectStrategy):
+    """Stay disconnected, for a chat session that has been stopped"""
+
+    def run(self, bot):
+        pass
+
+
+class TwitchChatSession(SingleServerIRCBot):
+    """A long running bot that stays joined to the twitch user's own channel
+    so that chat commands can be sent as soon as they're needed, rather than
+    logging in for every button press.  The chat modes are kept up to date
+    from the ROOMSTATE tags, so the safety commands can be worked out without
+    waiting on Twitch.
+
+    If the connection drops the bot reconnects and joins the channel again,
+    waiting a little longer after each failed attempt, up to RECONNECT_MAX
+    seconds.
+
+    :param nickname: The user's twitch logon
+    :type nickname: str
+    :param token: The user's OAUTH token
+    :type token: str
+    :param host: The Twitch IRC server
+    :type host: str
+    :param port: The Twitch IRC server port
+    :type port: int
+    :cvar VERSION: IRC Bot Version
+    :cvar channel: The user's chat channel
+    :cvar room_state: The current chat modes of the channel
+    :cvar joined: Set once the channel has been joined and the ROOMSTATE
+        tags have been received
+    """
+    VERSION = conf.VERSION
+
+    def __init__(self, nickname, token, host=conf.TWITCH_IRC_HOST,
+                 port=conf.TWITCH_IRC_PORT):
+        token = f"oauth:{token}"
+        super().__init__([(host, port, token)], nickname, nickname,
+                         recon=self._backoff())
+        self.channel = nickname
+        self.room_state = RoomState()
+        self.joined = threading.Event()
+
+    @staticmethod
+    def _backoff():
+        return ExponentialBackoff(min_interval=RECONNECT_MIN,
+                                  max_interval=RECONNECT_MAX)
+
+    def on_welcome(self, connection, event):
+        """Event handler to make sure the extra twitch capabilities are
+        requested and to join the user's channel
+        """
+        # We're back, so start the backoff again from the shortest wait the
+        # next time the connection drops
+        self.recon = self._backoff()
+        connection.cap('REQ', ':twitch.tv/membership')
+        connection.cap('REQ', ':twitch.tv/tags')
+        connection.cap('REQ', ':twitch.tv/commands')
+        connection.join(self.channel)
+
     def on_roomstate(self, connection, event):
-        """Override the parent event handler to run the live related features
-        before the chat modes.
+        """Keep the chat modes up to date"""
+        self.room_state.update(dict([(x['key'], x['value'])
+                                     for x in event.tags]))
+        self.channel = event.target
+        self.joined.set()
+
+    def on_disconnect(self, connection, event):
+        """Wait for a fresh ROOMSTATE after the bot reconnects"""
+        self.joined.clear()
+        self.room_state.reset()
+
+    def start_background(self):
+        """Start the bot in a daemon thread, so that the caller can carry on
+        with its own work
+
+        :return: The thread running the bot
+        :rtype: threading.Thread
+        """
+        thread = threading.Thread(target=self.start, name='twitch-chat')
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def stop(self):
+        """Leave Twitch chat, without reconnecting"""
+        with self.reactor.mutex:
+            self.recon = _NoReconnect()
+            self.joined.clear()
+            self.connection.disconnect('Goodbye')
+
+    def send_commands(self, commands, timeout=10):
+        """Send a batch of chat commands to the channel once it has been
+        joined
+
+        :param commands: The chat commands to send
+        :type commands: list
+        :param timeout: How long to wait for the channel to be joined, in
+            seconds
+        :type timeout: float
         """
-        if self.enabled:
-            room_tags = dict([(x['key'], x['value']) for x in event.tags])
-            if all([eval(room_tags['followers-only']) < 0,
-                    not eval(room_tags['subs-only'])]):
-                if self.advert:
-                    connection.privmsg(event.target, '/commercial 60')
-                if self.clear_chat:
-                    connection.privmsg(event.target, '/clear')
-        super().on_roomstate(connection, event)
+        self.update_chat(lambda room_state: commands, timeout)
+
+    def update_chat(self, chat_commands, timeout=10):
+        """Work out the chat commands to send from the current chat modes,
+        and send them to the channel once it has been joined.  The chat modes
+        are updated straight away, so the next commands are worked out from
+        the modes these commands switch to.
+
+        :param chat_commands: A function that takes the current RoomState
+            and returns the chat commands to send
+        :type chat_commands: function
+        :param timeout: How long to wait for the channel to be joined, in
+            seconds
+        :type timeout: float
+        :return: The chat commands that were sent
+        :rtype: list
+        """
+        with timings.Span('irc_wait_joined'):
+            joined = self.joined.wait(timeout)
+        if not joined:
+            raise TimeoutError('Could not join Twitch chat')
+        # The reactor is running in another thread, hold its lock so the chat
+        # modes don't change while we work out the commands and send them
+        with self.reactor.mutex, timings.Span('irc_commands'):
+            commands = chat_commands(self.room_state)
+            for command in commands:
+                self.connection.privmsg(self.channel, command)
+                self.room_state.apply_command(command)
+        return commands
 
 
 def start_stop_safety(username, token, enabled, emote_mode, method,
-                      follow_time):
+                      follow_time, target=None, host=conf.TWITCH_IRC_HOST,
+                      port=conf.TWITCH_IRC_PORT):
     safety_bot = TwitchSafetyBot(username, token, enabled, emote_mode, method,
-                                 follow_time)
+                                 follow_time, target, host, port)
     safety_bot.start()
 
 
 def live_safety(username, token, enabled, emote_mode, method, follow_time,
-                advert, clear_chat):
+                advert, clear_chat, target=None, host=conf.TWITCH_IRC_HOST,
+                port=conf.TWITCH_IRC_PORT):
     safety_bot = TwitchLiveSafetyBot(username, token, enabled, emote_mode,
-                                     method, follow_time, advert, clear_chat)
+                                     method, follow_time, advert, clear_chat,
+                                     target, host, port)
     safety_bot.start()
+
+
+timings.record('import_twitch_controls', _import_started)
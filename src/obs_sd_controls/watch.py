@@ -0,0 +1,293 @@
+import asyncio
+import json
+import os
+import socket
+import sys
+from .daemon_client import claim_socket, runtime_dir, stop_on_signals
+from .obs_controls import ObsSession, SceneCache, DISABLED_URL, \
+    EVENTS_CONFIG, EVENTS_SCENES, EVENTS_INPUTS, EVENTS_OUTPUTS
+
+# Only the events that change the state table.  The high volume events, like
+# InputVolumeMeters, have bits of their own that are never set here, so OBS
+# never sends them
+WATCH_EVENTS = EVENTS_CONFIG | EVENTS_SCENES | EVENTS_INPUTS | EVENTS_OUTPUTS
+# How long to wait before trying to connect to OBS again, in seconds
+RECONNECT_DELAY = 2
+# How much can be waiting to be sent to a feed client before it's dropped
+# for not reading it, in bytes.  A whole state table is a few hundred bytes
+FEED_BUFFER_LIMIT = 64 * 1024
+
+
+def state_dir():
+    """Get the directory the watch mode writes its state files to
+
+    :return: The path to the directory
+    :rtype: str
+    """
+    return os.path.join(runtime_dir(), 'obs-streamdeck-ctl-state')
+
+
+def feed_path():
+    """Get the path to the Unix socket the watch mode sends state changes to
+
+    :return: The path to the socket
+    :rtype: str
+    """
+    return os.path.join(runtime_dir(), 'obs-streamdeck-ctl-watch.sock')
+
+
+def _file_text(value):
+    """The text of a state file, 1 or 0 for True or False, and empty for
+    None
+    """
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    return '' if value is None else str(value)
+
+
+class ObsStateWatcher:
+    """Keep a table of the OBS state that the Stream Deck buttons show, such
+    as whether the mic is muted or live safety is engaged, up to date from
+    OBS events rather than by asking OBS for it.
+
+    Every entry in the table is written to a file of its own in the state
+    directory, with the whole table in state.json, whenever it changes.
+    Clients connected to the feed socket are sent the whole table as a line
+    of JSON when they connect, and then a line with the entries that have
+    changed.
+
+    :param settings: The parsed config
+    :type settings: Settings
+    :param path: The directory to write the state files to
+    :type path: str
+    :cvar state: The current state table
+    :cvar muted: The mute state of the mic and desktop sources, keyed by the
+        source name
+    :cvar alert_urls: The current URL of each alert source, keyed by the
+        source name
+    :cvar scene: The name of the current program scene
+    :cvar scene_names: The scene names from the top down, for the scene
+        number
+    :cvar streaming: If OBS is streaming
+    :cvar connected: If the watcher is connected to OBS
+    :cvar feed_clients: The stream writers for the clients of the feed socket
+    """
+
+    def __init__(self, settings, path):
+        self.settings = settings
+        self.path = path
+        self.state = dict()
+        self.muted = dict()
+        self.alert_urls = dict()
+        self.scene = None
+        self.scene_names = []
+        self.streaming = None
+        self.connected = False
+        self.scene_cache = SceneCache()
+        self.feed_clients = set()
+
+    def table(self):
+        """Work out the state table from what's known about OBS
+
+        :return: The state table
+        :rtype: dict
+        """
+        obs = self.settings.obs
+        mic = self.muted.get(obs.mic_source)
+        desktop = self.muted.get(obs.desktop_source)
+        alert_urls = [self.alert_urls.get(x) for x, _ in obs.alert_urls]
+        scene_number = self.scene_names.index(self.scene) + 1 \
+            if self.scene in self.scene_names else None
+        return dict([
+            ('connected', self.connected),
+            ('mute_mic', mic),
+            ('mute_desk', desktop),
+            ('mute_all', None if None in (mic, desktop) else
+                mic and desktop),
+            ('streaming', self.streaming),
+            ('scene', self.scene),
+            ('scene_number', scene_number),
+            ('live_safety', None if None in alert_urls or not alert_urls
+                else all([x == DISABLED_URL for x in alert_urls]))])
+
+    def publish(self):
+        """Write the state files and tell the feed clients about anything in
+        the state table that has changed
+        """
+        table = self.table()
+        changed = dict([(key, value) for key, value in table.items()
+                        if key not in self.state or
+                        self.state[key] != value])
+        if not changed:
+            return
+        self.state = table
+        for key, value in changed.items():
+            self._write(key, _file_text(value))
+        self._write('state.json', json.dumps(table))
+        line = json.dumps(changed).encode() + b'\n'
+        for writer in list(self.feed_clients):
+            if writer.transport.get_write_buffer_size() > FEED_BUFFER_LIMIT:
+                # The client has stopped reading, drop it rather than let
+                # the changes pile up
+                self.feed_clients.discard(writer)
+                writer.transport.abort()
+                continue
+            writer.write(line)
+
+    def _write(self, name, text):
+        """Replace a state file, so a reader never sees half of it"""
+        file = os.path.join(self.path, name)
+        with open(f"{file}.tmp", 'w') as f:
+            f.write(text)
+        os.replace(f"{file}.tmp", file)
+
+    async def refresh(self, session):
+        """Ask OBS for the whole state, after connecting or when the scene
+        collection changes
+
+        :param session: An open session with OBS WebSockets
+        :type session: ObsSession
+        """
+        obs = self.settings.obs
+        sources = [obs.mic_source, obs.desktop_source]
+        alerts = [x for x, _ in obs.alert_urls]
+        # Sent all at once, and one missing source doesn't stop the others
+        results = await asyncio.gather(
+            session.call('GetStreamStatus'),
+            session.call('GetCurrentProgramScene'),
+            self.scene_cache.get_scene_names(session),
+            *[session.call('GetInputMute', {'inputName': x})
+              for x in sources],
+            *[session.call('GetInputSettings', {'inputName': x})
+              for x in alerts], return_exceptions=True)
+        results = [None if isinstance(x, Exception) else x for x in results]
+        stream, scene, self.scene_names = results[:3]
+        self.scene_names = self.scene_names or []
+        self.streaming = stream['outputActive'] if stream else None
+        self.scene = scene['currentProgramSceneName'] if scene else None
+        self.muted = dict([(x, result['inputMuted']) for x, result
+                           in zip(sources, results[3:5]) if result])
+        self.alert_urls = dict([(x, result['inputSettings'].get('url'))
+                                for x, result in zip(alerts, results[5:])
+                                if result])
+        self.publish()
+
+    async def on_event(self, event_type, event_data):
+        """Update the state table from an OBS event
+
+        :param event_type: The obs-websocket event type
+        :type event_type: str
+        :param event_data: The data for the event
+        :type event_data: dict
+        """
+        if event_type == 'InputMuteStateChanged':
+            self.muted[event_data['inputName']] = event_data['inputMuted']
+        elif event_type == 'InputSettingsChanged' and \
+                event_data['inputName'] in dict(self.settings.obs.alert_urls):
+            self.alert_urls[event_data['inputName']] = \
+                event_data['inputSettings'].get('url')
+        elif event_type == 'StreamStateChanged':
+            self.streaming = event_data['outputActive']
+        elif event_type == 'CurrentProgramSceneChanged':
+            self.scene = event_data['sceneName']
+        elif event_type in ('SceneListChanged', 'SceneNameChanged'):
+            self.scene_names = await self.scene_cache.get_scene_names(
+                self.scene_cache.session)
+        elif event_type == 'CurrentSceneCollectionChanged':
+            await self.refresh(self.scene_cache.session)
+            return
+        else:
+            return
+        self.publish()
+
+    async def handle_feed_client(self, reader, writer):
+        """Send a feed client the whole state table, then the changes until
+        it disconnects
+
+        :param reader: The stream reader for the client connection
+        :type reader: asyncio.StreamReader
+        :param writer: The stream writer for the client connection
+        :type writer: asyncio.StreamWriter
+        """
+        writer.write(json.dumps(self.state).encode() + b'\n')
+        self.feed_clients.add(writer)
+        try:
+            # Nothing is read from the client, this just waits for it to go
+            await reader.read()
+        except ConnectionError:
+            # Gone before the state table could be sent, such as when
+            # claim_socket checks that we're running
+            pass
+        finally:
+            self.feed_clients.discard(writer)
+            writer.close()
+
+    async def watch_obs(self):
+        """Stay connected to OBS, connecting again whenever the connection is
+        lost, and keep the state table up to date
+        """
+        while True:
+            obs = self.settings.obs
+            session = ObsSession(obs.ws_password, WATCH_EVENTS, obs.host,
+                                 obs.port)
+            self.scene_cache.attach(session)
+            session.ws.register_event_callback(self.on_event)
+            try:
+                await session.connect()
+                if session.identified:
+                    self.connected = True
+                    await self.refresh(session)
+                    await session.wait_closed()
+            except Exception:
+                # OBS isn't running, or went away part way through.  Either
+                # way, try again shortly
+                pass
+            finally:
+                await session.disconnect()
+            self.connected = False
+            self.publish()
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    async def serve(self, path):
+        """Watch OBS and serve the feed socket until stopped
+
+        :param path: The path for the feed socket
+        :type path: str
+        """
+        has_unix = hasattr(socket, 'AF_UNIX')
+        if has_unix and not claim_socket(path):
+            sys.exit(f"Already watching OBS, the feed is on {path}")
+        os.makedirs(self.path, exist_ok=True)
+        self.publish()
+        server = None
+        if has_unix:
+            server = await asyncio.start_unix_server(self.handle_feed_client,
+                                                     path)
+            os.chmod(path, 0o600)
+        stop = asyncio.Event()
+        stop_on_signals(asyncio.get_running_loop(), stop)
+        watch_task = asyncio.create_task(self.watch_obs())
+        try:
+            await stop.wait()
+        finally:
+            watch_task.cancel()
+            # Let the plugins know that the state files are out of date
+            self.connected = False
+            self.publish()
+            if server:
+                server.close()
+                for writer in list(self.feed_clients):
+                    writer.close()
+                if os.path.exists(path):
+                    os.unlink(path)
+
+
+def run_watch(settings):
+    """Watch OBS in the foreground until interrupted
+
+    :param settings: The parsed config
+    :type settings: Settings
+    """
+    path = state_dir()
+    watcher = ObsStateWatcher(settings, path)
+    asyncio.run(watcher.serve(feed_path()))
@@ -0,0 +1,50 @@
+import asyncio
+import os
+import sys
+import pytest
+
+# The fake OBS and Twitch servers live with the benchmarks
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'benchmarks'))
+
+from fake_obs import FakeObs  # noqa: E402
+from fake_twitch import FakeTwitch  # noqa: E402
+import fake_obs  # noqa: E402
+import fake_twitch  # noqa: E402
+
+OBS_PASSWORD = 'tests'
+TWITCH_TOKEN = 'abc'
+
+
+async def _shutdown(fake):
+    await fake.stop()
+    # Finish off the client handlers too, so none are left pending when the
+    # loop stops
+    tasks = [x for x in asyncio.all_tasks() if x is not asyncio.current_task()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _stop(fake, loop):
+    asyncio.run_coroutine_threadsafe(_shutdown(fake), loop).result(5)
+    loop.call_soon_threadsafe(loop.stop)
+
+
+@pytest.fixture
+def obs():
+    """A fake obs-websocket server on a free port"""
+    fake = FakeObs(password=OBS_PASSWORD)
+    loop = fake_obs.start_in_thread(fake, 0)
+    yield fake
+    _stop(fake, loop)
+
+
+@pytest.fixture
+def twitch():
+    """A fake Twitch chat server on a free port, and the event loop it runs
+    on"""
+    fake = FakeTwitch(token=TWITCH_TOKEN)
+    loop = fake_twitch.start_in_thread(fake, 0)
+    yield fake, loop
+    _stop(fake, loop)
@@ -0,0 +1,105 @@
+import asyncio
+import json
+from configparser import ConfigParser
+import pytest
+from obs_sd_controls.actions import ActionRunner, parse_macro
+from obs_sd_controls.config_file import parse_config
+from conftest import OBS_PASSWORD
+
+URL_SETTINGS = '{"inputName": "alerts", "inputSettings": ' \
+               '{"url": "http://x/?a=1&b=2"}}'
+
+
+def test_parse_macro_steps():
+    parsed = parse_macro(['scene 3', 'mute_mic --on', 'delay 0.5'])
+    assert [[text for text, arg in step] for step in parsed] == \
+        [['scene 3'], ['mute_mic --on'], ['delay 0.5']]
+    assert parsed[0][0][1]['scene_number'] == 3
+    assert parsed[1][0][1]['mute'] is True
+    assert parsed[2][0][1] == dict([('action', 'delay'), ('seconds', 0.5)])
+
+
+@pytest.mark.parametrize('step', ['mute_desk --on & live_safety --engage',
+                                  'mute_desk --on&live_safety --engage'])
+def test_parse_macro_together(step):
+    actions = parse_macro([step])[0]
+    assert [arg['action'] for text, arg in actions] == \
+        ['mute_desk', 'live_safety']
+    assert actions[0][0] == 'mute_desk --on'
+
+
+def test_parse_macro_quoted_ampersand():
+    actions = parse_macro([f"raw SetInputSettings '{URL_SETTINGS}'"])[0]
+    assert len(actions) == 1
+    arg = actions[0][1]
+    assert arg['action'] == 'raw'
+    assert json.loads(arg['data'])['inputSettings']['url'] == \
+        'http://x/?a=1&b=2'
+
+
+def test_parse_macro_quoted_ampersand_together():
+    actions = parse_macro([f"raw SetInputSettings '{URL_SETTINGS}' & "
+                           f"scene 2"])[0]
+    assert [arg['action'] for text, arg in actions] == ['raw', 'scene']
+
+
+@pytest.mark.parametrize('step', ['setup', 'macro brb', 'scene three',
+                                  'mute_mic &', 'not_an_action'])
+def test_parse_macro_invalid(step):
+    with pytest.raises(ValueError, match='Invalid macro step'):
+        parse_macro([step])
+
+
+def macro_settings(obs, steps):
+    config = ConfigParser()
+    config.read_dict(dict([
+        ('obs', dict([('host', 'localhost'), ('port', str(obs.port)),
+                      ('ws_password', OBS_PASSWORD)])),
+        ('macro:test', dict([('steps', '\n'.join(steps))]))]))
+    return parse_config(config)
+
+
+def run_macro_twice(obs, steps, change_obs):
+    """Run a macro, change OBS behind the daemon's back, and run it again
+    with the same ActionRunner, like the daemon would"""
+    runner = ActionRunner(macro_settings(obs, steps))
+
+    async def run():
+        try:
+            await runner.run_macro('test')
+            change_obs()
+            await runner.run_macro('test')
+        finally:
+            await runner.close()
+    asyncio.run(run())
+
+
+def test_macro_batch_scene_retry(obs):
+    def rename():
+        obs.scenes = ['Starting Soon', 'On Air', 'BRB', 'Ending']
+        obs.current_scene = 'Starting Soon'
+    run_macro_twice(obs, ['mute_mic --on', 'scene 2'], rename)
+    assert obs.current_scene == 'On Air'
+    assert obs.inputs['Mic/Aux']['muted']
+
+
+def test_macro_batch_later_scenes_retried(obs):
+    def rename():
+        obs.scenes = ['Intro', 'Live 2', 'Break', 'Outro']
+    run_macro_twice(obs, ['scene 2', 'mute_mic --on', 'scene 4'], rename)
+    assert obs.current_scene == 'Outro'
+
+
+def test_macro_batch_scene_gone(obs):
+    runner = ActionRunner(macro_settings(obs, ['mute_mic --on', 'scene 4']))
+
+    async def run():
+        try:
+            await runner.run_macro('test')
+            obs.scenes = obs.scenes[:2]
+            await runner.run_macro('test')
+        finally:
+            await runner.close()
+    # Still missing once the scene list has been fetched again
+    with pytest.raises(RuntimeError, match='scene 4: IndexError'):
+        asyncio.run(run())
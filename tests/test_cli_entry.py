@@ -0,0 +1,28 @@
+import pytest
+from obs_sd_controls import cli_entry, timings
+
+
+@pytest.fixture
+def no_timings(monkeypatch):
+    """Start with timings off, and run no real action or log write"""
+    monkeypatch.setattr(timings, '_phases', None)
+    monkeypatch.delenv(timings.ENV_VAR, raising=False)
+    monkeypatch.setattr(cli_entry, '_do_action', lambda arg: None)
+    monkeypatch.setattr(cli_entry, 'forward_action', lambda arg: None)
+    monkeypatch.setattr(timings, 'write', lambda action, error=None: None)
+
+
+@pytest.mark.parametrize('action', ['daemon', 'watch'])
+def test_timings_off_for_long_running(no_timings, monkeypatch, action):
+    monkeypatch.setattr('sys.argv', ['obs-streamdeck-ctl', '--timings',
+                                     action])
+    cli_entry.main()
+    assert timings._phases is None
+
+
+def test_timings_from_environment(no_timings, monkeypatch):
+    monkeypatch.setenv(timings.ENV_VAR, '1')
+    monkeypatch.setattr('sys.argv', ['obs-streamdeck-ctl', 'mute_mic'])
+    cli_entry.main()
+    assert [x[0] for x in timings._phases] == ['import', 'parse_args',
+                                               'forward']
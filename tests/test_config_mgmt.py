@@ -0,0 +1,192 @@
+import asyncio
+import threading
+import time
+import pytest
+
+tkinter = pytest.importorskip('tkinter')
+from obs_sd_controls.config_mgmt import BackgroundTask, FutureTask  # noqa
+from obs_sd_controls.obs_controls import submit  # noqa: E402
+
+
+# Tcl aborts if an interpreter is garbage collected on another thread, such as
+# the event loop's, so one is kept for every test
+_interp = None
+
+
+@pytest.fixture
+def tcl():
+    """A Tcl interpreter for after(), which doesn't need a display like a Tk
+    window does.  Errors from callbacks are kept rather than printed"""
+    global _interp
+    if _interp is None:
+        _interp = tkinter.Tcl()
+        _interp.report_callback_exception = \
+            lambda exc_type, exc, tb: _interp.errors.append(exc)
+    _interp.errors = []
+    yield _interp
+    # Drop anything still scheduled by the test
+    for after_id in _interp.tk.splitlist(_interp.tk.call('after', 'info')):
+        _interp.after_cancel(after_id)
+
+
+def pump(tcl, until, timeout=5):
+    """Handle Tcl events, as the Tk main loop would, until until() is true
+    or the timeout runs out"""
+    deadline = time.monotonic() + timeout
+    while not until() and time.monotonic() < deadline:
+        tcl.dooneevent(tkinter._tkinter.DONT_WAIT)
+        time.sleep(0.001)
+    return until()
+
+
+class Recorder:
+    """Keeps what the callbacks were given, and the thread they ran on"""
+
+    def __init__(self):
+        self.results = []
+        self.errors = []
+        self.threads = set()
+
+    def on_done(self, result):
+        self.results.append(result)
+        self.threads.add(threading.current_thread())
+
+    def on_error(self, error):
+        self.errors.append(error)
+        self.threads.add(threading.current_thread())
+
+    @property
+    def called(self):
+        return bool(self.results or self.errors)
+
+
+def test_background_task_result(tcl):
+    recorder = Recorder()
+    task = BackgroundTask(tcl, lambda x, y: x + y, 1, 2,
+                          on_done=recorder.on_done,
+                          on_error=recorder.on_error)
+    task.start()
+    assert task.running
+    assert pump(tcl, lambda: recorder.called)
+    assert recorder.results == [3] and recorder.errors == []
+    assert recorder.threads == {threading.main_thread()}
+    assert task.finished and not task.running
+
+
+def test_background_task_keeps_loop_running(tcl):
+    release = threading.Event()
+    recorder = Recorder()
+    ticks = []
+
+    def tick():
+        ticks.append(time.monotonic())
+        if not recorder.called:
+            tcl.after(10, tick)
+
+    def blocking():
+        release.wait(5)
+        return 'done'
+    task = BackgroundTask(tcl, blocking, on_done=recorder.on_done)
+    task.start()
+    tick()
+    # The loop keeps handling events while the function blocks
+    assert pump(tcl, lambda: len(ticks) >= 5)
+    assert not recorder.called
+    release.set()
+    assert pump(tcl, lambda: recorder.called)
+    assert recorder.results == ['done']
+
+
+def test_background_task_error(tcl):
+    recorder = Recorder()
+
+    def fails():
+        raise OSError('Connection refused')
+    task = BackgroundTask(tcl, fails, on_done=recorder.on_done,
+                          on_error=recorder.on_error)
+    task.start()
+    assert pump(tcl, lambda: recorder.called)
+    assert recorder.results == []
+    assert isinstance(recorder.errors[0], OSError)
+    assert recorder.threads == {threading.main_thread()}
+    assert not task.running
+
+
+def test_background_task_error_without_handler(tcl):
+    def fails():
+        raise ValueError('Not handled')
+    task = BackgroundTask(tcl, fails)
+    task.start()
+    # Raised on the main loop, where Tk reports it
+    assert pump(tcl, lambda: tcl.errors)
+    assert isinstance(tcl.errors[0], ValueError)
+
+
+def test_background_task_cancel(tcl):
+    release = threading.Event()
+    recorder = Recorder()
+    task = BackgroundTask(tcl, lambda: release.wait(5),
+                          on_done=recorder.on_done,
+                          on_error=recorder.on_error)
+    task.start()
+    task.cancel()
+    assert task.cancelled and not task.running
+    release.set()
+    # Give the worker time to finish, its result is thrown away
+    pump(tcl, lambda: False, timeout=BackgroundTask.poll_ms * 3 / 1000)
+    assert not recorder.called
+
+
+async def add(x, y, delay=0.0):
+    await asyncio.sleep(delay)
+    return x + y
+
+
+async def times_out():
+    await asyncio.wait_for(asyncio.Event().wait(), 0.01)
+
+
+async def wait_forever(cancelled):
+    try:
+        await asyncio.Event().wait()
+    except asyncio.CancelledError:
+        cancelled.set()
+        raise
+
+
+def test_future_task_result(tcl):
+    recorder = Recorder()
+    task = FutureTask(tcl, lambda: submit(add(1, 2, 0.01)),
+                      on_done=recorder.on_done, on_error=recorder.on_error)
+    task.start()
+    assert pump(tcl, lambda: recorder.called)
+    assert recorder.results == [3]
+    assert recorder.threads == {threading.main_thread()}
+
+
+def test_future_task_error(tcl):
+    recorder = Recorder()
+    task = FutureTask(tcl, lambda: submit(times_out()),
+                      on_done=recorder.on_done, on_error=recorder.on_error)
+    task.start()
+    assert pump(tcl, lambda: recorder.called)
+    assert recorder.results == []
+    assert isinstance(recorder.errors[0], asyncio.TimeoutError)
+    assert recorder.threads == {threading.main_thread()}
+
+
+def test_future_task_cancel(tcl):
+    cancelled = threading.Event()
+    recorder = Recorder()
+    task = FutureTask(tcl, lambda: submit(wait_forever(cancelled)),
+                      on_done=recorder.on_done, on_error=recorder.on_error)
+    task.start()
+    # Let the coroutine start waiting before cancelling it
+    pump(tcl, lambda: False, timeout=0.05)
+    task.cancel()
+    assert not task.running
+    # The coroutine is cancelled as well, not just the wait for it
+    assert cancelled.wait(5)
+    pump(tcl, lambda: False, timeout=BackgroundTask.poll_ms * 3 / 1000)
+    assert not recorder.called
+    assert task.future.cancelled()
@@ -0,0 +1,141 @@
+import asyncio
+import os
+import signal
+import socket
+import threading
+from argparse import Namespace
+import pytest
+from obs_sd_controls import daemon_client
+from obs_sd_controls.daemon_client import claim_socket, forward_action, \
+    stop_on_signals
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'),
+                                reason='Needs Unix sockets')
+
+
+def test_claim_socket_missing(tmp_path):
+    assert claim_socket(str(tmp_path / 'missing.sock'))
+
+
+def test_claim_socket_left_over(tmp_path):
+    path = str(tmp_path / 'left_over.sock')
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    # Closed without removing the socket, like a daemon that was killed
+    server.close()
+    assert os.path.exists(path)
+    assert claim_socket(path)
+    assert not os.path.exists(path)
+
+
+def test_claim_socket_in_use(tmp_path):
+    path = str(tmp_path / 'in_use.sock')
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen()
+    try:
+        assert not claim_socket(path)
+        assert os.path.exists(path)
+    finally:
+        server.close()
+
+
+class NoSignalsLoop:
+    """Stands in for the Windows event loops, which have no
+    add_signal_handler"""
+
+    def __init__(self, loop):
+        self.loop = loop
+
+    def add_signal_handler(self, sig, callback):
+        raise NotImplementedError
+
+    def call_soon_threadsafe(self, callback):
+        self.loop.call_soon_threadsafe(callback)
+
+
+def test_stop_on_signals():
+    async def run():
+        stop = asyncio.Event()
+        stop_on_signals(asyncio.get_running_loop(), stop)
+        os.kill(os.getpid(), signal.SIGTERM)
+        await asyncio.wait_for(stop.wait(), 5)
+    asyncio.run(run())
+
+
+def test_stop_on_signals_fallback():
+    handlers = dict([(x, signal.getsignal(x))
+                     for x in (signal.SIGINT, signal.SIGTERM)])
+
+    async def run():
+        stop = asyncio.Event()
+        stop_on_signals(NoSignalsLoop(asyncio.get_running_loop()), stop)
+        os.kill(os.getpid(), signal.SIGTERM)
+        await asyncio.wait_for(stop.wait(), 5)
+    try:
+        asyncio.run(run())
+    finally:
+        for sig, handler in handlers.items():
+            signal.signal(sig, handler)
+
+
+class FakeDaemon:
+    """Listens on the daemon's socket, reads one action and then answers it
+    with reply, or closes without answering if reply is None.  With hang it
+    neither answers nor closes until close() is called"""
+
+    def __init__(self, path, reply=None, hang=False):
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(path)
+        self.server.listen()
+        self.reply = reply
+        self.hang = hang
+        self.release = threading.Event()
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def serve(self):
+        conn, _ = self.server.accept()
+        with conn:
+            conn.makefile('rb').readline()
+            if self.hang:
+                self.release.wait(5)
+            elif self.reply is not None:
+                conn.sendall(self.reply)
+
+    def close(self):
+        self.release.set()
+        self.thread.join(5)
+        self.server.close()
+
+
+@pytest.fixture
+def daemon_path(tmp_path, monkeypatch):
+    path = str(tmp_path / 'daemon.sock')
+    monkeypatch.setattr(daemon_client, 'socket_path', lambda: path)
+    return path
+
+
+def test_forward_action_no_daemon(daemon_path):
+    assert forward_action(Namespace(action='mute_mic')) is None
+
+
+def test_forward_action_response(daemon_path):
+    daemon = FakeDaemon(daemon_path, b'{"ok": true, "result": null}\n')
+    try:
+        assert forward_action(Namespace(action='mute_mic')) == \
+            dict([('ok', True), ('result', None)])
+    finally:
+        daemon.close()
+
+
+@pytest.mark.parametrize('hang', [False, True])
+def test_forward_action_no_response(daemon_path, hang):
+    daemon = FakeDaemon(daemon_path, hang=hang)
+    try:
+        response = forward_action(Namespace(action='mute_mic'), timeout=0.2)
+    finally:
+        daemon.close()
+    # Not run here as well, the daemon may have done it
+    assert not response['ok']
+    assert 'did not respond' in response['error']
@@ -0,0 +1,140 @@
+import asyncio
+import pytest
+from obs_sd_controls.obs_controls import ObsRequestError, ObsSession, \
+    SceneCache, SourceInventory, get_source_inventory, EVENTS_CONFIG, \
+    EVENTS_SCENES
+from conftest import OBS_PASSWORD
+
+
+def run_with_cache(obs, func):
+    """Run func(cache, session) over a session subscribed to the scene
+    events, like the daemon's"""
+    async def run():
+        async with ObsSession(OBS_PASSWORD, EVENTS_SCENES | EVENTS_CONFIG,
+                              'localhost', obs.port) as session:
+            return await func(SceneCache(), session)
+    return asyncio.run(run())
+
+
+def test_scene_cache_uses_cached_list(obs):
+    async def func(cache, session):
+        await cache.set_scene_number(2, session)
+        requests = obs.request_count
+        await cache.set_scene_number(3, session)
+        return obs.request_count - requests
+    # Only the SetCurrentProgramScene request the second time
+    assert run_with_cache(obs, func) == 1
+    assert obs.current_scene == 'BRB'
+
+
+def test_scene_cache_retries_missing_scene(obs):
+    async def func(cache, session):
+        await cache.get_scene_names(session)
+        # Renamed without the cache hearing about it, so OBS answers the
+        # cached name with status 600
+        obs.scenes = ['Starting Soon', 'On Air', 'BRB', 'Ending']
+        await cache.set_scene_number(2, session)
+    run_with_cache(obs, func)
+    assert obs.current_scene == 'On Air'
+
+
+def test_scene_cache_retries_new_scene(obs):
+    async def func(cache, session):
+        await cache.get_scene_names(session)
+        # A new scene at the bottom, past the end of the cached list
+        obs.scenes = obs.scenes + ['Credits']
+        await cache.set_scene_number(5, session)
+    run_with_cache(obs, func)
+    assert obs.current_scene == 'Credits'
+
+
+def test_scene_cache_follows_events(obs):
+    async def func(cache, session):
+        await cache.get_scene_names(session)
+        obs.set_scenes(['Intro', 'Live'])
+        # Give the event time to arrive
+        for _ in range(100):
+            if cache.scenes[cache.collection] == ['Intro', 'Live']:
+                break
+            await asyncio.sleep(0.01)
+        requests = obs.request_count
+        await cache.set_scene_number(1, session)
+        return obs.request_count - requests
+    assert run_with_cache(obs, func) == 1
+    assert obs.current_scene == 'Intro'
+
+
+def test_scene_cache_missing_after_refresh(obs):
+    async def func(cache, session):
+        await cache.set_scene_number(9, session)
+    with pytest.raises(IndexError):
+        run_with_cache(obs, func)
+
+
+def test_scene_cache_other_errors_raised(obs):
+    def fail(data):
+        raise ValueError(500, 'Something else went wrong')
+    obs._req_SetCurrentProgramScene = fail
+
+    async def func(cache, session):
+        await cache.get_scene_names(session)
+        requests = obs.request_count
+        with pytest.raises(ObsRequestError) as info:
+            await cache.set_scene_number(1, session)
+        assert info.value.code == 500
+        return obs.request_count - requests
+    # Not fetched again and retried
+    assert run_with_cache(obs, func) == 1
+
+
+@pytest.mark.parametrize('halt_on_failure', [True, False])
+def test_call_batch_halt_on_failure(obs, halt_on_failure):
+    requests = [('SetInputMute', {'inputName': 'Mic/Aux', 'inputMuted': True}),
+                ('SetCurrentProgramScene', {'sceneName': 'Missing'}),
+                ('SetInputMute', {'inputName': 'Desktop Audio',
+                                  'inputMuted': True})]
+
+    async def run():
+        async with ObsSession(OBS_PASSWORD, 0, 'localhost',
+                              obs.port) as session:
+            with pytest.raises(ObsRequestError) as info:
+                await session.call_batch(requests,
+                                         halt_on_failure=halt_on_failure)
+            assert info.value.index == 1
+    asyncio.run(run())
+    assert obs.inputs['Mic/Aux']['muted']
+    # Only run when OBS was asked to carry on past the failure
+    assert obs.inputs['Desktop Audio']['muted'] is not halt_on_failure
+    assert obs.request_count == (2 if halt_on_failure else 3)
+
+
+def test_source_inventory_audio(obs):
+    # Audio from kinds that don't end in _capture, and kinds that have none
+    obs.inputs['Screen Audio'] = {'kind': 'sck_audio_capture',
+                                  'settings': {}, 'muted': False}
+    obs.inputs['Webcam'] = {'kind': 'v4l2_input', 'settings': {}}
+    obs.inputs['Intro Video'] = {'kind': 'ffmpeg_source', 'settings': {},
+                                 'muted': False}
+    obs.inputs['Logo'] = {'kind': 'image_source', 'settings': {}}
+    obs.add_browser_source('alerts', 'http://localhost/alerts')
+    inventory = get_source_inventory(OBS_PASSWORD, 'localhost', obs.port)
+    assert inventory.audio_sources == ['Mic/Aux', 'Desktop Audio',
+                                       'Screen Audio', 'Intro Video',
+                                       'alerts']
+    assert inventory.browser_sources == ['alerts']
+    assert len(inventory) == 7 and 'Logo' in inventory
+
+
+def test_source_inventory_names():
+    inputs = [dict([('inputName', name), ('inputKind', kind)])
+              for name, kind in [('a', 'image_source'), ('b', 'text'),
+                                 ('c', 'image_source'), ('d', 'color'),
+                                 ('e', 'text')]]
+    inventory = SourceInventory(inputs)
+    # In the order OBS has them, not grouped by kind
+    assert inventory.names(['text', 'image_source']) == ['a', 'b', 'c', 'e']
+    assert inventory.names(['missing']) == []
+    # Without being told which have audio, every input is listed
+    assert inventory.audio_sources == ['a', 'b', 'c', 'd', 'e']
+    assert SourceInventory(inputs, ['e', 'a', 'x']).audio_sources == \
+        ['a', 'e']
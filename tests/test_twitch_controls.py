@@ -0,0 +1,174 @@
+import asyncio
+import pytest
+from obs_sd_controls.twitch_controls import RoomState, TwitchChatSession, \
+    _follow_minutes, live_commands, safety_commands
+from conftest import TWITCH_TOKEN
+
+CHANNEL = 'tester'
+FOLLOWER = dict(enabled=True, emote_mode=True, method='FOLLOWER',
+                follow_time='10m')
+SUBSCRIBER = dict(enabled=True, emote_mode=False, method='SUBSCRIBER',
+                  follow_time='')
+JOIN_TAGS = {'emote-only': '0', 'followers-only': '-1', 'r9k': '0',
+             'room-id': '12345', 'slow': '0', 'subs-only': '0'}
+
+
+@pytest.mark.parametrize('follow_time, minutes', [
+    ('', 0), ('10', 10), ('10m', 10), ('30 minutes', 30), ('1h', 60),
+    ('2 hours', 120), ('1d', 60 * 24), ('2w', 60 * 24 * 14),
+    ('1mo', 60 * 24 * 30), ('3 months', 60 * 24 * 90), (' 5M ', 5),
+    ('ten minutes', None), ('5 years', None)])
+def test_follow_minutes(follow_time, minutes):
+    assert _follow_minutes(follow_time) == minutes
+
+
+def test_room_state_defaults():
+    room_state = RoomState()
+    assert not room_state.emote_only
+    assert not room_state.followers_mode
+    assert not room_state.locked
+
+
+def test_room_state_partial_update():
+    room_state = RoomState(JOIN_TAGS)
+    room_state.update({'room-id': '12345', 'followers-only': '10'})
+    assert room_state.followers_only == 10
+    assert room_state.locked
+    # Tags that weren't sent are left as they were
+    assert not room_state.emote_only
+    room_state.update({'subs-only': '1', 'unknown-tag': 'x'})
+    assert room_state.subs_only and room_state.followers_only == 10
+
+
+def test_room_state_pending_survives_older_tags():
+    room_state = RoomState(JOIN_TAGS)
+    # Pressed twice before Twitch confirms either change
+    room_state.apply_command('/emoteonly')
+    room_state.apply_command('/emoteonlyoff')
+    assert not room_state.emote_only
+    # Twitch confirms the first command, the second is still on its way
+    room_state.update({'emote-only': '1'})
+    assert not room_state.emote_only
+    room_state.update({'emote-only': '0'})
+    assert not room_state.emote_only
+    # Nothing is pending any more, so Twitch is believed again
+    room_state.update({'emote-only': '1'})
+    assert room_state.emote_only
+
+
+def test_room_state_someone_else_changed_mode():
+    room_state = RoomState(JOIN_TAGS)
+    room_state.apply_command('/followers 10m')
+    assert room_state.followers_only == 10
+    # A moderator switched it to another follow time first
+    room_state.update({'followers-only': '30'})
+    assert room_state.followers_only == 30
+    room_state.update({'followers-only': '10'})
+    assert room_state.followers_only == 10
+
+
+def test_room_state_unknown_follow_time():
+    room_state = RoomState(JOIN_TAGS)
+    room_state.apply_command('/followers ten minutes')
+    assert room_state.followers_mode
+    # Twitch's minutes are taken as they are
+    room_state.update({'followers-only': '10'})
+    assert room_state.followers_only == 10
+
+
+def test_room_state_reset():
+    room_state = RoomState(JOIN_TAGS)
+    room_state.apply_command('/subscribers')
+    room_state.reset()
+    room_state.update(JOIN_TAGS)
+    assert not room_state.subs_only
+
+
+@pytest.mark.parametrize('tags, target, expected', [
+    (JOIN_TAGS, None, ['/emoteonly', '/followers 10m']),
+    (JOIN_TAGS, True, ['/emoteonly', '/followers 10m']),
+    (JOIN_TAGS, False, []),
+    (dict(JOIN_TAGS, **{'emote-only': '1', 'followers-only': '10'}), None,
+     ['/emoteonlyoff', '/followersoff']),
+    (dict(JOIN_TAGS, **{'emote-only': '1'}), True, ['/followers 10m']),
+    (dict(JOIN_TAGS, **{'followers-only': '0'}), False, ['/followersoff'])])
+def test_safety_commands_follower(tags, target, expected):
+    assert safety_commands(RoomState(tags), target=target,
+                           **FOLLOWER) == expected
+
+
+def test_safety_commands_subscriber():
+    assert safety_commands(RoomState(JOIN_TAGS), **SUBSCRIBER) == \
+        ['/subscribers']
+    locked = RoomState(dict(JOIN_TAGS, **{'subs-only': '1'}))
+    assert safety_commands(locked, **SUBSCRIBER) == ['/subscribersoff']
+
+
+def test_safety_commands_disabled():
+    assert safety_commands(RoomState(JOIN_TAGS),
+                           **dict(FOLLOWER, enabled=False)) == []
+
+
+@pytest.mark.parametrize('tags, enabled, target, expected', [
+    (JOIN_TAGS, True, None, ['/commercial 60', '/clear']),
+    (JOIN_TAGS, True, True, ['/commercial 60', '/clear']),
+    (JOIN_TAGS, True, False, []),
+    (JOIN_TAGS, False, None, []),
+    (dict(JOIN_TAGS, **{'followers-only': '10'}), True, None, []),
+    (dict(JOIN_TAGS, **{'subs-only': '1'}), True, True, [])])
+def test_live_commands(tags, enabled, target, expected):
+    assert live_commands(RoomState(tags), enabled, True, True,
+                         target) == expected
+
+
+def test_live_commands_options():
+    room_state = RoomState(JOIN_TAGS)
+    assert live_commands(room_state, True, False, True) == ['/clear']
+    assert live_commands(room_state, True, True, False) == ['/commercial 60']
+
+
+def wait_for(fake, loop, predicate, timeout=10):
+    asyncio.run_coroutine_threadsafe(
+        asyncio.wait_for(fake.wait_for(predicate), timeout), loop).result()
+
+
+def test_chat_session_presses_before_twitch_confirms(twitch):
+    fake, loop = twitch
+    session = TwitchChatSession(CHANNEL, TWITCH_TOKEN, 'localhost',
+                                fake.port)
+    session.start_background()
+    try:
+        # Lock down and release again straight away, the second press has
+        # to be worked out from the first, not from what Twitch has sent
+        sent = session.update_chat(lambda x: safety_commands(x, **FOLLOWER))
+        assert sent == ['/emoteonly', '/followers 10m']
+        sent = session.update_chat(lambda x: safety_commands(x, **FOLLOWER))
+        assert sent == ['/emoteonlyoff', '/followersoff']
+        wait_for(fake, loop, lambda: len(fake.commands) == 4)
+        tags = fake.room_tags[f"#{CHANNEL}"]
+        assert tags['emote-only'] == '0'
+        assert tags['followers-only'] == '-1'
+        assert not session.room_state.locked
+    finally:
+        session.stop()
+
+
+def test_chat_session_live_commands(twitch):
+    fake, loop = twitch
+    session = TwitchChatSession(CHANNEL, TWITCH_TOKEN, 'localhost',
+                                fake.port)
+    session.start_background()
+    try:
+        sent = session.update_chat(
+            lambda x: live_commands(x, True, True, True) +
+            safety_commands(x, **SUBSCRIBER))
+        assert sent == ['/commercial 60', '/clear', '/subscribers']
+        # Locked down now, so no advert or clear the next time
+        sent = session.update_chat(
+            lambda x: live_commands(x, True, True, True, True) +
+            safety_commands(x, target=True, **SUBSCRIBER))
+        assert sent == []
+        wait_for(fake, loop, lambda: len(fake.commands) == 3)
+        assert fake.room_tags[f"#{CHANNEL}"]['subs-only'] == '1'
+    finally:
+        session.stop()
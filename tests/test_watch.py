@@ -0,0 +1,69 @@
+import asyncio
+import json
+import socket
+from configparser import ConfigParser
+import pytest
+from obs_sd_controls.config_file import parse_config
+from obs_sd_controls.watch import ObsStateWatcher, FEED_BUFFER_LIMIT
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'),
+                                reason='Needs Unix sockets')
+
+
+def test_slow_feed_client_dropped(tmp_path):
+    watcher = ObsStateWatcher(parse_config(ConfigParser()), str(tmp_path))
+    # Only the feed is being tested, not the state files
+    watcher._write = lambda name, text: None
+    path = str(tmp_path / 'feed.sock')
+
+    async def run():
+        server = await asyncio.start_unix_server(watcher.handle_feed_client,
+                                                 path)
+        async with server:
+            slow_reader, slow_writer = await asyncio.open_unix_connection(
+                path)
+            reader, writer = await asyncio.open_unix_connection(path)
+            # Both get the state table straight away
+            await reader.readline()
+            await slow_reader.readline()
+            received = []
+
+            async def read_feed():
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    received.append(json.loads(line))
+            read_task = asyncio.create_task(read_feed())
+            # The slow client stops reading, so everything sent to it piles
+            # up, first in the socket and then in the transport
+            sent = 0
+            while len(watcher.feed_clients) == 2 and \
+                    sent < FEED_BUFFER_LIMIT * 100:
+                for _ in range(100):
+                    watcher.muted['Mic/Aux'] = \
+                        not watcher.muted.get('Mic/Aux')
+                    watcher.publish()
+                    sent += 20
+                await asyncio.sleep(0)
+            assert len(watcher.feed_clients) == 1
+            # Dropped, so it gets to the end of what was sent and no more
+            while await slow_reader.read(65536):
+                pass
+            # The client that reads keeps getting the changes
+            await asyncio.sleep(0.1)
+            count = len(received)
+            watcher.muted['Mic/Aux'] = not watcher.muted['Mic/Aux']
+            watcher.publish()
+            await asyncio.wait_for(_wait_for(lambda: len(received) > count),
+                                   5)
+            assert received[-1] == {'mute_mic': watcher.muted['Mic/Aux']}
+            slow_writer.close()
+            writer.close()
+            read_task.cancel()
+    asyncio.run(run())
+
+
+async def _wait_for(predicate):
+    while not predicate():
+        await asyncio.sleep(0.01)
@@ -0,0 +1,222 @@
+"""Build obs-streamdeck-ctl and everything it needs into a single zipapp.
+
+The archive holds the package from src/ and the installed copies of its
+requirements, with the bytecode compiled in advance.  Python can't cache
+bytecode for modules imported from a zip file, so without it every module
+would be compiled again on every button press.  The sources go in next to the
+bytecode, so tracebacks show them as usual.
+
+The bytecode only works with the same minor version of Python that built the
+archive, e.g. 3.11.  Any other version ignores it and compiles the sources on
+every run instead, which is slower but still works.  So the shebang line
+points at the Python running this script unless told otherwise.
+
+Requirements that none of the package's modules import, such as the command
+line tools that come with jaraco.text, are left out to keep the archive
+small, as Python reads the whole list of files in it at startup.  Compiled
+extensions can't be imported from a zip file either, so msgpack and
+websockets use their pure Python versions instead.
+
+Install the package and its requirements first, with ``pip install -e .``,
+then run from the repository root::
+
+    python tools/build_zipapp.py [-o obs-streamdeck-ctl.pyz] [--all]
+
+As everything is in the archive, Python can be told not to load site-packages
+or look at the environment::
+
+    python -I -S obs-streamdeck-ctl.pyz mute_mic
+"""
+import argparse
+import compileall
+import importlib.metadata
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import zipapp
+try:
+    from packaging.requirements import Requirement
+except ImportError:
+    sys.exit('The packaging library is needed to build the zipapp: '
+             'pip install packaging')
+
+DIST_NAME = 'obs_streamdeck_controls'
+PACKAGE = 'obs_sd_controls'
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'src')
+# Compiled extensions, which zipimport can't load
+EXTENSION_SUFFIXES = ('.so', '.pyd', '.dll', '.dylib')
+MAIN = """from obs_sd_controls.cli_entry import main
+main()
+"""
+# Run in the build folder, to find the top level packages that importing
+# every module of the package loads from it
+TRACE = """import json, pkgutil, importlib, sys
+build_dir = sys.argv[1]
+sys.path.insert(0, build_dir)
+import {package}
+for module in pkgutil.iter_modules({package}.__path__):
+    importlib.import_module('{package}.' + module.name)
+print(json.dumps(sorted(set(
+    name.split('.')[0] for name, module in list(sys.modules.items())
+    if (getattr(module, '__file__', None) or '').startswith(build_dir)))))
+""".format(package=PACKAGE)
+
+
+def requirements(dist_name):
+    """Find every distribution the package needs, following the
+    requirements of each one and leaving out extras and anything for other
+    versions of Python
+
+    :param dist_name: The distribution to start from
+    :type dist_name: str
+    :return: The distributions, not including dist_name itself
+    :rtype: list
+    """
+    own_name = importlib.metadata.distribution(dist_name).metadata['Name']
+    found = dict()
+    todo = [dist_name]
+    while todo:
+        dist = importlib.metadata.distribution(todo.pop())
+        key = dist.metadata['Name'].lower().replace('_', '-')
+        if key in found:
+            continue
+        found[key] = dist
+        for requirement in dist.requires or []:
+            requirement = Requirement(requirement)
+            if requirement.marker and \
+                    not requirement.marker.evaluate({'extra': ''}):
+                continue
+            todo.append(requirement.name)
+    return [x for x in found.values() if x.metadata['Name'] != own_name]
+
+
+def dist_files(dist):
+    """The files of an installed distribution that can go in the archive,
+    leaving out bytecode and console scripts
+
+    :return: The files, and the compiled extensions that were left out
+    :rtype: tuple
+    """
+    files = []
+    skipped = []
+    for file in dist.files or []:
+        name = str(file)
+        if name.startswith('..') or '__pycache__' in file.parts:
+            continue
+        if name.endswith(EXTENSION_SUFFIXES):
+            skipped.append(name)
+        else:
+            files.append(file)
+    return files, skipped
+
+
+def top_level(files):
+    """The top level modules and packages in a distribution's files
+
+    :rtype: set
+    """
+    names = set()
+    for file in files:
+        if file.parts[0].endswith('.dist-info'):
+            continue
+        if len(file.parts) > 1:
+            names.add(file.parts[0])
+        elif file.suffix == '.py':
+            names.add(file.stem)
+    return names
+
+
+def imported(build_dir):
+    """The top level modules that the package imports from the build folder
+
+    :rtype: set
+    """
+    result = subprocess.run([sys.executable, '-I', '-S', '-B', '-c', TRACE,
+                             build_dir], capture_output=True, text=True)
+    if result.returncode:
+        sys.exit(f"Could not import the package from the build folder:\n"
+                 f"{result.stderr}")
+    return set(json.loads(result.stdout))
+
+
+def copy_files(dist, files, target):
+    """Copy a distribution's files into the build folder, keeping their
+    paths relative to site-packages
+
+    :param dist: The installed distribution
+    :type dist: importlib.metadata.Distribution
+    :param files: The files to copy, from dist_files
+    :type files: list
+    :param target: The build folder
+    :type target: str
+    """
+    for file in files:
+        source = file.locate()
+        if not os.path.isfile(source):
+            continue
+        dest = os.path.join(target, *file.parts)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        shutil.copy2(source, dest)
+
+
+def build(output, interpreter, everything=False):
+    with tempfile.TemporaryDirectory() as tmp:
+        shutil.copytree(os.path.join(SRC_DIR, PACKAGE),
+                        os.path.join(tmp, PACKAGE),
+                        ignore=shutil.ignore_patterns('__pycache__'))
+        dists = []
+        for dist in requirements(DIST_NAME):
+            files, skipped = dist_files(dist)
+            for name in skipped:
+                print(f"Left out {name}, the pure Python version will be "
+                      f"used", file=sys.stderr)
+            copy_files(dist, files, tmp)
+            dists.append((dist, files))
+        if not everything:
+            used = imported(tmp)
+            for dist, files in dists:
+                if top_level(files) & used:
+                    continue
+                print(f"Left out {dist.metadata['Name']}, nothing imports "
+                      f"it", file=sys.stderr)
+                for file in files:
+                    path = os.path.join(tmp, *file.parts)
+                    if os.path.isfile(path):
+                        os.remove(path)
+        # zipimport only loads .pyc files sitting next to where the source
+        # would be, not from __pycache__.  Tracebacks name the file inside
+        # the archive rather than the build folder
+        if not compileall.compile_dir(tmp, quiet=1, legacy=True,
+                                      ddir=os.path.basename(output)):
+            sys.exit('Could not compile the bytecode')
+        for root, dirs, files in os.walk(tmp, topdown=False):
+            # zipapp keeps empty folders, like those of the left out
+            # requirements
+            if not os.listdir(root):
+                os.rmdir(root)
+        with open(os.path.join(tmp, '__main__.py'), 'w') as f:
+            f.write(MAIN)
+        zipapp.create_archive(tmp, output, interpreter=interpreter)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-o', '--output', default='obs-streamdeck-ctl.pyz')
+    parser.add_argument('--python', default=sys.executable,
+                        help='The interpreter for the shebang line, the '
+                             'Python running this script by default')
+    parser.add_argument('--all', action='store_true',
+                        help='Include every requirement, even the ones '
+                             'nothing imports')
+    args = parser.parse_args()
+    build(args.output, args.python, args.all)
+    print(f"Built {args.output}, "
+          f"{os.path.getsize(args.output) // 1024}KB", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()